@@ -0,0 +1,384 @@
+"""
+Benchmark harness for indexing and search.
+
+Runs on CPU against a CLIP-shaped stub model, so it needs no network or
+model download. Results are written as JSON and can be compared against a
+previous run to catch regressions.
+
+Usage (from the repository root):
+    python -m backend.benchmarks.run_benchmarks --vector-scales 1k,100k,1M --image-scales 1k
+    python -m backend.benchmarks.run_benchmarks --output new.json --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+from unittest.mock import patch
+
+import faiss
+import httpx
+import numpy as np
+import torch
+from PIL import Image
+
+# Allow running as a script as well as with -m
+project_root = str(Path(__file__).parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from backend.benchmarks.stub_model import EMBED_DIM, StubCLIPModel, StubCLIPProcessor
+from backend.src.data.data_loader import ImageDataset
+from backend.src.models.index_factory import (
+    build_faiss_index, search_index, recall_at_k, index_memory_bytes, assign_shards, build_sharded_index
+)
+from backend.src.models.retrieval_model import MultiModalRetrieval
+
+logger = logging.getLogger("benchmarks")
+
+SCALE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+QUERY_WORDS = ["red", "car", "dog", "beach", "sunset", "city", "night", "mountain", "child", "bicycle",
+               "forest", "river", "snow", "market", "portrait", "bridge", "cat", "boat", "flower", "train"]
+
+
+def parse_scale(text: str) -> int:
+    """Parse corpus sizes such as '1k', '100k' or '1M'."""
+    text = text.strip().lower()
+    if text and text[-1] in SCALE_SUFFIXES:
+        return int(float(text[:-1]) * SCALE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_summary(latencies: List[float], wall_seconds: float) -> Dict[str, float]:
+    """Percentiles (ms) of per-request latencies and throughput over the wall time."""
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+        "qps": len(latencies) / wall_seconds if wall_seconds > 0 else 0.0,
+    }
+
+
+def generate_vector_corpus(count: int, dim: int = EMBED_DIM, seed: int = 0, chunk_size: int = 100_000) -> np.ndarray:
+    """L2-normalized random float32 vectors, generated in chunks to bound temporary memory."""
+    rng = np.random.default_rng(seed)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, chunk_size):
+        chunk = rng.standard_normal((min(chunk_size, count - start), dim), dtype=np.float32)
+        faiss.normalize_L2(chunk)
+        vectors[start:start + len(chunk)] = chunk
+    return vectors
+
+
+def generate_image_corpus(directory: Path, count: int, size: int = 64, seed: int = 0) -> Path:
+    """Write count random JPEGs into directory (skipped if it already holds that many)."""
+    directory.mkdir(parents=True, exist_ok=True)
+    existing = len(list(directory.glob("*.jpg")))
+    rng = np.random.default_rng(seed)
+    for i in range(existing, count):
+        pixels = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(directory / f"synthetic_{i:07d}.jpg", quality=85)
+    return directory
+
+
+def make_queries(count: int, seed: int = 0) -> List[str]:
+    """Distinct text queries, so the query-embedding cache does not hide encoder cost."""
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(QUERY_WORDS, 3)) + f" {i}" for i in range(count)]
+
+
+def create_stub_model(index_type: str, inference_engine: str = "eager") -> MultiModalRetrieval:
+    """MultiModalRetrieval wired to the stub model instead of downloaded CLIP weights."""
+    with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=StubCLIPModel()), \
+         patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+        return MultiModalRetrieval(
+            "benchmark-stub-clip", "cpu", index_type=index_type, inference_engine=inference_engine
+        )
+
+
+def timed_calls(fn, args_list: List[Tuple]) -> Tuple[List[float], float]:
+    """Call fn once per argument tuple, returning per-call latencies and the total wall time."""
+    latencies = []
+    wall_start = time.perf_counter()
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - wall_start
+
+
+def bench_vector_index(
+        count: int,
+        dim: int,
+        index_type: str,
+        num_queries: int,
+        k: int,
+        encoding: str = "fp32",
+        rerank_factor: int = 0,
+        num_shards: int = 1
+) -> Dict:
+    """Build and search an index over random vectors, isolating FAISS from the model."""
+    vectors = generate_vector_corpus(count, dim)
+    queries = generate_vector_corpus(num_queries, dim, seed=1)
+    ids = np.arange(count, dtype=np.int64)
+
+    start = time.perf_counter()
+    if num_shards > 1:
+        shards = assign_shards([str(idx) for idx in ids.tolist()], num_shards)
+        index = build_sharded_index(index_type, vectors, ids, shards, num_shards, encoding)
+    else:
+        index = build_faiss_index(index_type, vectors, ids, encoding=encoding)
+    build_seconds = time.perf_counter() - start
+
+    latencies, wall = timed_calls(lambda row: search_index(index, queries[row:row + 1], k),
+                                  [(row,) for row in range(num_queries)])
+    start = time.perf_counter()
+    search_index(index, queries, k)
+    batched_seconds = time.perf_counter() - start
+    recall = recall_at_k(index, vectors, ids, queries, k, rerank_factor=rerank_factor)
+
+    return {
+        "benchmark": "vector_index",
+        "scale": count,
+        "index_type": index_type,
+        "vector_encoding": encoding,
+        "rerank_factor": rerank_factor,
+        "shards": num_shards,
+        "dim": dim,
+        "index_mb": index_memory_bytes(index) / 1e6,
+        "recall_at_k": recall["recall_at_k"],
+        "reranked_search_latency_ms": recall["index_latency_ms"],
+        "build_seconds": build_seconds,
+        "build_vectors_per_sec": count / build_seconds,
+        "search": latency_summary(latencies, wall),
+        "batched_search_qps": num_queries / batched_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def bench_http(model: MultiModalRetrieval, queries: List[str], concurrency: int, k: int) -> Dict:
+    """Drive /search concurrently through the ASGI app in-process, with rate limiting lifted."""
+    import backend.src.api.main as main
+    from backend.src.api.response_cache import ResponseCache
+    from backend.src.api.scheduler import QueryScheduler
+
+    scheduler = QueryScheduler(main.batched_text_search)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with patch.object(main, "retrieval_model", model), \
+         patch.object(main, "rate_limiter", main.RateLimiter(requests_per_minute=10 ** 9)), \
+         patch.object(main, "response_cache", ResponseCache()), \
+         patch.object(main, "query_scheduler", scheduler):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            async def one(query_text: str) -> None:
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/search", json={"query": query_text, "top_k": k})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+            wall_start = time.perf_counter()
+            await asyncio.gather(*[one(query_text) for query_text in queries])
+            wall = time.perf_counter() - wall_start
+        await scheduler.shutdown()
+
+    summary = latency_summary(latencies, wall)
+    summary["concurrency"] = concurrency
+    summary["mean_batch_size"] = scheduler.queries_run / max(1, scheduler.batches_run)
+    return summary
+
+
+def bench_image_pipeline(
+        count: int,
+        work_dir: Path,
+        index_type: str,
+        batch_size: int,
+        num_workers: int,
+        num_queries: int,
+        k: int,
+        concurrency: int,
+        inference_engine: str = "eager"
+) -> Dict:
+    """Index a synthetic image corpus with the stub model, then search it directly and over HTTP."""
+    data_dir = generate_image_corpus(work_dir / f"images_{count}", count)
+    model = create_stub_model(index_type, inference_engine)
+
+    start = time.perf_counter()
+    dataset = ImageDataset(str(data_dir))
+    discovery_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.build_index(dataset, batch_size=batch_size, num_workers=num_workers)
+    build_seconds = time.perf_counter() - start
+
+    queries = make_queries(num_queries)
+    cold, cold_wall = timed_calls(model.search, [(query_text, k) for query_text in queries])
+    warm, warm_wall = timed_calls(model.search, [(query_text, k) for query_text in queries])
+    http = asyncio.run(bench_http(model, make_queries(num_queries, seed=1), concurrency, k))
+
+    return {
+        "benchmark": "image_pipeline",
+        "scale": count,
+        "index_type": index_type,
+        "inference_engine": model.engine.name,
+        "batch_size": batch_size,
+        "num_workers": num_workers,
+        "discovery_seconds": discovery_seconds,
+        "build_seconds": build_seconds,
+        "build_images_per_sec": model.num_images / build_seconds,
+        "search_uncached": latency_summary(cold, cold_wall),
+        "search_cached": latency_summary(warm, warm_wall),
+        "http": http,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "faiss": faiss.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def _flatten(result: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare_results(current: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    List metrics that got worse than the baseline by more than tolerance (a fraction).
+
+    Latencies (_ms, _seconds) and memory (_mb) regress upwards; rates
+    (_per_sec, qps) regress downwards.
+    """
+    def key(result: Dict) -> Tuple:
+        return (
+            result["benchmark"],
+            result["scale"],
+            result["index_type"],
+            result.get("vector_encoding", "fp32"),
+            result.get("inference_engine", "eager"),
+            result.get("shards", 1)
+        )
+
+    baseline_by_key = {key(result): _flatten(result) for result in baseline}
+    regressions = []
+    for result in current:
+        before = baseline_by_key.get(key(result))
+        if before is None:
+            continue
+        for metric, value in _flatten(result).items():
+            old = before.get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            lower_is_better = metric.endswith(("_ms", "_seconds", "_mb"))
+            higher_is_better = metric.endswith(("_per_sec", "qps"))
+            if (lower_is_better and change > tolerance) or (higher_is_better and -change > tolerance):
+                regressions.append(f"{key(result)} {metric}: {old:.4g} -> {value:.4g} ({change:+.1%})")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-scales", default="1k,100k,1M", help="Random-vector corpus sizes, '' to skip")
+    parser.add_argument("--image-scales", default="1k", help="Synthetic image corpus sizes, '' to skip")
+    parser.add_argument("--index-types", default="flat", help="Comma-separated index types to benchmark")
+    parser.add_argument("--encodings", default="fp32",
+                        help="Comma-separated vector encodings for the vector benchmark (fp32, fp16, sq8, pq)")
+    parser.add_argument("--rerank-factor", type=int, default=0,
+                        help="Re-score this many candidates per result exactly when vectors are compressed")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Shards the vector benchmark splits each index into, searched in parallel")
+    parser.add_argument("--engines", default="eager",
+                        help="Comma-separated inference engines for the image pipeline (eager, int8, torchscript, ...)")
+    parser.add_argument("--dim", type=int, default=EMBED_DIM)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent HTTP clients")
+    parser.add_argument("--work-dir", type=Path, default=Path(tempfile.gettempdir()) / "retrieval_benchmarks",
+                        help="Where synthetic images are generated (reused across runs)")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--compare", type=Path, help="Baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("backend").setLevel(logging.WARNING)
+    for name in ("backend.src.models.retrieval_model", "backend.src.models.index_factory",
+                 "backend.src.data.data_loader", "backend.src.api.main", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    index_types = [index_type.strip() for index_type in args.index_types.split(",") if index_type.strip()]
+    results = []
+    encodings = [encoding.strip() for encoding in args.encodings.split(",") if encoding.strip()]
+    for scale in [parse_scale(s) for s in args.vector_scales.split(",") if s.strip()]:
+        for index_type in index_types:
+            for encoding in encodings:
+                rerank_factor = args.rerank_factor if encoding != "fp32" else 0
+                logger.info(f"Vector benchmark: {scale} vectors, {index_type}, {encoding}")
+                results.append(bench_vector_index(
+                    scale, args.dim, index_type, args.queries, args.top_k, encoding, rerank_factor, args.shards
+                ))
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    for scale in [parse_scale(s) for s in args.image_scales.split(",") if s.strip()]:
+        for index_type in index_types:
+            for engine in engines:
+                logger.info(f"Image pipeline benchmark: {scale} images, {index_type}, {engine} engine")
+                results.append(bench_image_pipeline(
+                    scale, args.work_dir, index_type, args.batch_size, args.num_workers,
+                    args.queries, args.top_k, args.concurrency, engine
+                ))
+
+    report = {"environment": environment(), "results": results}
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_results(results, baseline, args.tolerance)
+        for regression in regressions:
+            logger.warning(f"Regression: {regression}")
+        if regressions:
+            return 1
+        logger.info("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import torch
+
+# Matches openai/clip-vit-base-patch32 so index sizes and search costs are realistic
+EMBED_DIM = 512
+PATCH_SIZE = 32
+MAX_TOKENS = 77
+
+
+class StubCLIPModel(torch.nn.Module):
+    """
+    CLIP-shaped model with random weights, for benchmarking without downloads.
+
+    Images go through a ViT-style patch embedding and a projection, text
+    through a token embedding with masked mean pooling, so both paths do a
+    small but shape-realistic amount of work.
+    """
+
+    def __init__(self, embed_dim: int = EMBED_DIM):
+        super().__init__()
+        torch.manual_seed(0)
+        self.patch_embedding = torch.nn.Conv2d(3, 64, kernel_size=PATCH_SIZE, stride=PATCH_SIZE)
+        self.visual_projection = torch.nn.Linear(64, embed_dim)
+        self.token_embedding = torch.nn.Embedding(256, 64)
+        self.text_projection = torch.nn.Linear(64, embed_dim)
+        self.eval()
+
+    def get_image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        patches = self.patch_embedding(pixel_values).flatten(2).mean(dim=2)
+        return self.visual_projection(patches)
+
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask: torch.Tensor = None) -> torch.Tensor:
+        mask = torch.ones_like(input_ids) if attention_mask is None else attention_mask
+        embedded = self.token_embedding(input_ids) * mask.unsqueeze(-1)
+        pooled = embedded.sum(dim=1) / mask.sum(dim=1, keepdim=True).clamp(min=1)
+        return self.text_projection(pooled)
+
+
+class StubCLIPProcessor:
+    """Byte-level tokenizer standing in for CLIPProcessor's text path."""
+
+    def __call__(self, text=None, images=None, return_tensors="pt", padding=True, **kwargs):
+        texts = [text] if isinstance(text, str) else list(text)
+        encoded = [list(t.encode("utf-8"))[:MAX_TOKENS] or [0] for t in texts]
+        width = max(len(ids) for ids in encoded)
+        input_ids = torch.tensor([ids + [0] * (width - len(ids)) for ids in encoded])
+        return {"input_ids": input_ids, "attention_mask": (input_ids > 0).long()}
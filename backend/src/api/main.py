@@ -1,28 +1,56 @@
+import asyncio
+import base64
+import binascii
+import hmac
 import json
 
-from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, Form, Header, HTTPException, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional
+from datetime import datetime
+from email.utils import formatdate
 import uvicorn
 import os
 import logging
 import time
 
-from backend.src.models.retrieval_model import MultiModalRetrieval
-from backend.src.data.data_loader import ImageDataset
+from backend.src.data.attribute_store import SearchFilter
+from backend.src.data.thumbnails import ThumbnailStore
+from backend.src.api.scheduler import QueryScheduler
+from backend.src.api.response_cache import ResponseCache
+from backend.src.api.pagination import Cursor, candidate_window, decode_cursor, encode_cursor, query_fingerprint
+from backend.src.api.rate_limit import RateLimiter, create_rate_limiter
+from backend.src.models.embedding_cache import normalize_query
+from backend.src.utils import metrics
 from backend.src.config import (
     MODEL_NAME,
     DEVICE,
     TOP_K,
+    MAX_RESULT_DEPTH,
     API_HOST,
     API_PORT,
     CORS_ORIGINS,
-    DATA_DIR
+    DATA_DIR,
+    INDEX_DIR,
+    INDEX_POLL_INTERVAL,
+    ADMIN_TOKEN,
+    MAX_UPLOAD_BYTES,
+    MAX_BATCH_QUERIES,
+    MAX_QUERY_COMPONENTS,
+    VALIDATION_CACHE_PATH,
+    THUMBNAIL_SIZES,
+    THUMBNAIL_MAX_AGE,
+    RATE_LIMIT_TRUST_FORWARDED,
+    SERVING_MODE,
+    WORKER_INDEX_WAIT,
+    resolve_device
 )
 
 # Configure logging
@@ -86,6 +114,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache", "X-Next-Cursor"],
 )
 
 # Add trusted host middleware
@@ -97,35 +126,98 @@ app.add_middleware(
 # Initialize the retrieval model
 retrieval_model = None
 dataset = None
+index_poller_task = None
+warmup_task = None
 
+# Startup stage reported by /ready: starting, loading_model, waiting_for_index,
+# loading_index, building_index, ready or failed
+server_started = time.time()
+startup_state = {"stage": "starting", "since": server_started, "error": None}
 
-# Rate limiting
-class RateLimiter:
-    def __init__(self, requests_per_minute: int = 60):
-        self.requests_per_minute = requests_per_minute
-        self.requests = []
 
-    def is_allowed(self) -> bool:
-        now = time.time()
-        minute_ago = now - 60
+# Per-client rate limiting
+rate_limiter = create_rate_limiter()
 
-        # Remove requests older than 1 minute
-        self.requests = [req for req in self.requests if req > minute_ago]
 
-        if len(self.requests) >= self.requests_per_minute:
-            return False
+def batched_text_search(
+        query_texts: List[str],
+        k: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        size: Optional[int],
+        search_filter: Optional[SearchFilter],
+        collapse_duplicates: bool
+):
+    """Search entry point for the query scheduler; runs on an inference worker thread."""
+    return retrieval_model.search_texts(
+        query_texts, k, nprobe=nprobe, ef_search=ef_search, size=size, search_filter=search_filter,
+        collapse_duplicates=collapse_duplicates
+    )
 
-        self.requests.append(now)
-        return True
+
+# Coalesces concurrent /search queries into batched searches off the event loop
+query_scheduler = QueryScheduler(batched_text_search)
+
+# Serialized responses of repeated searches; keys include the index version
+response_cache = ResponseCache()
+
+# Resized renditions linked from search results instead of full-resolution originals
+thumbnail_store = ThumbnailStore(DATA_DIR)
+
+
+class SearchFilters(BaseModel):
+    """Conditions results must meet; all given conditions apply, list fields match any value."""
+    directories: Optional[List[str]] = Field(default=None, min_length=1, max_length=50)  # Folders under /images/
+    formats: Optional[List[str]] = Field(default=None, min_length=1, max_length=10)  # e.g. ["jpeg", "png"]
+    min_width: Optional[int] = Field(default=None, ge=0)
+    max_width: Optional[int] = Field(default=None, ge=0)
+    min_height: Optional[int] = Field(default=None, ge=0)
+    max_height: Optional[int] = Field(default=None, ge=0)
+    modified_after: Optional[datetime] = None  # ISO 8601 or Unix timestamp
+    modified_before: Optional[datetime] = None
+
+    def to_filter(self) -> SearchFilter:
+        """Convert to the hashable filter the model and caches take."""
+        return SearchFilter(
+            directories=tuple(self.directories) if self.directories is not None else None,
+            formats=tuple(self.formats) if self.formats is not None else None,
+            min_width=self.min_width,
+            max_width=self.max_width,
+            min_height=self.min_height,
+            max_height=self.max_height,
+            modified_after=self.modified_after.timestamp() if self.modified_after is not None else None,
+            modified_before=self.modified_before.timestamp() if self.modified_before is not None else None
+        )
 
 
-rate_limiter = RateLimiter()
+def to_search_filter(filters: Optional[SearchFilters]) -> Optional[SearchFilter]:
+    """Convert optional request filters, treating None as unfiltered."""
+    return filters.to_filter() if filters is not None else None
 
 
 class SearchQuery(BaseModel):
     """Model for search query requests."""
     query: str = Field(..., min_length=1, max_length=500)
     top_k: int = Field(default=TOP_K, ge=1, le=20)
+    nprobe: Optional[int] = Field(default=None, ge=1, le=4096)  # IVF lists to probe
+    ef_search: Optional[int] = Field(default=None, ge=1, le=4096)  # HNSW candidate list size
+    size: Optional[int] = None  # Thumbnail size the result URLs link to; None links originals
+    filters: Optional[SearchFilters] = None  # Only return images matching these conditions
+    collapse_duplicates: bool = False  # Only the best match of each near-duplicate group
+    cursor: Optional[str] = Field(default=None, max_length=200)  # X-Next-Cursor of the previous page
+
+
+def check_thumbnail_size(size: Optional[int]) -> None:
+    """Raise ValueError unless size is None or a configured thumbnail size."""
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise ValueError(f"size must be one of {THUMBNAIL_SIZES}")
+
+
+class WebSocketSearch(SearchQuery):
+    """Search request sent over /ws; replies carry its id."""
+    id: str = Field(..., min_length=1, max_length=100)
+    page_size: int = Field(default=5, ge=1, le=20)  # Hits in the first streamed page
+    supersede: bool = True  # Cancel this connection's searches still in flight
 
 
 class SearchResult(BaseModel):
@@ -134,17 +226,141 @@ class SearchResult(BaseModel):
     score: float = Field(..., ge=0, le=1)
 
 
+class BatchSearchQuery(BaseModel):
+    """Model for batch search requests; each query is validated individually."""
+    queries: List[str]
+    top_k: int = Field(default=TOP_K, ge=1, le=20)
+    nprobe: Optional[int] = Field(default=None, ge=1, le=4096)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=4096)
+
+
+class QueryComponent(BaseModel):
+    """One weighted part of a hybrid query: a text, an indexed image or an uploaded image."""
+    text: Optional[str] = Field(default=None, min_length=1, max_length=500)
+    image_id: Optional[str] = Field(default=None, min_length=1, max_length=1000)  # Path relative to /images/
+    image: Optional[str] = None  # Base64-encoded image file
+    weight: float = Field(default=1.0, ge=-10, le=10)  # Negative weights steer results away
+
+
+class HybridSearchQuery(BaseModel):
+    """Model for hybrid search requests combining several weighted components."""
+    components: List[QueryComponent] = Field(..., min_length=1)
+    top_k: int = Field(default=TOP_K, ge=1, le=20)
+    nprobe: Optional[int] = Field(default=None, ge=1, le=4096)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=4096)
+    size: Optional[int] = None
+    filters: Optional[SearchFilters] = None
+    collapse_duplicates: bool = False
+
+
+class BatchSearchResult(BaseModel):
+    """Results or error for one query of a batch."""
+    query: str
+    results: List[SearchResult] = []
+    error: Optional[str] = None
+
+
+async def poll_index_changes(interval: float):
+    """Periodically sync the index with the data directory, or in worker mode reload a newer artifact."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if retrieval_model.read_only:
+                await run_in_threadpool(retrieval_model.reload_if_changed, INDEX_DIR)
+            else:
+                await run_in_threadpool(retrieval_model.sync_index, INDEX_DIR)
+        except Exception as e:
+            logger.error(f"Background index sync failed: {str(e)}")
+
+
+def set_startup_stage(stage: str, error: Optional[str] = None) -> None:
+    """Record the startup stage /ready reports."""
+    startup_state.update(stage=stage, since=time.time(), error=error)
+    logger.info(f"Startup stage: {stage}")
+
+
+def create_retrieval_model():
+    """
+    Import the model stack and load CLIP.
+
+    torch, transformers and faiss are imported here rather than at module
+    level, so the server binds its port before paying for them.
+    """
+    from backend.src.models.retrieval_model import MultiModalRetrieval
+    return MultiModalRetrieval(MODEL_NAME, resolve_device())
+
+
+def create_dataset(data_dir):
+    """Dataset of every image under data_dir, with no image limit."""
+    from backend.src.data.data_loader import ImageDataset, ValidationCache
+    return ImageDataset(
+        str(data_dir),
+        max_images=None,  # Allow loading all available images
+        validation_cache=ValidationCache(VALIDATION_CACHE_PATH)
+    )
+
+
+async def wait_for_index_artifact(data_dir, timeout: float, interval: float = 2.0) -> None:
+    """
+    Map the builder's artifact read-only, waiting for it to appear.
+
+    Raises:
+        RuntimeError: If no compatible artifact appears within timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    while not await run_in_threadpool(retrieval_model.load_index, INDEX_DIR, data_dir, True):
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"No compatible index artifact in {INDEX_DIR}; run the index builder first")
+        logger.info(f"Waiting for the index builder to write {INDEX_DIR}")
+        await asyncio.sleep(interval)
+
+
+async def warm_up(static_dir) -> None:
+    """
+    Load the model and the index in the background, after the server accepts connections.
+
+    Endpoints answer 503 until the index is searchable; /ready reports the
+    stage reached meanwhile, and a failure leaves /health failing so the
+    orchestrator restarts the process.
+    """
+    global retrieval_model, dataset, index_poller_task
+
+    try:
+        set_startup_stage("loading_model")
+        retrieval_model = await run_in_threadpool(create_retrieval_model)
+
+        if SERVING_MODE == "worker":
+            # Share the builder's artifact through the page cache instead of embedding the corpus again
+            set_startup_stage("waiting_for_index")
+            await wait_for_index_artifact(static_dir, WORKER_INDEX_WAIT)
+        else:
+            # Reuse the persisted index when it is compatible; otherwise rebuild and persist it
+            set_startup_stage("loading_index")
+            if not await run_in_threadpool(retrieval_model.load_index, INDEX_DIR, static_dir):
+                set_startup_stage("building_index")
+                dataset = await run_in_threadpool(create_dataset, static_dir)
+                await run_in_threadpool(retrieval_model.build_index, dataset, index_dir=INDEX_DIR)
+
+        if INDEX_POLL_INTERVAL > 0:
+            index_poller_task = asyncio.create_task(poll_index_changes(INDEX_POLL_INTERVAL))
+            logger.info(f"Watching {static_dir} for changes every {INDEX_POLL_INTERVAL}s")
+
+        set_startup_stage("ready")
+        logger.info(f"Server ready after {time.time() - server_started:.1f}s")
+
+    except Exception as e:
+        logger.error(f"Startup failed: {str(e)}")
+        set_startup_stage("failed", str(e))
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the model and dataset on startup."""
-    global retrieval_model, dataset
+    """Mount the image directory and start loading the model and index in the background."""
+    global warmup_task
 
     try:
         logger.info("Starting up the server...")
 
-        # Initialize the model
-        retrieval_model = MultiModalRetrieval(MODEL_NAME, DEVICE)
-
         # Mount static files directory for serving images
         static_dir = DATA_DIR
         if not static_dir.exists():
@@ -154,24 +370,30 @@ async def startup_event():
         static_files = StaticFiles(directory=str(static_dir), check_dir=True, html=True)
         app.mount("/images", static_files, name="images")
 
-        # Load the dataset with no image limit
-        dataset = ImageDataset(str(static_dir), max_images=None)  # Allow loading all available images
-
-        # Build the index
-        retrieval_model.build_index(dataset)
-
-        logger.info("Server startup complete")
+        # Bind the port now; loading CLIP and the index can take minutes
+        warmup_task = asyncio.create_task(warm_up(static_dir))
+        logger.info("Server accepting connections; loading model and index in the background")
 
     except Exception as e:
         logger.error(f"Startup failed: {str(e)}")
         raise
 
 
+def client_address(request: Request) -> str:
+    """Identify the caller for rate limiting."""
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     """Middleware to add processing time header and handle rate limiting."""
     # Check rate limit
-    if not rate_limiter.is_allowed():
+    if not rate_limiter.is_allowed(client_address(request), request.url.path):
+        metrics.RATE_LIMITED_REQUESTS.inc()
         return JSONResponse(
             status_code=429,
             content={"detail": "Too many requests. Please try again later."}
@@ -186,24 +408,80 @@ async def add_process_time_header(request: Request, call_next):
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    if not retrieval_model or not dataset:
+    """
+    Liveness check: healthy as soon as the server accepts connections, unless startup failed.
+
+    Use /ready to find out whether searches can be served yet.
+    """
+    if startup_state["stage"] == "failed":
         raise HTTPException(
             status_code=503,
-            detail="Service is starting up or unavailable"
+            detail=f"Startup failed: {startup_state['error']}"
         )
     return {
         "status": "healthy",
+        "stage": startup_state["stage"],
         "model": MODEL_NAME,
-        "device": DEVICE,
-        "dataset_size": len(dataset) if dataset else 0
+        "device": retrieval_model.device if retrieval_model else DEVICE,
+        "dataset_size": retrieval_model.num_images if retrieval_model else 0
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness check: 200 once the index is searchable, 503 with startup progress until then.
+
+    While the index is being built, progress counts the images embedded so far.
+    """
+    ready = retrieval_model is not None and retrieval_model.index is not None
+    content = {
+        "status": "ready" if ready else "starting",
+        "stage": startup_state["stage"],
+        "stage_seconds": round(time.time() - startup_state["since"], 1),
+        "uptime_seconds": round(time.time() - server_started, 1)
     }
+    if startup_state["error"]:
+        content["error"] = startup_state["error"]
+    if startup_state["stage"] == "building_index" and retrieval_model is not None:
+        embedded, total = retrieval_model.embed_progress
+        content["progress"] = {"embedded": embedded, "total": total}
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose stage timings, cache, index and queue metrics in the Prometheus text format."""
+    metrics.QUERY_QUEUE_DEPTH.set(query_scheduler.queue_depth)
+    response_stats = response_cache.stats()
+    metrics.CACHE_HIT_RATIO.set(response_stats["hit_ratio"], ("response",))
+    metrics.CACHE_BYTES.set(response_stats["bytes"], ("response",))
+
+    if retrieval_model is not None:
+        query_stats = retrieval_model.query_cache.stats()
+        metrics.CACHE_HIT_RATIO.set(query_stats["hit_ratio"], ("query_embedding",))
+        metrics.CACHE_BYTES.set(query_stats["bytes"], ("query_embedding",))
+        metrics.INDEX_VERSION.set(retrieval_model.index_version)
+        if retrieval_model.index is not None:
+            metrics.INDEX_VECTORS.set(retrieval_model.num_images)
+            for component, size in retrieval_model.memory_footprint().items():
+                metrics.INDEX_MEMORY_BYTES.set(size, (component,))
+
+    return Response(content=metrics.render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/search", response_model=List[SearchResult])
 async def search_images(query: SearchQuery):
     """
     Search for images matching the query text.
+
+    When more results may follow, the response carries an X-Next-Cursor
+    header; repeating the same query with that value as `cursor` returns the
+    next top_k results, up to MAX_RESULT_DEPTH in total. Later pages reuse
+    the cached query embedding and a shared candidate list, so paging never
+    runs the text encoder again and only searches the index when it goes
+    deeper than the candidates fetched so far. Cursors expire (410) when the
+    index changes.
     
     Args:
         query (SearchQuery): Search query parameters
@@ -212,27 +490,450 @@ async def search_images(query: SearchQuery):
         List[SearchResult]: List of search results
     """
     try:
-        if not retrieval_model:
+        if not retrieval_model or retrieval_model.index is None:
             raise HTTPException(
                 status_code=503,
                 detail="Model not initialized"
             )
 
-        logger.info(f" Processing search query: {query.query}")
-        results = retrieval_model.search(query.query, query.top_k)
+        check_thumbnail_size(query.size)
+
+        index_version = retrieval_model.index_version
+        search_filter = to_search_filter(query.filters)
+        query_key = (
+            normalize_query(query.query), query.nprobe, query.ef_search, query.size, search_filter,
+            query.collapse_duplicates
+        )
+        fingerprint = query_fingerprint(query_key)
+        offset = 0
+        if query.cursor is not None:
+            cursor = decode_cursor(query.cursor)
+            if cursor.query != fingerprint:
+                raise ValueError("Cursor belongs to a different query")
+            if cursor.index_version != index_version:
+                raise HTTPException(
+                    status_code=410,
+                    detail="Cursor expired because the index changed; search again"
+                )
+            offset = cursor.offset
+
+        # Ranked candidates are cached per depth, so repeated searches and the pages
+        # of one query are answered from the cached JSON body, skipping the model entirely
+        window = candidate_window(offset, query.top_k)
+        cache_key = query_key + (window,)
+        body = response_cache.get(index_version, cache_key)
+        cache_status = "HIT"
+        if body is None:
+            cache_status = "MISS"
+            logger.info(f" Processing search query: {query.query}")
+            results = await query_scheduler.submit(
+                query.query,
+                window,
+                nprobe=query.nprobe,
+                ef_search=query.ef_search,
+                size=query.size,
+                search_filter=search_filter,
+                collapse_duplicates=query.collapse_duplicates
+            )
+
+            body = json.dumps(jsonable_encoder([
+                SearchResult(url=url, score=score)
+                for url, score in results
+            ])).encode("utf-8")
+            response_cache.put(index_version, cache_key, body)
+
+        end = offset + query.top_k
+        candidates = json.loads(body)
+        if offset:
+            body = json.dumps(candidates[offset:end]).encode("utf-8")
+
+        # A full candidate list may continue past the window fetched so far
+        headers = {"X-Cache": cache_status}
+        if (len(candidates) > end or len(candidates) == window) and end < MAX_RESULT_DEPTH:
+            headers["X-Next-Cursor"] = encode_cursor(Cursor(fingerprint, index_version, end))
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Search failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
+@app.post("/search/batch", response_model=List[BatchSearchResult])
+async def search_images_batch(batch: BatchSearchQuery):
+    """
+    Search for many text queries in one request.
+
+    All valid queries are encoded in one forward pass and searched with one
+    FAISS call. Results are returned in input order, and an invalid query
+    gets an error instead of failing the whole batch.
+
+    Args:
+        batch (BatchSearchQuery): Queries and shared search parameters
+
+    Returns:
+        List[BatchSearchResult]: Results or error per query
+    """
+    if not 1 <= len(batch.queries) <= MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide between 1 and {MAX_BATCH_QUERIES} queries"
+        )
+    if not retrieval_model or retrieval_model.index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not initialized"
+        )
+
+    try:
+        logger.info(f"Processing batch of {len(batch.queries)} search queries")
+        outcomes = await query_scheduler.run_in_executor(
+            retrieval_model.search_batch, batch.queries, batch.top_k, batch.nprobe, batch.ef_search
+        )
+
+        return [
+            BatchSearchResult(
+                query=query_text,
+                results=[SearchResult(url=url, score=score) for url, score in results or []],
+                error=error
+            )
+            for query_text, (results, error) in zip(batch.queries, outcomes)
+        ]
+
+    except Exception as e:
+        logger.error(f"Batch search failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
+async def read_upload(upload: UploadFile, max_bytes: int) -> bytes:
+    """Read an uploaded file in chunks, rejecting it as soon as it exceeds max_bytes."""
+    chunks = []
+    size = 0
+    while True:
+        chunk = await upload.read(64 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image exceeds {max_bytes} bytes"
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@app.post("/search/image", response_model=List[SearchResult])
+async def search_by_image(
+        file: Optional[UploadFile] = File(default=None),
+        image_id: Optional[str] = Form(default=None),
+        top_k: int = Form(default=TOP_K, ge=1, le=20)
+):
+    """
+    Search for images similar to an example image.
+
+    Either upload an image as `file`, or pass `image_id`: the path of an indexed
+    image relative to /images/ in its result URL. Indexed images reuse their
+    stored embedding, so the search costs one FAISS query and no model pass.
+
+    Returns:
+        List[SearchResult]: List of search results
+    """
+    if (file is None) == (image_id is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Provide exactly one of 'file' or 'image_id'"
+        )
+    if not retrieval_model or retrieval_model.index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not initialized"
+        )
+
+    try:
+        if image_id is not None:
+            results = await run_in_threadpool(retrieval_model.search_by_image_id, image_id, top_k)
+        else:
+            data = await read_upload(file, MAX_UPLOAD_BYTES)
+            from backend.src.data.data_loader import decode_image  # Loaded with the model at startup
+
+            # Decode and resize in a worker thread, then embed on the inference pool
+            pixel_values = await run_in_threadpool(decode_image, data)
+            results = await query_scheduler.run_in_executor(retrieval_model.search_by_image, pixel_values, top_k)
 
         return [
             SearchResult(url=url, score=score)
             for url, score in results
         ]
 
+    except HTTPException:
+        raise
+    except KeyError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e.args[0]) if e.args else "Image not indexed"
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=str(e)
         )
     except Exception as e:
-        logger.error(f"Search failed: {str(e)}")
+        logger.error(f"Image search failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
+def decode_component_image(encoded: str):
+    """
+    Decode and preprocess a base64-encoded image of a hybrid query.
+
+    Raises:
+        HTTPException: 413 if the image exceeds MAX_UPLOAD_BYTES
+        ValueError: If the data is not base64 or not a readable image
+    """
+    from backend.src.data.data_loader import decode_image  # Loaded with the model at startup
+
+    if len(encoded) * 3 // 4 > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image exceeds {MAX_UPLOAD_BYTES} bytes"
+        )
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image: {str(e)}") from e
+    return decode_image(data)
+
+
+@app.post("/search/hybrid", response_model=List[SearchResult])
+async def search_hybrid(query: HybridSearchQuery):
+    """
+    Search for a weighted combination of texts and images, e.g. "like this photo but at night".
+
+    Each component holds exactly one of `text`, `image_id` (the path of an
+    indexed image relative to /images/ in its result URL) or `image` (a
+    base64-encoded upload), plus a weight; negative weights steer results
+    away ("beaches, not people"). The components are combined into one query
+    vector, so the whole query costs a single index probe.
+
+    Returns:
+        List[SearchResult]: List of search results
+    """
+    if len(query.components) > MAX_QUERY_COMPONENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide at most {MAX_QUERY_COMPONENTS} components"
+        )
+    if any(
+            sum(value is not None for value in (component.text, component.image_id, component.image)) != 1
+            for component in query.components
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="Each component needs exactly one of 'text', 'image_id' or 'image'"
+        )
+    if not retrieval_model or retrieval_model.index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not initialized"
+        )
+
+    try:
+        check_thumbnail_size(query.size)
+        components = query.components
+        texts = [(component.text, component.weight) for component in components if component.text is not None]
+        image_ids = [
+            (component.image_id, component.weight) for component in components if component.image_id is not None
+        ]
+        uploads = [component for component in components if component.image is not None]
+
+        # Queries without uploads are cacheable like plain text searches
+        index_version = retrieval_model.index_version
+        search_filter = to_search_filter(query.filters)
+        cache_key = None
+        if not uploads:
+            cache_key = (
+                "hybrid",
+                tuple((normalize_query(text), weight) for text, weight in texts),
+                tuple(image_ids),
+                query.top_k, query.nprobe, query.ef_search, query.size, search_filter, query.collapse_duplicates
+            )
+            body = response_cache.get(index_version, cache_key)
+            if body is not None:
+                return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT"})
+
+        images = []
+        for component in uploads:
+            pixel_values = await run_in_threadpool(decode_component_image, component.image)
+            images.append((pixel_values, component.weight))
+
+        logger.info(f"Processing hybrid query of {len(query.components)} components")
+        results = await query_scheduler.run_in_executor(
+            retrieval_model.search_hybrid,
+            texts, image_ids, images, query.top_k, query.nprobe, query.ef_search, query.size, search_filter,
+            query.collapse_duplicates
+        )
+
+        body = json.dumps(jsonable_encoder([
+            SearchResult(url=url, score=score)
+            for url, score in results
+        ])).encode("utf-8")
+        if cache_key is not None:
+            response_cache.put(index_version, cache_key, body)
+        return Response(content=body, media_type="application/json", headers={"X-Cache": "MISS"})
+
+    except HTTPException:
+        raise
+    except KeyError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e.args[0]) if e.args else "Image not indexed"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Hybrid search failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
+@app.get("/thumbnails/{size}/{image_path:path}")
+async def get_thumbnail(size: int, image_path: str, if_none_match: Optional[str] = Header(default=None)):
+    """
+    Serve a resized rendition of an indexed image, generating it on first request.
+
+    Args:
+        size (int): Longest edge in pixels, one of THUMBNAIL_SIZES
+        image_path (str): Image path relative to the image directory, as in /images URLs
+        if_none_match (Optional[str]): ETag held by the client
+
+    Returns:
+        FileResponse: The rendition with long-lived caching headers, or 304 if the client copy is current
+    """
+    if size not in thumbnail_store.sizes:
+        raise HTTPException(status_code=404, detail="Thumbnail size not available")
+
+    try:
+        rendition, source_stat = await run_in_threadpool(thumbnail_store.get, image_path, size)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Validators describe the source image, so they change exactly when the rendition would
+    headers = {
+        "ETag": f'"{size}-{source_stat.st_mtime_ns:x}-{source_stat.st_size:x}-{thumbnail_store.image_format}"',
+        "Last-Modified": formatdate(source_stat.st_mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={THUMBNAIL_MAX_AGE}",
+    }
+    if if_none_match is not None and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(rendition, media_type=thumbnail_store.media_type, headers=headers)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks."""
+    if warmup_task is not None:
+        warmup_task.cancel()
+    if index_poller_task is not None:
+        index_poller_task.cancel()
+    await query_scheduler.shutdown()
+
+
+def check_admin_access(x_admin_token: Optional[str]):
+    """
+    Reject admin requests without a valid token and requests made before the index is ready.
+
+    Admin endpoints start corpus-wide work, so they stay disabled until ADMIN_TOKEN is set.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them"
+        )
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(
+            status_code=403,
+            detail="Invalid admin token"
+        )
+    if not retrieval_model or retrieval_model.index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not initialized"
+        )
+
+
+@app.post("/admin/reindex")
+async def reindex(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Apply added, modified and deleted images in the data directory to the index.
+
+    Only the change set is embedded, so the cost scales with the number of
+    changed files rather than the corpus size.
+
+    Returns:
+        dict: Counts of added, modified, deleted and failed images, and the new index size
+    """
+    check_admin_access(x_admin_token)
+
+    try:
+        return await run_in_threadpool(retrieval_model.sync_index, INDEX_DIR)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Reindex failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
+@app.get("/admin/index/recall")
+async def index_recall(
+        k: int = Query(default=10, ge=1, le=100),
+        num_queries: int = Query(default=100, ge=1, le=10000),
+        nprobe: Optional[int] = Query(default=None, ge=1, le=4096),
+        ef_search: Optional[int] = Query(default=None, ge=1, le=4096),
+        x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Report recall@k and latency of the configured index against exact flat search.
+
+    Returns:
+        dict: Recall@k, index type, search knobs and per-query latency of both searches
+    """
+    check_admin_access(x_admin_token)
+
+    try:
+        return await run_in_threadpool(
+            retrieval_model.evaluate_recall, k, num_queries, nprobe, ef_search
+        )
+    except Exception as e:
+        logger.error(f"Recall evaluation failed: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail="Internal server error"
@@ -279,22 +980,125 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+class SearchSession:
+    """
+    Searches running for one WebSocket connection.
+
+    Each search streams its first page as soon as it is ready and the rest of
+    its top_k hits after. Starting a search cancels the ones still in flight,
+    so as-you-type clients never leave stale queries queued on the model.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message))
+
+    async def start(self, request: WebSocketSearch) -> None:
+        """Run a search in the background, cancelling superseded searches first."""
+        if request.supersede:
+            for request_id in list(self.tasks):
+                await self.cancel(request_id)
+        else:
+            await self.cancel(request.id)
+
+        task = asyncio.create_task(self._run(request))
+        self.tasks[request.id] = task
+        task.add_done_callback(lambda done, request_id=request.id: self._forget(request_id, done))
+
+    def _forget(self, request_id: str, task: asyncio.Task) -> None:
+        if self.tasks.get(request_id) is task:
+            del self.tasks[request_id]
+
+    async def cancel(self, request_id: str) -> bool:
+        """Cancel a running search and tell the client; returns False if it already finished."""
+        task = self.tasks.pop(request_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        await self.send({"type": "cancelled", "id": request_id})
+        return True
+
+    async def _run(self, request: WebSocketSearch) -> None:
+        try:
+            sent = 0
+            for k in sorted({min(request.page_size, request.top_k), request.top_k}):
+                # The query embedding is cached after the first page, so later pages only cost a FAISS search
+                results = await query_scheduler.submit(
+                    request.query, k, nprobe=request.nprobe, ef_search=request.ef_search, size=request.size,
+                    search_filter=to_search_filter(request.filters), collapse_duplicates=request.collapse_duplicates
+                )
+                await self.send({
+                    "type": "results",
+                    "id": request.id,
+                    "offset": sent,
+                    "results": jsonable_encoder([SearchResult(url=url, score=score) for url, score in results[sent:]]),
+                    "done": k == request.top_k
+                })
+                sent = max(sent, len(results))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket search {request.id} failed: {str(e)}")
+            await self.send({"type": "error", "id": request.id, "detail": "Search failed"})
+
+    async def close(self) -> None:
+        """Cancel every running search without notifying the (closed) client."""
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+
+
+async def handle_websocket_message(session: SearchSession, data: str) -> None:
+    """Dispatch one client message: {"type": "search", "id", "query", ...} or {"type": "cancel", "id"}."""
+    try:
+        message = json.loads(data)
+        if not isinstance(message, dict):
+            raise ValueError("Message must be a JSON object")
+    except ValueError:
+        await session.send({"type": "error", "id": None, "detail": "Invalid JSON message"})
+        return
+
+    message_type = message.pop("type", None)
+    request_id = message.get("id")
+    if message_type == "search":
+        try:
+            request = WebSocketSearch(**message)
+            check_thumbnail_size(request.size)
+        except ValueError as e:
+            await session.send({"type": "error", "id": request_id, "detail": str(e)})
+            return
+        if not retrieval_model or retrieval_model.index is None:
+            await session.send({"type": "error", "id": request_id, "detail": "Model not initialized"})
+            return
+        await session.start(request)
+    elif message_type == "cancel":
+        await session.cancel(str(request_id))
+    else:
+        await session.send({"type": "error", "id": request_id, "detail": f"Unknown message type: {message_type}"})
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     client_id = str(time.time())  # Simple way to generate unique client ID
+    session = SearchSession(websocket)
     try:
         await manager.connect(websocket, client_id)
         while True:
             try:
                 data = await websocket.receive_text()
-                # Process the received data
-                response_data = {"status": "received", "message": data}
-                await manager.send_message(json.dumps(response_data), client_id)
+                await handle_websocket_message(session, data)
             except WebSocketDisconnect:
+                await session.close()
                 manager.disconnect(client_id)
                 break
     except Exception as e:
         logger.error(f"WebSocket error for client {client_id}: {str(e)}")
+        await session.close()
         manager.disconnect(client_id)
 
 
@@ -0,0 +1,69 @@
+import base64
+import binascii
+import hashlib
+import json
+from typing import Hashable, NamedTuple
+
+from ..config import MAX_RESULT_DEPTH
+
+
+class Cursor(NamedTuple):
+    """Position in the results of one query, decoded from an opaque token."""
+    query: str  # Fingerprint of the query and its options
+    index_version: int  # Index the earlier pages were ranked against
+    offset: int  # Results already returned
+
+
+def query_fingerprint(key: Hashable) -> str:
+    """Short stable digest of a query's cache key, binding cursors to the query that issued them."""
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """Serialize a cursor into an opaque URL-safe token."""
+    payload = json.dumps([cursor.query, cursor.index_version, cursor.offset], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    """
+    Parse a token produced by encode_cursor.
+
+    Raises:
+        ValueError: If the token is malformed or points past MAX_RESULT_DEPTH
+    """
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        query, index_version, offset = json.loads(payload)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(query, str) or not isinstance(index_version, int) or not isinstance(offset, int):
+        raise ValueError("Invalid cursor")
+    if not 0 < offset < MAX_RESULT_DEPTH:
+        raise ValueError("Invalid cursor")
+    return Cursor(query, index_version, offset)
+
+
+def candidate_window(offset: int, page_size: int, max_depth: int = MAX_RESULT_DEPTH) -> int:
+    """
+    Number of ranked candidates to fetch for the page starting at offset.
+
+    The first page fetches exactly its own results. Later pages round the
+    depth up to a power of two, so consecutive pages share one cached
+    candidate list and the search depth only doubles every few pages.
+
+    Args:
+        offset (int): Results already returned
+        page_size (int): Results in this page
+        max_depth (int): Deepest result reachable by paging
+
+    Returns:
+        int: Candidates to fetch, at most max_depth
+    """
+    end = offset + page_size
+    if offset == 0:
+        return min(end, max_depth)
+    window = 1
+    while window < end:
+        window *= 2
+    return min(window, max_depth)
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence
+
+from ..config import (
+    RATE_LIMIT_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_CLIENTS,
+    RATE_LIMIT_EXEMPT_PATHS,
+    RATE_LIMIT_BACKEND,
+    REDIS_URL
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in this process, one per client, bounded in number.
+
+    Buckets live in an OrderedDict in least-recently-used order, so touching
+    a bucket and evicting the stalest one are both O(1). A bucket idle long
+    enough to have refilled completely carries no state worth keeping, and is
+    dropped first.
+    """
+
+    def __init__(self, max_clients: int = RATE_LIMIT_MAX_CLIENTS, clock: Callable[[], float] = time.monotonic):
+        self.max_clients = max(1, max_clients)
+        self.clock = clock
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, capacity: float, refill_per_second: float) -> bool:
+        """Refill the bucket for the elapsed time and take one token if available."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+                bucket[1] = now
+
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+
+            self._evict_idle(capacity / refill_per_second if refill_per_second > 0 else float("inf"), now)
+            return allowed
+
+    def _evict_idle(self, full_after: float, now: float) -> None:
+        # Oldest first: stop at the first bucket still refilling, unless over the size bound
+        while self._buckets:
+            key, (_, last_seen) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_clients and now - last_seen < full_after:
+                break
+            del self._buckets[key]
+
+
+class RedisBucketStore:
+    """Token buckets in Redis, so every worker process enforces one shared limit per client."""
+
+    # Refill and take atomically on the server; idle buckets expire once they would be full
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return allowed
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from e
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: str, capacity: float, refill_per_second: float) -> bool:
+        try:
+            return bool(self._take(keys=[f"ratelimit:{key}"], args=[capacity, refill_per_second, time.time()]))
+        except Exception as e:
+            # Fail open: an unreachable limiter store must not take the API down
+            logger.warning(f"Rate limit store unavailable: {str(e)}")
+            return True
+
+
+class RateLimiter:
+    """
+    Per-client token-bucket rate limiter.
+
+    Each client may burst up to `burst` requests, then is held to
+    requests_per_minute. Every check is O(1) regardless of traffic, and
+    requests to exempt path prefixes are never counted.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: int = RATE_LIMIT_PER_MINUTE,
+            burst: Optional[int] = RATE_LIMIT_BURST,
+            exempt_paths: Sequence[str] = RATE_LIMIT_EXEMPT_PATHS,
+            store=None
+    ):
+        """
+        Args:
+            requests_per_minute (int): Sustained rate allowed per client
+            burst (Optional[int]): Bucket capacity; defaults to requests_per_minute
+            exempt_paths (Sequence[str]): Path prefixes that bypass the limiter, e.g. '/health'
+            store: Bucket store with take(key, capacity, refill_per_second); in-process by default
+        """
+        self.requests_per_minute = requests_per_minute
+        self.capacity = float(burst or requests_per_minute)
+        self.refill_per_second = requests_per_minute / 60
+        self.exempt_paths = tuple(path for path in exempt_paths if path)
+        self.store = store if store is not None else MemoryBucketStore()
+
+    def is_exempt(self, path: str) -> bool:
+        return any(path == prefix or path.startswith(prefix.rstrip("/") + "/") for prefix in self.exempt_paths)
+
+    def is_allowed(self, client_id: str = "global", path: str = "") -> bool:
+        """Take one request from the client's bucket; False means the client is over its limit."""
+        if path and self.is_exempt(path):
+            return True
+        return self.store.take(client_id, self.capacity, self.refill_per_second)
+
+
+def create_rate_limiter(backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    """
+    Create the rate limiter selected by configuration.
+
+    Args:
+        backend (str): 'memory' (per process) or 'redis' (shared across workers)
+
+    Raises:
+        ValueError: If backend is unknown
+    """
+    if backend == "memory":
+        store = MemoryBucketStore()
+    elif backend == "redis":
+        store = RedisBucketStore(REDIS_URL)
+    else:
+        raise ValueError(f"Unknown rate limit backend '{backend}', expected memory or redis")
+    return RateLimiter(store=store)
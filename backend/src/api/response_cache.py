@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from ..config import RESPONSE_CACHE_MAX_BYTES
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized search responses, bounded by bytes.
+
+    Keys carry the index version, so a changed index never serves stale
+    results; entries of older versions are dropped as soon as a newer version
+    is seen, freeing their memory immediately.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _is_current(self, index_version: int) -> bool:
+        """Drop every entry once a newer index version is seen; report whether index_version is the newest."""
+        if self._version is None or index_version > self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = index_version
+        return index_version == self._version
+
+    def get(self, index_version: int, key: Hashable) -> Optional[bytes]:
+        """Return the cached response body for key at this index version, or None."""
+        with self._lock:
+            body = self._entries.get(key) if self._is_current(index_version) else None
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, index_version: int, key: Hashable, body: bytes) -> None:
+        """Cache a response body produced at this index version."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            # Results computed against an index that has since changed are not cached
+            if not self._is_current(index_version):
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and memory use of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
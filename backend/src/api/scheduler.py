@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS, INFERENCE_WORKERS
+from ..data.attribute_store import SearchFilter
+
+logger = logging.getLogger(__name__)
+
+# Queries asking for at most this many results always share a batch; above it,
+# a batch only mixes k values within a factor of two of each other
+K_BUCKET_FLOOR = 16
+
+# search_fn(query_texts, k, nprobe, ef_search, size, search_filter, collapse_duplicates) -> one result list per query
+BatchSearchFn = Callable[
+    [List[str], int, Optional[int], Optional[int], Optional[int], Optional[SearchFilter], bool], List[list]
+]
+
+
+@dataclass
+class _PendingQuery:
+    """A text query waiting to be batched."""
+    query_text: str
+    k: int
+    nprobe: Optional[int]
+    ef_search: Optional[int]
+    size: Optional[int]
+    search_filter: Optional[SearchFilter]
+    collapse_duplicates: bool
+    future: asyncio.Future
+
+
+def k_bucket(k: int) -> int:
+    """Power-of-two bucket of a result count; a batch searches with the largest k of its bucket."""
+    return (max(k, K_BUCKET_FLOOR) - 1).bit_length()
+
+
+class QueryScheduler:
+    """
+    Coalesces concurrent text queries into batched searches run off the event loop.
+
+    The first query of a batch waits at most max_wait_ms for others to join, up
+    to max_batch_size queries. Queries sharing search knobs and thumbnail size
+    are then encoded in one forward pass and answered by one FAISS search on a
+    worker thread, and each awaiting request receives its own slice of the
+    results. Queries with different filters or duplicate collapsing are batched
+    separately, as are queries whose k falls in different power-of-two
+    buckets, so a deep query does not make a batch of shallow ones search and
+    rank hundreds of extra candidates.
+    """
+
+    def __init__(
+            self,
+            search_fn: BatchSearchFn,
+            max_batch_size: int = QUERY_BATCH_SIZE,
+            max_wait_ms: float = QUERY_BATCH_WAIT_MS,
+            max_workers: int = INFERENCE_WORKERS
+    ):
+        self.search_fn = search_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._inflight = set()
+        self.batches_run = 0
+        self.queries_run = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of queries waiting to be batched."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self) -> None:
+        """Start the batching task on the running event loop, restarting it if the loop changed."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._worker = loop.create_task(self._run())
+
+    async def submit(
+            self,
+            query_text: str,
+            k: int,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None,
+            size: Optional[int] = None,
+            search_filter: Optional[SearchFilter] = None,
+            collapse_duplicates: bool = False
+    ) -> list:
+        """
+        Queue a text query and wait for its results.
+
+        Returns:
+            list: The search_fn result for this query
+
+        Raises:
+            Exception: Whatever search_fn raised for the batch containing this query
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put(_PendingQuery(
+            query_text, k, nprobe, ef_search, size, search_filter, collapse_duplicates, future
+        ))
+        return await future
+
+    async def run_in_executor(self, fn: Callable, *args):
+        """Run a blocking call on the inference thread pool."""
+        self._ensure_started()
+        return await self._loop.run_in_executor(self._executor, fn, *args)
+
+    async def _collect_batch(self) -> List[_PendingQuery]:
+        """Wait for a query, then gather more until the batch is full or the wait window closes."""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        """Batching loop: collect, group by search knobs and dispatch to the executor."""
+        while True:
+            batch = await self._collect_batch()
+            groups: Dict[Tuple, List[_PendingQuery]] = {}
+            for pending in batch:
+                if not pending.future.cancelled():
+                    key = (
+                        k_bucket(pending.k), pending.nprobe, pending.ef_search, pending.size, pending.search_filter,
+                        pending.collapse_duplicates
+                    )
+                    groups.setdefault(key, []).append(pending)
+
+            for group in groups.values():
+                # Bound in-flight batches so queued queries keep coalescing under load
+                await self._slots.acquire()
+                task = self._loop.create_task(self._execute(group))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, group: List[_PendingQuery]) -> None:
+        """Run one batched search and fan results out to the waiting requests."""
+        try:
+            k = max(pending.k for pending in group)
+            texts = [pending.query_text for pending in group]
+            first = group[0]
+            results = await self._loop.run_in_executor(
+                self._executor, self.search_fn, texts, k, first.nprobe, first.ef_search, first.size,
+                first.search_filter, first.collapse_duplicates
+            )
+            self.batches_run += 1
+            self.queries_run += len(group)
+            for pending, result in zip(group, results):
+                if not pending.future.done():
+                    pending.future.set_result(result[:pending.k])
+        except Exception as e:
+            for pending in group:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    async def shutdown(self) -> None:
+        """Stop the batching task and the worker threads."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -1,6 +1,5 @@
 import os
 from pathlib import Path
-import torch
 import platform
 from dotenv import load_dotenv
 
@@ -15,22 +14,137 @@ else:
     DATA_DIR = Path(os.getenv('IMAGE_DATA_DIR_LINUX', BASE_DIR / 'data'))
 
 MODEL_DIR = BASE_DIR / 'models'
+INDEX_DIR = Path(os.getenv('INDEX_DIR', MODEL_DIR / 'index'))
 
 # Model configuration
 MODEL_NAME = os.getenv('MODEL_NAME', 'openai/clip-vit-base-patch32')
-DEVICE = os.getenv('DEVICE', 'cuda' if torch.cuda.is_available() else 'cpu')
+# cpu, cuda or auto; 'auto' is resolved by resolve_device, so importing the
+# configuration never loads torch
+DEVICE = os.getenv('DEVICE', 'auto')
+
+
+def resolve_device(device: str = DEVICE) -> str:
+    """Concrete device for a DEVICE setting, importing torch only to resolve 'auto'."""
+    if device != 'auto':
+        return device
+    import torch
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+# Engine running the text and vision towers: eager (fp32 PyTorch), int8 (dynamic
+# quantization), torchscript, compile (torch.compile) or onnx (ONNX Runtime).
+# Engines whose embeddings drift below ENGINE_MIN_COSINE of fp32 fall back to eager
+INFERENCE_ENGINE = os.getenv('INFERENCE_ENGINE', 'eager')
+ENGINE_MIN_COSINE = float(os.getenv('ENGINE_MIN_COSINE', '0.99'))
+ONNX_DIR = Path(os.getenv('ONNX_DIR', MODEL_DIR / 'onnx'))
 
 # Image processing
 IMAGE_SIZE = int(os.getenv('IMAGE_SIZE', '224'))
 BATCH_SIZE = int(os.getenv('BATCH_SIZE', '32'))
+NUM_WORKERS = int(os.getenv('NUM_WORKERS', str(min(4, os.cpu_count() or 1))))
+PIN_MEMORY = os.getenv('PIN_MEMORY', 'true').lower() == 'true'
+PREFETCH_FACTOR = int(os.getenv('PREFETCH_FACTOR', '2'))
+
+# Image discovery: scan DATA_DIR recursively and check images either up front
+# ('eager', header-only checks in a thread pool) or while embedding ('deferred')
+RECURSIVE_DISCOVERY = os.getenv('RECURSIVE_DISCOVERY', 'true').lower() == 'true'
+IMAGE_VALIDATION = os.getenv('IMAGE_VALIDATION', 'eager')
+VALIDATION_WORKERS = int(os.getenv('VALIDATION_WORKERS', '8'))
+VALIDATION_CACHE_PATH = Path(os.getenv('VALIDATION_CACHE_PATH', MODEL_DIR / 'validation_cache.json'))
 
 # Retrieval configuration
 TOP_K = int(os.getenv('TOP_K', '5'))
+# Deepest result /search pages can reach with cursors
+MAX_RESULT_DEPTH = int(os.getenv('MAX_RESULT_DEPTH', '1000'))
+
+# Index type: flat (exact), ivf_flat, ivf_pq or hnsw (approximate)
+INDEX_TYPE = os.getenv('INDEX_TYPE', 'flat')
+IVF_NLIST = int(os.getenv('IVF_NLIST', '0'))  # 0 picks ~4*sqrt(corpus size)
+PQ_M = int(os.getenv('PQ_M', '64'))  # PQ sub-quantizers, must divide the embedding dimension
+# How index vectors are stored: fp32, fp16 (half precision), sq8 (int8 scalar
+# quantization) or pq (product quantization, PQ_M bytes per vector). With a
+# compressed encoding, RERANK_FACTOR * k candidates are re-scored exactly
+# against the fp32 embeddings on disk; 0 disables re-ranking
+VECTOR_ENCODING = os.getenv('VECTOR_ENCODING', 'fp32')
+RERANK_FACTOR = int(os.getenv('RERANK_FACTOR', '0'))
+# Split the index into INDEX_SHARDS shards searched in parallel, assigning
+# images by a hash of their path ('hash') or of their top-level directory
+# ('directory'); 1 keeps a single index
+INDEX_SHARDS = int(os.getenv('INDEX_SHARDS', '1'))
+SHARD_BY = os.getenv('SHARD_BY', 'hash')
+# Images whose embeddings are more similar than this (cosine) are grouped
+# as near-duplicates by the dedup job; collapsing searches fetch
+# COLLAPSE_FETCH_FACTOR * k candidates to refill the slots duplicates free
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.95'))
+COLLAPSE_FETCH_FACTOR = int(os.getenv('COLLAPSE_FETCH_FACTOR', '4'))
+# Filtered searches matching at most this many images scan their embeddings
+# exactly instead of probing the index with a selector
+FILTER_SCAN_ROWS = int(os.getenv('FILTER_SCAN_ROWS', '20000'))
+HNSW_M = int(os.getenv('HNSW_M', '32'))
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', '80'))
+TRAIN_SAMPLE_SIZE = int(os.getenv('TRAIN_SAMPLE_SIZE', '100000'))
+# Default runtime knobs, overridable per request
+NPROBE = int(os.getenv('NPROBE', '16'))
+EF_SEARCH = int(os.getenv('EF_SEARCH', '64'))
+
+# Query scheduling: concurrent text queries arriving within the wait window are
+# encoded and searched together, up to QUERY_BATCH_SIZE per batch
+QUERY_BATCH_SIZE = int(os.getenv('QUERY_BATCH_SIZE', '16'))
+QUERY_BATCH_WAIT_MS = float(os.getenv('QUERY_BATCH_WAIT_MS', '3'))
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+
+# Query-embedding cache: in-process LRU bounded by bytes, optionally backed by a
+# store shared across workers ('memory', 'sqlite' or 'redis')
+QUERY_CACHE_BACKEND = os.getenv('QUERY_CACHE_BACKEND', 'memory')
+QUERY_CACHE_MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', str(24 * 3600)))
+QUERY_CACHE_PATH = Path(os.getenv('QUERY_CACHE_PATH', MODEL_DIR / 'query_cache.sqlite'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Serialized /search responses, keyed on normalized query, top_k and index version
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Resized renditions served at /thumbnails/{size}/..., cached on disk after first request
+THUMBNAIL_DIR = Path(os.getenv('THUMBNAIL_DIR', MODEL_DIR / 'thumbnails'))
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv('THUMBNAIL_SIZES', '128,256,512').split(','))
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'webp')  # webp or jpeg
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '80'))
+THUMBNAIL_MAX_AGE = int(os.getenv('THUMBNAIL_MAX_AGE', str(30 * 24 * 3600)))  # Cache-Control max-age in seconds
+
+# 'standalone' builds and maintains its own index; 'worker' maps the artifact in
+# INDEX_DIR read-only, as written by the index builder (python -m backend.src.models.index_builder)
+SERVING_MODE = os.getenv('SERVING_MODE', 'standalone')
+WORKER_INDEX_WAIT = float(os.getenv('WORKER_INDEX_WAIT', '600'))  # Seconds a worker waits for the artifact
+
+# Seconds between background scans of DATA_DIR for added/changed/deleted images (0 disables)
+INDEX_POLL_INTERVAL = float(os.getenv('INDEX_POLL_INTERVAL', '0'))
+
+# Per-stage timing histograms exposed at /metrics (disabled hooks cost one flag check)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
 
 # API Configuration
 API_HOST = os.getenv('API_HOST', '0.0.0.0')
 API_PORT = int(os.getenv('API_PORT', '8000'))
 CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:8000').split(',')
+# Per-client token bucket: RATE_LIMIT_BURST requests at once, refilled at
+# RATE_LIMIT_PER_MINUTE; 'redis' shares buckets across worker processes
+RATE_LIMIT_PER_MINUTE = int(os.getenv('RATE_LIMIT_PER_MINUTE', '60'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '0')) or None  # 0 means equal to RATE_LIMIT_PER_MINUTE
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv('RATE_LIMIT_MAX_CLIENTS', '100000'))
+RATE_LIMIT_EXEMPT_PATHS = [
+    path.strip() for path in os.getenv('RATE_LIMIT_EXEMPT_PATHS', '/health,/ready,/metrics,/images,/thumbnails').split(',')
+]
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+# Take the client address from X-Forwarded-For (only behind a trusted proxy)
+RATE_LIMIT_TRUST_FORWARDED = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true'
+# Most queries accepted by one /search/batch request
+MAX_BATCH_QUERIES = int(os.getenv('MAX_BATCH_QUERIES', '256'))
+# Most weighted text and image components combined by one /search/hybrid request
+MAX_QUERY_COMPONENTS = int(os.getenv('MAX_QUERY_COMPONENTS', '8'))
+# Largest image accepted by /search/image and per /search/hybrid component
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+# Token required in the X-Admin-Token header for /admin endpoints (unset disables them)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 
 # Create directories if they don't exist
 DATA_DIR.mkdir(parents=True, exist_ok=True)
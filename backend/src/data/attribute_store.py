@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (width, height, format) read from an image header; (0, 0, "") if unreadable
+ImageAttributes = Tuple[int, int, str]
+
+# Alternative spellings accepted in format filters
+FORMAT_ALIASES = {"jpg": "jpeg", "tif": "tiff"}
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """
+    Conditions an image must meet to be returned by a search; unset fields don't filter.
+
+    Conditions are ANDed; list fields match any of their values. Frozen and
+    built from tuples, so equal filters hash alike and can key caches.
+    """
+    directories: Optional[Tuple[str, ...]] = None  # Folders relative to the data directory, subfolders included
+    formats: Optional[Tuple[str, ...]] = None  # e.g. ('jpeg', 'png')
+    min_width: Optional[int] = None
+    max_width: Optional[int] = None
+    min_height: Optional[int] = None
+    max_height: Optional[int] = None
+    modified_after: Optional[float] = None  # Unix timestamps
+    modified_before: Optional[float] = None
+
+
+class AttributeStore:
+    """
+    Columnar image metadata aligned with PathStore rows, for pre-filtered search.
+
+    Width and height are int32 columns; format and source directory are small
+    integer codes into vocabularies, so a filter is evaluated by comparing
+    whole columns and matching a handful of vocabulary entries, never per
+    image in Python. Modification times live in the PathStore fingerprints.
+    """
+
+    def __init__(self):
+        self.width = np.zeros(0, dtype=np.int32)
+        self.height = np.zeros(0, dtype=np.int32)
+        self.format_codes = np.zeros(0, dtype=np.uint8)
+        self.directory_codes = np.zeros(0, dtype=np.int32)
+        self.formats: List[str] = []
+        self.directories: List[str] = []
+        self._format_codes: Dict[str, int] = {}
+        self._directory_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.width)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the columns."""
+        return self.width.nbytes + self.height.nbytes + self.format_codes.nbytes + self.directory_codes.nbytes
+
+    @staticmethod
+    def _code(value: str, vocabulary: List[str], codes: Dict[str, int]) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(vocabulary)
+            vocabulary.append(value)
+        return code
+
+    def append(self, relative_paths: Sequence[str], attributes: Sequence[ImageAttributes]) -> None:
+        """
+        Add the metadata of new rows, in the order PathStore.append added them.
+
+        Args:
+            relative_paths (Sequence[str]): Paths relative to the data directory, '/'-separated
+            attributes (Sequence[ImageAttributes]): (width, height, format) per path
+        """
+        directories = [
+            self._code(path.rpartition("/")[0], self.directories, self._directory_codes) for path in relative_paths
+        ]
+        formats = [self._code(fmt.lower(), self.formats, self._format_codes) for _, _, fmt in attributes]
+        self.width = np.concatenate([self.width, np.array([attr[0] for attr in attributes], dtype=np.int32)])
+        self.height = np.concatenate([self.height, np.array([attr[1] for attr in attributes], dtype=np.int32)])
+        self.format_codes = np.concatenate([self.format_codes, np.array(formats, dtype=np.uint8)])
+        self.directory_codes = np.concatenate([self.directory_codes, np.array(directories, dtype=np.int32)])
+
+    def compact(self, kept: np.ndarray) -> None:
+        """Keep only the given rows, in order, matching PathStore.compact."""
+        self.width = self.width[kept]
+        self.height = self.height[kept]
+        self.format_codes = self.format_codes[kept]
+        self.directory_codes = self.directory_codes[kept]
+
+    def select(self, search_filter: SearchFilter, mtimes: np.ndarray) -> np.ndarray:
+        """
+        Evaluate a filter over every row.
+
+        Args:
+            search_filter (SearchFilter): Conditions to apply
+            mtimes (np.ndarray): Modification time per row, NaN where unknown
+
+        Returns:
+            np.ndarray: Boolean mask over rows, True where the image matches
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if search_filter.directories is not None:
+            prefixes = [directory.strip("/") for directory in search_filter.directories]
+            codes = [
+                code for code, name in enumerate(self.directories)
+                if any(not prefix or name == prefix or name.startswith(prefix + "/") for prefix in prefixes)
+            ]
+            mask &= np.isin(self.directory_codes, codes)
+        if search_filter.formats is not None:
+            wanted = {FORMAT_ALIASES.get(fmt.lower(), fmt.lower()) for fmt in search_filter.formats}
+            mask &= np.isin(self.format_codes, [code for code, fmt in enumerate(self.formats) if fmt in wanted])
+        if search_filter.min_width is not None:
+            mask &= self.width >= search_filter.min_width
+        if search_filter.max_width is not None:
+            mask &= self.width <= search_filter.max_width
+        if search_filter.min_height is not None:
+            mask &= self.height >= search_filter.min_height
+        if search_filter.max_height is not None:
+            mask &= self.height <= search_filter.max_height
+        # NaN comparisons are False, so images without a known mtime fail date filters
+        if search_filter.modified_after is not None:
+            mask &= mtimes >= search_filter.modified_after
+        if search_filter.modified_before is not None:
+            mask &= mtimes <= search_filter.modified_before
+        return mask
+
+    def save(self, file) -> None:
+        """Write the store as an uncompressed .npz to a path or binary file object."""
+        np.savez(
+            file,
+            width=self.width,
+            height=self.height,
+            format_codes=self.format_codes,
+            directory_codes=self.directory_codes,
+            formats=np.array(self.formats, dtype=str),
+            directories=np.array(self.directories, dtype=str)
+        )
+
+    @classmethod
+    def load(cls, file) -> "AttributeStore":
+        """Read a store written by save."""
+        store = cls()
+        with np.load(file) as arrays:
+            store.width = arrays["width"].astype(np.int32)
+            store.height = arrays["height"].astype(np.int32)
+            store.format_codes = arrays["format_codes"].astype(np.uint8)
+            store.directory_codes = arrays["directory_codes"].astype(np.int32)
+            store.formats = arrays["formats"].tolist()
+            store.directories = arrays["directories"].tolist()
+        store._format_codes = {fmt: code for code, fmt in enumerate(store.formats)}
+        store._directory_codes = {name: code for code, name in enumerate(store.directories)}
+        return store
@@ -1,68 +1,356 @@
+import io
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
 from PIL import Image, UnidentifiedImageError
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, DataLoader
 from torchvision import transforms
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Optional, Union
 import logging
-from ..config import IMAGE_SIZE
+from ..config import (
+    IMAGE_SIZE,
+    BATCH_SIZE,
+    NUM_WORKERS,
+    PREFETCH_FACTOR,
+    RECURSIVE_DISCOVERY,
+    IMAGE_VALIDATION,
+    VALIDATION_WORKERS
+)
+from .attribute_store import ImageAttributes
+from .path_store import PathStore, url_prefix
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+
+# Preprocessing shared by indexing and query-by-example so their embeddings are comparable
+IMAGE_TRANSFORM = transforms.Compose([
+    transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                         std=[0.229, 0.224, 0.225])
+])
+
+
+VALIDATION_MODES = ("eager", "deferred")
+
+# (mtime, size) of a file, used to tell whether a cached validation result still applies
+Fingerprint = Tuple[float, int]
+
+
+def iter_images(data_dir: Path, recursive: bool = RECURSIVE_DISCOVERY) -> Iterator[Path]:
+    """
+    Stream the image files under data_dir as they are found.
+
+    Uses os.scandir, so file types come from the directory listing without a
+    stat per entry. Hidden files and directories are skipped.
+
+    Args:
+        data_dir (Path): Directory to scan
+        recursive (bool): Whether to descend into subdirectories
+
+    Yields:
+        Path: Image file paths, in directory order
+    """
+    pending = [str(data_dir)]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                pending.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                            yield Path(entry.path)
+                    except OSError:
+                        continue  # Vanished or unreadable entry
+        except OSError as e:
+            logger.warning(f"Skipping unreadable directory {directory}: {str(e)}")
+
+
+def discover_images(data_dir: Path, recursive: bool = RECURSIVE_DISCOVERY) -> List[Path]:
+    """Find all image files (supporting multiple formats) under data_dir."""
+    return list(iter_images(data_dir, recursive))
+
+
+def check_image_header(image_path: Path) -> bool:
+    """
+    Check that a file is a readable image by parsing only its header.
+
+    Image.open identifies the format and dimensions without decoding pixel
+    data, so the cost is a few KB of I/O per file instead of a full read.
+    """
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+        return width > 0 and height > 0
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError) as e:
+        logger.warning(f"Skipping invalid image {image_path}: {str(e)}")
+        return False
+
+
+def read_image_attributes(
+        image_paths: Sequence[Union[str, Path]],
+        max_workers: int = VALIDATION_WORKERS
+) -> List[ImageAttributes]:
+    """
+    Read the width, height and format of images from their headers, in a thread pool.
+
+    Args:
+        image_paths (Sequence[Union[str, Path]]): Image files
+        max_workers (int): Number of reading threads
+
+    Returns:
+        List[ImageAttributes]: (width, height, format) per path, (0, 0, "") where unreadable
+    """
+    def read(image_path) -> ImageAttributes:
+        try:
+            with Image.open(image_path) as img:
+                return img.size[0], img.size[1], (img.format or "").lower()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+            return 0, 0, ""
+
+    if not image_paths:
+        return []
+    workers = max(1, min(max_workers, len(image_paths)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attributes") as executor:
+        return list(executor.map(read, image_paths))
+
+
+def _fingerprint(path: Path) -> Optional[Fingerprint]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class ValidationCache:
+    """
+    Image validation results keyed by path and (mtime, size), persisted as JSON.
+
+    Lets restarts skip re-checking files that have not changed, and remembers
+    files that failed to decode while embedding so they are not retried.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Args:
+            path (Optional[Path]): JSON file to load from and save to; None keeps results in memory only
+        """
+        self.path = Path(path) if path is not None else None
+        self._results: Dict[str, Tuple[float, int, bool]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if self.path is not None and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._results = {key: tuple(value) for key, value in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable validation cache {self.path}: {str(e)}")
+
+    def lookup(self, image_path: str, fingerprint: Fingerprint) -> Optional[bool]:
+        """Return the cached result for an unchanged file, or None if unknown or changed."""
+        with self._lock:
+            entry = self._results.get(image_path)
+        if entry is None or (entry[0], entry[1]) != fingerprint:
+            return None
+        return entry[2]
+
+    def record(self, image_path: str, fingerprint: Fingerprint, valid: bool) -> None:
+        with self._lock:
+            self._results[image_path] = (fingerprint[0], fingerprint[1], valid)
+            self._dirty = True
+
+    def save(self) -> None:
+        """Write the results to disk if anything changed since the last save."""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._results)
+            self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save validation cache {self.path}: {str(e)}")
+
+
+def validate_images(
+        image_paths: Iterable[Path],
+        max_workers: int = VALIDATION_WORKERS,
+        cache: Optional[ValidationCache] = None,
+        chunk_size: int = 256
+) -> Iterator[Path]:
+    """
+    Check image headers in a thread pool, streaming the valid paths in input order.
+
+    Paths are consumed in chunks, so validation starts before discovery
+    finishes and stops early when the caller stops iterating.
+
+    Args:
+        image_paths (Iterable[Path]): Candidate image files
+        max_workers (int): Number of checking threads
+        cache (Optional[ValidationCache]): Results reused for unchanged files and updated with new ones
+        chunk_size (int): Number of paths checked per round
+
+    Yields:
+        Path: Paths whose header parsed as an image
+    """
+    def check(image_path: Path) -> bool:
+        fingerprint = _fingerprint(image_path)
+        if fingerprint is None:
+            return False
+        if cache is not None:
+            cached = cache.lookup(str(image_path), fingerprint)
+            if cached is not None:
+                return cached
+        valid = check_image_header(image_path)
+        if cache is not None:
+            cache.record(str(image_path), fingerprint, valid)
+        return valid
+
+    paths = iter(image_paths)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="validate") as executor:
+        while True:
+            chunk = list(islice(paths, chunk_size))
+            if not chunk:
+                break
+            for image_path, valid in zip(chunk, executor.map(check, chunk)):
+                if valid:
+                    yield image_path
+
+
+def build_image_url(image_path: str, data_dir: Path, size: Optional[int] = None) -> str:
+    """
+    Convert an image path under data_dir to an absolute URL for the frontend.
+
+    Args:
+        image_path (str): Image file path
+        data_dir (Path): Directory the images are served from
+        size (Optional[int]): Thumbnail size to link to; None links the original
+    """
+    # Convert to Path object for cross-platform compatibility
+    image_path = Path(image_path)
+
+    # Get the relative path from the data directory
+    try:
+        rel_path = image_path.relative_to(data_dir)
+    except ValueError:
+        # If path is already relative, use it as is
+        rel_path = image_path.name
+
+    # Convert path separators to forward slashes for URLs
+    url_path = str(rel_path).replace(os.path.sep, '/')
+
+    # Backend server address from BACKEND_URL, default localhost:8000
+    return url_prefix(size) + url_path
+
+
+def decode_image(data: bytes) -> torch.Tensor:
+    """
+    Decode and preprocess an uploaded image.
+
+    JPEGs are decoded at reduced resolution via Image.draft, so large uploads
+    cost little more than the model input size.
+
+    Args:
+        data (bytes): Encoded image file contents
+
+    Returns:
+        torch.Tensor: Preprocessed (3, IMAGE_SIZE, IMAGE_SIZE) image
+
+    Raises:
+        ValueError: If the data is not a readable image
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft('RGB', (IMAGE_SIZE, IMAGE_SIZE))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            return IMAGE_TRANSFORM(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"Invalid image: {str(e)}") from e
+
 
 class ImageDataset(Dataset):
     """Dataset class for loading and preprocessing images."""
 
-    def __init__(self, data_dir: str, max_images: Optional[int] = None):
+    def __init__(
+            self,
+            data_dir: str,
+            max_images: Optional[int] = None,
+            image_paths: Optional[List[str]] = None,
+            validation: str = IMAGE_VALIDATION,
+            validation_cache: Optional[ValidationCache] = None
+    ):
         """
         Initialize the dataset.
         
         Args:
             data_dir (str): Directory containing the images
             max_images (Optional[int]): Maximum number of images to load. If None, load all images.
+            image_paths (Optional[List[str]]): Explicit images under data_dir to load instead of
+                discovering every image in the directory
+            validation (str): 'eager' checks image headers in parallel now; 'deferred' only drops
+                files the cache already knows are invalid and leaves the rest to embedding
+            validation_cache (Optional[ValidationCache]): Results reused for unchanged files
             
         Raises:
             FileNotFoundError: If data_dir doesn't exist
-            ValueError: If no valid images found in data_dir
+            ValueError: If no valid images found in data_dir or validation is unknown
         """
         self.data_dir = Path(data_dir)
         if not self.data_dir.exists():
             raise FileNotFoundError(f"Directory not found: {data_dir}")
+        if validation not in VALIDATION_MODES:
+            raise ValueError(f"Unknown validation mode '{validation}', expected one of {VALIDATION_MODES}")
 
-        # Find all image files (supporting multiple formats)
-        image_files = []
-        for ext in [".jpg", ".jpeg", ".png"]:
-            image_files.extend(self.data_dir.glob(f"*{ext}"))
+        self.validation_cache = validation_cache
 
-        # Validate images and keep only valid ones
-        self.image_paths = []
-        for img_path in image_files:
-            try:
-                with Image.open(img_path) as img:
-                    img.verify()
-                self.image_paths.append(img_path)
-                if max_images is not None and len(self.image_paths) >= max_images:
-                    break
-            except (UnidentifiedImageError, Exception) as e:
-                logger.warning(f"Skipping invalid image {img_path}: {str(e)}")
-
-        if not self.image_paths:
+        if image_paths is None:
+            image_files = iter_images(self.data_dir)
+        else:
+            image_files = (Path(path) for path in image_paths)
+
+        if validation == "eager":
+            valid_files = validate_images(image_files, cache=validation_cache)
+        else:
+            valid_files = (path for path in image_files if not self._known_invalid(path))
+        # Compact columnar paths: cheap to hold and to pickle into DataLoader workers
+        self.paths = PathStore.from_paths(self.data_dir, islice(valid_files, max_images))
+        if validation_cache is not None:
+            validation_cache.save()
+
+        if not len(self.paths):
             raise ValueError(f"No valid images found in {data_dir}")
 
-        logger.info(f"Loaded {len(self.image_paths)} valid images from {data_dir}")
+        logger.info(f"Loaded {len(self.paths)} valid images from {data_dir}")
 
-        self.transform = transforms.Compose([
-            transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                 std=[0.229, 0.224, 0.225])
-        ])
+        self.transform = IMAGE_TRANSFORM
 
     def __len__(self) -> int:
-        return len(self.image_paths)
+        return len(self.paths)
+
+    @property
+    def image_paths(self) -> List[Path]:
+        """Every image path, materialized from the path store."""
+        return [Path(path) for path in self.paths.iter_paths()]
 
     def _load_and_preprocess_image(self, image_path: Path) -> torch.Tensor:
         """Load and preprocess an image while preserving quality."""
@@ -94,11 +382,11 @@ class ImageDataset(Dataset):
             RuntimeError: If image cannot be loaded or processed
             IndexError: If index is out of bounds
         """
-        if idx < 0 or idx >= len(self.image_paths):
-            raise IndexError(f"Index {idx} is out of bounds for dataset with {len(self.image_paths)} images")
+        if idx < 0 or idx >= len(self.paths):
+            raise IndexError(f"Index {idx} is out of bounds for dataset with {len(self.paths)} images")
             
+        image_path = self.paths.path(idx)
         try:
-            image_path = self.image_paths[idx]
             image = self._load_and_preprocess_image(image_path)
             return image, str(image_path)
         except Exception as e:
@@ -106,26 +394,98 @@ class ImageDataset(Dataset):
             logger.error(error_msg)
             raise RuntimeError(error_msg) from e
 
+    def _known_invalid(self, image_path: Path) -> bool:
+        if self.validation_cache is None:
+            return False
+        fingerprint = _fingerprint(image_path)
+        return fingerprint is not None and self.validation_cache.lookup(str(image_path), fingerprint) is False
+
+    def record_loaded(self, loaded_paths: Iterable[str]) -> None:
+        """
+        Record which images decoded during embedding, so failures are skipped next time.
+
+        Args:
+            loaded_paths (Iterable[str]): Paths that were embedded; every other dataset path failed
+        """
+        if self.validation_cache is None:
+            return
+        loaded = set(loaded_paths)
+        for image_path in self.paths.iter_paths():
+            fingerprint = _fingerprint(image_path)
+            if fingerprint is not None:
+                self.validation_cache.record(str(image_path), fingerprint, str(image_path) in loaded)
+        self.validation_cache.save()
+
     def get_image_paths(self) -> List[str]:
         """Get all image paths in the dataset."""
-        return [str(path) for path in self.image_paths]
+        return self.paths.paths()
 
-    def get_image_url(self, image_path: str) -> str:
-        """Convert image path to absolute URL format for frontend."""
-        # Convert to Path object for cross-platform compatibility
-        image_path = Path(image_path)
-        
-        # Get the relative path from the data directory
+    def get_image_url(self, image_path: str, size: Optional[int] = None) -> str:
+        """Convert image path to absolute URL format for frontend, optionally of a thumbnail rendition."""
+        return build_image_url(image_path, self.data_dir, size)
+
+
+class SkipCorruptDataset(Dataset):
+    """Wrapper that yields None for images that fail to load instead of raising."""
+
+    def __init__(self, dataset: ImageDataset):
+        self.dataset = dataset
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitem__(self, idx: int) -> Optional[Tuple[torch.Tensor, str]]:
         try:
-            rel_path = image_path.relative_to(self.data_dir)
-        except ValueError:
-            # If path is already relative, use it as is
-            rel_path = image_path.name
-            
-        # Convert path separators to forward slashes for URLs
-        url_path = str(rel_path).replace(os.path.sep, '/')
-        
-        # Construct the full URL with the backend server address
-        # Using environment variable or default to localhost:8000
-        backend_url = os.getenv('BACKEND_URL', 'http://localhost:8000')
-        return f"{backend_url}/images/{url_path}"
+            return self.dataset[idx]
+        except RuntimeError as e:
+            logger.warning(f"Skipping corrupt image at index {idx}: {str(e)}")
+            return None
+
+
+def collate_skip_corrupt(batch: List[Optional[Tuple[torch.Tensor, str]]]) -> Optional[Tuple[torch.Tensor, List[str]]]:
+    """
+    Collate (image, path) samples into a batch, dropping samples that failed to load.
+
+    Returns:
+        Optional[tuple]: (stacked_images, image_paths), or None if every sample in the batch was corrupt
+    """
+    batch = [item for item in batch if item is not None]
+    if not batch:
+        return None
+    images, paths = zip(*batch)
+    return torch.stack(images), list(paths)
+
+
+def create_data_loader(
+        dataset: ImageDataset,
+        batch_size: int = BATCH_SIZE,
+        num_workers: int = NUM_WORKERS,
+        pin_memory: bool = False,
+        prefetch_factor: int = PREFETCH_FACTOR
+) -> DataLoader:
+    """
+    Create a DataLoader that decodes images in worker processes and skips corrupt files.
+
+    Args:
+        dataset (ImageDataset): Dataset to iterate over
+        batch_size (int): Number of images per batch
+        num_workers (int): Number of decode worker processes (0 decodes in the calling process)
+        pin_memory (bool): Whether to pin batches in page-locked memory for faster host-to-GPU copies
+        prefetch_factor (int): Number of batches each worker loads ahead
+
+    Returns:
+        DataLoader: Loader yielding (images, paths) batches, or None for fully corrupt batches
+    """
+    loader_kwargs = {}
+    if num_workers > 0:
+        loader_kwargs["prefetch_factor"] = prefetch_factor
+
+    return DataLoader(
+        SkipCorruptDataset(dataset),
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        collate_fn=collate_skip_corrupt,
+        **loader_kwargs
+    )
@@ -0,0 +1,282 @@
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+Fingerprint = Tuple[float, int]
+
+# Fingerprint columns of rows appended without one
+_NO_MTIME = np.nan
+_NO_SIZE = -1
+
+
+def url_prefix(size: Optional[int] = None) -> str:
+    """
+    URL every image (or thumbnail rendition of a size) is served under, ending in '/'.
+
+    Reads BACKEND_URL once per call, so callers build it once per batch of URLs.
+    """
+    backend_url = os.getenv('BACKEND_URL', 'http://localhost:8000')
+    if size is not None:
+        return f"{backend_url}/thumbnails/{size}/"
+    return f"{backend_url}/images/"
+
+
+class PathStore:
+    """
+    Columnar store of the image paths under a data directory, one row per index ID.
+
+    Paths are kept relative to data_dir, in URL form ('/' separators), in one
+    contiguous UTF-8 buffer sliced by an offsets array, next to columns for
+    the liveness and (mtime, size) fingerprint of each row. That costs tens
+    of bytes per image instead of a few hundred for Python strings, tuples and
+    dict entries, and turning result IDs into URLs is a gather of offsets.
+
+    Removing an image only clears its live flag, so row numbers stay aligned
+    with the embedding matrix and FAISS IDs; compact() drops removed rows
+    and renumbers the rest, and callers renumber their IDs to match.
+    """
+
+    def __init__(self, data_dir: Union[str, Path]):
+        """
+        Args:
+            data_dir (Union[str, Path]): Directory every stored path lies under
+        """
+        self.data_dir = Path(data_dir)
+        self._root = str(self.data_dir)
+        self._buffer = bytearray()
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self.live = np.zeros(0, dtype=bool)
+        self._mtimes = np.zeros(0, dtype=np.float64)
+        self._sizes = np.zeros(0, dtype=np.int64)
+        # Sorted (hash, row) pairs for path lookups, rebuilt lazily after appends
+        self._lookup: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        """Number of rows, including removed images."""
+        return len(self.live)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lookup"] = None  # Keep pickles sent to DataLoader workers small
+        return state
+
+    @property
+    def live_count(self) -> int:
+        """Number of images not removed."""
+        return int(np.count_nonzero(self.live))
+
+    @property
+    def mtimes(self) -> np.ndarray:
+        """Modification time recorded per row, NaN where unknown."""
+        return self._mtimes
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the buffer and the columns."""
+        lookup = sum(array.nbytes for array in self._lookup) if self._lookup is not None else 0
+        return (len(self._buffer) + self._offsets.nbytes + self.live.nbytes
+                + self._mtimes.nbytes + self._sizes.nbytes + lookup)
+
+    def _relative(self, path: Union[str, Path]) -> str:
+        path = str(path)
+        if path.startswith(self._root) and path[len(self._root):len(self._root) + 1] == os.sep:
+            relative = path[len(self._root) + 1:]
+        else:
+            try:
+                relative = str(Path(path).relative_to(self.data_dir))
+            except ValueError:
+                raise ValueError(f"{path} is not under {self.data_dir}")
+        return relative.replace(os.sep, "/") if os.sep != "/" else relative
+
+    def append(
+            self,
+            paths: Sequence[Union[str, Path]],
+            fingerprints: Optional[Sequence[Fingerprint]] = None
+    ) -> np.ndarray:
+        """
+        Add images as new rows.
+
+        Args:
+            paths (Sequence[Union[str, Path]]): Image paths under data_dir
+            fingerprints (Optional[Sequence[Fingerprint]]): (mtime, size) per path, if known
+
+        Returns:
+            np.ndarray: Row number (ID) of each added path
+
+        Raises:
+            ValueError: If a path is outside data_dir
+        """
+        encoded = [self._relative(path).encode("utf-8", "surrogateescape") for path in paths]
+        ids = np.arange(len(self), len(self) + len(encoded), dtype=np.int64)
+        lengths = np.fromiter((len(value) for value in encoded), dtype=np.int64, count=len(encoded))
+
+        self._buffer += b"".join(encoded)
+        self._offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum(lengths)])
+        self.live = np.concatenate([self.live, np.ones(len(encoded), dtype=bool)])
+        if fingerprints is None:
+            mtimes = np.full(len(encoded), _NO_MTIME)
+            sizes = np.full(len(encoded), _NO_SIZE, dtype=np.int64)
+        else:
+            mtimes = np.array([fingerprint[0] for fingerprint in fingerprints], dtype=np.float64)
+            sizes = np.array([fingerprint[1] for fingerprint in fingerprints], dtype=np.int64)
+        self._mtimes = np.concatenate([self._mtimes, mtimes])
+        self._sizes = np.concatenate([self._sizes, sizes])
+        self._lookup = None
+        return ids
+
+    def remove(self, ids: np.ndarray) -> None:
+        """Mark rows as removed; their IDs are not reused until compact() renumbers the rows."""
+        self.live[np.asarray(ids, dtype=np.int64)] = False
+
+    def compact(self) -> np.ndarray:
+        """
+        Drop removed rows, renumbering the live ones in order.
+
+        Returns:
+            np.ndarray: Previous ID of each kept row, i.e. new ID -> old ID
+        """
+        kept = self.live_ids()
+        lengths = np.diff(self._offsets)
+        byte_rows = np.repeat(np.arange(len(self)), lengths)
+        self._buffer = bytearray(np.frombuffer(bytes(self._buffer), dtype=np.uint8)[self.live[byte_rows]].tobytes())
+        self._offsets = np.concatenate([[0], np.cumsum(lengths[kept])]).astype(np.int64)
+        self.live = np.ones(len(kept), dtype=bool)
+        self._mtimes = self._mtimes[kept]
+        self._sizes = self._sizes[kept]
+        self._lookup = None
+        return kept
+
+    def live_ids(self) -> np.ndarray:
+        """IDs of images not removed, ascending."""
+        return np.flatnonzero(self.live).astype(np.int64)
+
+    def _raw(self, idx: int) -> bytes:
+        return bytes(self._buffer[self._offsets[idx]:self._offsets[idx + 1]])
+
+    def relative(self, idx: int) -> Optional[str]:
+        """Path of a row relative to data_dir in URL form, None if removed."""
+        if not self.live[idx]:
+            return None
+        return self._raw(idx).decode("utf-8", "surrogateescape")
+
+    def path(self, idx: int) -> Optional[str]:
+        """Full path of a row, None if removed."""
+        relative = self.relative(idx)
+        if relative is None:
+            return None
+        return os.path.join(self._root, relative.replace("/", os.sep) if os.sep != "/" else relative)
+
+    def fingerprint(self, idx: int) -> Optional[Fingerprint]:
+        """(mtime, size) recorded for a row, None if unknown."""
+        if self._sizes[idx] == _NO_SIZE:
+            return None
+        return float(self._mtimes[idx]), int(self._sizes[idx])
+
+    def iter_paths(self) -> Iterator[Optional[str]]:
+        """Full path of every row in ID order, None for removed rows."""
+        for idx in range(len(self)):
+            yield self.path(idx)
+
+    def paths(self) -> List[Optional[str]]:
+        """Every row materialized as a list of full paths; for inspection, not hot paths."""
+        return list(self.iter_paths())
+
+    def urls(self, ids: np.ndarray, size: Optional[int] = None) -> List[str]:
+        """
+        URLs of the given rows, in order.
+
+        Offsets of all rows are gathered at once and the URL prefix is built
+        once, so each URL costs one buffer slice and one concatenation.
+
+        Args:
+            ids (np.ndarray): Live row numbers
+            size (Optional[int]): Thumbnail size to link to; None links originals
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        prefix = url_prefix(size)
+        starts = self._offsets[ids].tolist()
+        ends = self._offsets[ids + 1].tolist()
+        buffer = self._buffer
+        return [prefix + buffer[start:end].decode("utf-8", "surrogateescape") for start, end in zip(starts, ends)]
+
+    def _build_lookup(self) -> Tuple[np.ndarray, np.ndarray]:
+        hashes = np.fromiter((hash(self._raw(idx)) for idx in range(len(self))), dtype=np.int64, count=len(self))
+        order = np.argsort(hashes, kind="stable")
+        return hashes[order], order.astype(np.int64)
+
+    def find_many(self, paths: Sequence[Union[str, Path]]) -> np.ndarray:
+        """
+        Look up the live rows of several paths at once.
+
+        Rows are found by binary search over sorted path hashes, then
+        confirmed byte for byte, so lookups need no per-image dict.
+
+        Args:
+            paths (Sequence[Union[str, Path]]): Paths under data_dir
+
+        Returns:
+            np.ndarray: Row number per path, -1 where the path is not stored or was removed
+        """
+        if self._lookup is None:
+            self._lookup = self._build_lookup()
+        sorted_hashes, rows = self._lookup
+
+        found = np.full(len(paths), -1, dtype=np.int64)
+        for position, path in enumerate(paths):
+            try:
+                key = self._relative(path).encode("utf-8", "surrogateescape")
+            except ValueError:
+                continue
+            target = hash(key)
+            start = np.searchsorted(sorted_hashes, target, side="left")
+            while start < len(sorted_hashes) and sorted_hashes[start] == target:
+                row = rows[start]
+                if self.live[row] and self._raw(row) == key:
+                    found[position] = row
+                    break
+                start += 1
+        return found
+
+    def find(self, path: Union[str, Path]) -> Optional[int]:
+        """Row of a live path, None if it is not stored."""
+        row = int(self.find_many([path])[0])
+        return row if row >= 0 else None
+
+    def save(self, file) -> None:
+        """Write the store as an uncompressed .npz to a path or binary file object."""
+        np.savez(
+            file,
+            buffer=np.frombuffer(bytes(self._buffer), dtype=np.uint8),
+            offsets=self._offsets,
+            live=self.live,
+            mtimes=self._mtimes,
+            sizes=self._sizes
+        )
+
+    @classmethod
+    def load(cls, file, data_dir: Union[str, Path]) -> "PathStore":
+        """Read a store written by save, for paths under data_dir."""
+        store = cls(data_dir)
+        with np.load(file) as arrays:
+            store._buffer = bytearray(arrays["buffer"].tobytes())
+            store._offsets = arrays["offsets"].astype(np.int64)
+            store.live = arrays["live"].astype(bool)
+            store._mtimes = arrays["mtimes"].astype(np.float64)
+            store._sizes = arrays["sizes"].astype(np.int64)
+        if len(store._offsets) != len(store.live) + 1 or store._offsets[-1] != len(store._buffer):
+            raise ValueError("Path store is inconsistent")
+        return store
+
+    @classmethod
+    def from_paths(
+            cls,
+            data_dir: Union[str, Path],
+            paths: Iterable[Union[str, Path]],
+            fingerprints: Optional[Sequence[Fingerprint]] = None
+    ) -> "PathStore":
+        """Create a store holding the given paths as rows 0..n-1."""
+        store = cls(data_dir)
+        store.append(list(paths), fingerprints)
+        return store
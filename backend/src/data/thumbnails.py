@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable, Tuple
+
+from PIL import Image, UnidentifiedImageError, features
+
+from ..config import THUMBNAIL_DIR, THUMBNAIL_SIZES, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+class ThumbnailStore:
+    """
+    Resized renditions of indexed images, generated on first request and kept in a sharded disk cache.
+
+    Rendition files are named after a hash of the source path and its
+    (mtime, size), so an edited image gets a fresh rendition and readers never
+    see a half-written file. The first two hash bytes pick the shard
+    directories, keeping directory sizes small for large corpora.
+    """
+
+    def __init__(
+            self,
+            data_dir: Path,
+            cache_dir: Path = THUMBNAIL_DIR,
+            sizes: Iterable[int] = THUMBNAIL_SIZES,
+            image_format: str = THUMBNAIL_FORMAT,
+            quality: int = THUMBNAIL_QUALITY
+    ):
+        """
+        Args:
+            data_dir (Path): Directory the source images are served from
+            cache_dir (Path): Root of the rendition cache
+            sizes (Iterable[int]): Allowed longest-edge sizes in pixels
+            image_format (str): 'webp' or 'jpeg'; WebP falls back to JPEG if Pillow lacks support
+
+        Raises:
+            ValueError: If image_format is unknown
+        """
+        if image_format not in MEDIA_TYPES:
+            raise ValueError(f"Unknown thumbnail format '{image_format}', expected one of {tuple(MEDIA_TYPES)}")
+        if image_format == "webp" and not features.check("webp"):
+            logger.warning("Pillow was built without WebP support; serving JPEG thumbnails")
+            image_format = "jpeg"
+
+        self.data_dir = Path(data_dir).resolve()
+        self.cache_dir = Path(cache_dir)
+        self.sizes = tuple(sorted(sizes))
+        self.image_format = image_format
+        self.quality = quality
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.image_format]
+
+    def source_path(self, relative_path: str) -> Path:
+        """
+        Resolve a URL path to a source image under data_dir.
+
+        Raises:
+            FileNotFoundError: If the path escapes data_dir or is not a file
+        """
+        source = (self.data_dir / relative_path).resolve()
+        if self.data_dir not in source.parents or not source.is_file():
+            raise FileNotFoundError(f"Image not found: {relative_path}")
+        return source
+
+    def get(self, relative_path: str, size: int) -> Tuple[Path, os.stat_result]:
+        """
+        Return the rendition of an image at the given size, generating it if needed.
+
+        Args:
+            relative_path (str): Image path relative to data_dir, as used in /images URLs
+            size (int): One of the configured sizes
+
+        Returns:
+            Tuple[Path, os.stat_result]: Rendition file and the stat of its source image
+
+        Raises:
+            FileNotFoundError: If the source image does not exist
+            ValueError: If size is not configured or the source is not a readable image
+        """
+        if size not in self.sizes:
+            raise ValueError(f"Unsupported thumbnail size {size}, expected one of {self.sizes}")
+
+        source = self.source_path(relative_path)
+        stat = source.stat()
+        key = f"{source.relative_to(self.data_dir).as_posix()}\x00{stat.st_mtime_ns}\x00{stat.st_size}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        extension = "webp" if self.image_format == "webp" else "jpg"
+        rendition = self.cache_dir / digest[:2] / digest[2:4] / f"{digest}_{size}.{extension}"
+
+        if not rendition.exists():
+            self._render(source, rendition, size)
+        return rendition, stat
+
+    def _render(self, source: Path, rendition: Path, size: int) -> None:
+        """Write a resized copy of source to rendition atomically."""
+        rendition.parent.mkdir(parents=True, exist_ok=True)
+        # A temporary name per render, so concurrent renders of one rendition never share a file
+        fd, tmp_name = tempfile.mkstemp(prefix=f"{rendition.name}.", suffix=".tmp", dir=rendition.parent)
+        os.close(fd)
+        tmp_path = Path(tmp_name)
+        try:
+            with Image.open(source) as image:
+                # Decode JPEGs at reduced resolution; thumbnail() then finishes the resize
+                image.draft("RGB", (size, size))
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                image.thumbnail((size, size), Image.LANCZOS)
+                image.save(tmp_path, format=self.image_format.upper(), quality=self.quality)
+            os.replace(tmp_path, rendition)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            tmp_path.unlink(missing_ok=True)
+            if rendition.exists():
+                # Another render of the same rendition finished first
+                return
+            raise ValueError(f"Cannot create thumbnail of {source}: {str(e)}") from e
@@ -0,0 +1,63 @@
+"""
+Find near-duplicate images in the on-disk index artifact.
+
+Groups images whose stored CLIP embeddings are closer than a cosine
+threshold and writes the groups next to the artifact. Searches asked to
+collapse duplicates then return only the best-scoring image of each group;
+the index itself is left untouched, so duplicates stay findable and
+incremental syncs keep working.
+
+Usage (from the repository root):
+    python -m backend.src.models.dedup                    # group with DEDUP_THRESHOLD
+    python -m backend.src.models.dedup --threshold 0.97   # stricter grouping
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Allow running as a script as well as with -m
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from backend.src.config import (
+    MODEL_NAME, DATA_DIR, INDEX_DIR, INDEX_TYPE, VECTOR_ENCODING, INDEX_SHARDS, SHARD_BY, DEDUP_THRESHOLD
+)
+from backend.src.models.index_factory import find_duplicate_groups
+from backend.src.models.index_store import load_index_artifact, save_duplicate_groups
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--index-dir", type=Path, default=INDEX_DIR)
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD, help="Cosine similarity of duplicates")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    artifact = load_index_artifact(
+        args.index_dir, MODEL_NAME, args.data_dir, INDEX_TYPE, read_only=True, vector_encoding=VECTOR_ENCODING,
+        num_shards=INDEX_SHARDS, shard_by=SHARD_BY
+    )
+    if artifact is None:
+        logger.error(f"No compatible index artifact in {args.index_dir}; build it with index_builder first")
+        return 1
+
+    groups = find_duplicate_groups(artifact.embeddings, artifact.paths.live_ids(), args.threshold)
+    save_duplicate_groups(args.index_dir, artifact.paths, groups, args.threshold)
+    grouped = int(np.count_nonzero(groups >= 0))
+    num_groups = int(groups.max()) + 1 if grouped else 0
+    logger.info(
+        f"Found {num_groups} groups of near-duplicates covering {grouped} of {artifact.paths.live_count} images; "
+        f"collapsing them hides {grouped - num_groups} images from search results"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import hashlib
+import logging
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from ..config import (
+    QUERY_CACHE_BACKEND,
+    QUERY_CACHE_MAX_BYTES,
+    QUERY_CACHE_TTL,
+    QUERY_CACHE_PATH,
+    REDIS_URL
+)
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry overhead of the key, OrderedDict node and ndarray header
+ENTRY_OVERHEAD_BYTES = 200
+
+# Shared-store values: wall-clock expiry (little-endian float64) followed by the float32 vector
+_EXPIRY = struct.Struct("<d")
+
+
+def normalize_query(query_text: str) -> str:
+    """Normalize a query so trivially different spellings share one cache entry."""
+    text = unicodedata.normalize("NFKC", query_text).casefold()
+    return " ".join(text.split())
+
+
+class SQLiteEmbeddingStore:
+    """Embedding store in a local SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._conn.commit()
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._prune(len(value))
+
+    def _prune(self, entry_bytes: int) -> None:
+        """Drop expired rows, then the soonest-to-expire rows beyond the byte budget."""
+        self._conn.execute("DELETE FROM embeddings WHERE expires_at <= ?", (time.time(),))
+        max_rows = max(1, self.max_bytes // max(1, entry_bytes))
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "SELECT key FROM embeddings ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (max_rows,)
+        )
+        self._conn.commit()
+
+
+class RedisEmbeddingStore:
+    """Embedding store in Redis (or any server speaking its protocol), shared across hosts."""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("QUERY_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._client.set(key, value, ex=max(1, int(ttl)))
+
+
+class EmbeddingCache:
+    """
+    Bounded, TTL-aware cache of normalized query embeddings.
+
+    An in-process LRU bounded by bytes sits in front of an optional shared
+    store, so a query encoded by any worker is reused by every other worker
+    and survives restarts. Shared values carry their expiry time, so an entry
+    copied into a worker's LRU expires when the original does instead of
+    getting a fresh TTL on every copy.
+    """
+
+    def __init__(
+            self,
+            namespace: str,
+            max_bytes: int = QUERY_CACHE_MAX_BYTES,
+            ttl: float = QUERY_CACHE_TTL,
+            store=None
+    ):
+        """
+        Args:
+            namespace (str): Prefix isolating entries, e.g. the model name
+            max_bytes (int): Memory budget of the in-process tier
+            ttl (float): Seconds an entry stays valid
+            store: Optional shared store with get(key) and set(key, value, ttl)
+        """
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, normalized: str) -> str:
+        digest = hashlib.sha1(f"{self.namespace}\x00{normalized}".encode("utf-8")).hexdigest()
+        return f"qemb2:{digest}"
+
+    def get(self, query_text: str) -> Optional[np.ndarray]:
+        """Return the cached (1, dim) embedding of a query, or None."""
+        return self.get_many([query_text]).get(normalize_query(query_text))
+
+    def get_many(self, query_texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Look up several queries at once.
+
+        Returns:
+            Dict[str, np.ndarray]: (1, dim) embeddings keyed by normalized query, for hits only
+        """
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for normalized in dict.fromkeys(normalize_query(text) for text in query_texts):
+                key = self._key(normalized)
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    found[normalized] = entry[0]
+                    self.hits += 1
+                else:
+                    if entry is not None:
+                        self._evict(key)
+                    missing.append(normalized)
+
+        for normalized in missing:
+            shared = self._get_shared(normalized)
+            if shared is not None:
+                vector, ttl = shared
+                found[normalized] = vector
+                self._put_local(normalized, vector, ttl)
+                with self._lock:
+                    self.shared_hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+        return found
+
+    def put(self, query_text: str, embedding: np.ndarray) -> None:
+        """Cache the embedding of a query in memory and in the shared store."""
+        normalized = normalize_query(query_text)
+        vector = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        vector.setflags(write=False)
+        self._put_local(normalized, vector, self.ttl)
+        if self.store is not None:
+            try:
+                value = _EXPIRY.pack(time.time() + self.ttl) + vector.tobytes()
+                self.store.set(self._key(normalized), value, self.ttl)
+            except Exception as e:
+                logger.warning(f"Failed to write query embedding to shared cache: {str(e)}")
+
+    def _get_shared(self, normalized: str) -> Optional[Tuple[np.ndarray, float]]:
+        """Read an entry from the shared store as (vector, seconds until it expires)."""
+        if self.store is None:
+            return None
+        try:
+            value = self.store.get(self._key(normalized))
+        except Exception as e:
+            logger.warning(f"Failed to read query embedding from shared cache: {str(e)}")
+            return None
+        if value is None or len(value) <= _EXPIRY.size:
+            return None
+        ttl = _EXPIRY.unpack_from(value)[0] - time.time()
+        if ttl <= 0:
+            return None
+        return np.frombuffer(value, dtype=np.float32, offset=_EXPIRY.size).reshape(1, -1), ttl
+
+    def _put_local(self, normalized: str, vector: np.ndarray, ttl: float) -> None:
+        key = self._key(normalized)
+        size = vector.nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (vector, time.monotonic() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _evict(self, key: str) -> None:
+        vector, _ = self._entries.pop(key)
+        self._bytes -= vector.nbytes + ENTRY_OVERHEAD_BYTES
+
+    def clear(self) -> None:
+        """Drop the in-process tier (the shared store is left untouched)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and memory use of the cache."""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+def create_query_cache(namespace: str, backend: str = QUERY_CACHE_BACKEND) -> EmbeddingCache:
+    """
+    Create the query-embedding cache selected by configuration.
+
+    Args:
+        namespace (str): Prefix isolating entries, e.g. the model name
+        backend (str): 'memory', 'sqlite' or 'redis'
+
+    Returns:
+        EmbeddingCache: Cache with the requested shared store
+
+    Raises:
+        ValueError: If backend is unknown
+    """
+    if backend == "memory":
+        store = None
+    elif backend == "sqlite":
+        store = SQLiteEmbeddingStore(QUERY_CACHE_PATH, QUERY_CACHE_MAX_BYTES * 4)
+    elif backend == "redis":
+        store = RedisEmbeddingStore(REDIS_URL)
+    else:
+        raise ValueError(f"Unknown query cache backend '{backend}', expected memory, sqlite or redis")
+    return EmbeddingCache(namespace, store=store)
@@ -0,0 +1,68 @@
+"""
+Build and maintain the on-disk index artifact served by worker processes.
+
+Run one builder next to any number of API workers started with
+SERVING_MODE=worker. The builder embeds the corpus once and writes the index,
+embedding matrix and manifest to INDEX_DIR; workers memory-map that artifact
+read-only and reload it whenever the builder replaces it.
+
+Usage (from the repository root):
+    python -m backend.src.models.index_builder            # build or refresh once
+    python -m backend.src.models.index_builder --watch 30 # keep refreshing every 30s
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+# Allow running as a script as well as with -m
+project_root = str(Path(__file__).parent.parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from backend.src.config import MODEL_NAME, DATA_DIR, INDEX_DIR, VALIDATION_CACHE_PATH, resolve_device
+from backend.src.data.data_loader import ImageDataset, ValidationCache
+from backend.src.models.retrieval_model import MultiModalRetrieval
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_index_artifact(model: MultiModalRetrieval, data_dir: Path, index_dir: Path) -> Dict[str, int]:
+    """
+    Bring the artifact in index_dir up to date with data_dir.
+
+    An existing compatible artifact is synced incrementally; otherwise the
+    index is built from scratch. Either way the result is saved atomically,
+    so workers never map a half-written artifact.
+
+    Returns:
+        Dict[str, int]: Counts of added, modified, deleted and failed images, and the index size
+    """
+    if model.index is None and not model.load_index(index_dir, data_dir):
+        dataset = ImageDataset(str(data_dir), validation_cache=ValidationCache(VALIDATION_CACHE_PATH))
+        model.build_index(dataset, index_dir=index_dir)
+        return {"added": model.num_images, "modified": 0, "deleted": 0, "failed": 0, "total": model.num_images}
+    return model.sync_index(index_dir)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--index-dir", type=Path, default=INDEX_DIR)
+    parser.add_argument("--watch", type=float, default=0, help="Seconds between refreshes; 0 runs once")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    model = MultiModalRetrieval(MODEL_NAME, resolve_device())
+    while True:
+        diff = refresh_index_artifact(model, args.data_dir, args.index_dir)
+        logger.info(f"Index artifact in {args.index_dir} is up to date: {diff}")
+        if args.watch <= 0:
+            return 0
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
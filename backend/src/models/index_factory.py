@@ -0,0 +1,782 @@
+import heapq
+import logging
+import math
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from ..config import (
+    IVF_NLIST,
+    PQ_M,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    NPROBE,
+    EF_SEARCH,
+    TRAIN_SAMPLE_SIZE,
+    VECTOR_ENCODING,
+    DEDUP_THRESHOLD
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+SHARD_MODES = ("hash", "directory")
+# Per-vector storage: 4, 2 or 1 bytes per dimension, or PQ_M bytes in total
+VECTOR_ENCODINGS = ("fp32", "fp16", "sq8", "pq")
+
+# FAISS wants roughly this many training points per IVF centroid / PQ code
+MIN_POINTS_PER_CENTROID = 39
+PQ_CODEBOOK_SIZE = 256
+
+
+def _ivf_nlist(n_vectors: int) -> int:
+    """Pick the number of IVF lists: IVF_NLIST if set, else ~4*sqrt(n), bounded by the training data."""
+    nlist = IVF_NLIST or int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest number of PQ sub-quantizers not above PQ_M that divides the dimension."""
+    m = max(1, min(PQ_M, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def index_description(index_type: str, dim: int, n_vectors: int, encoding: str = VECTOR_ENCODING) -> str:
+    """
+    Translate an index type and vector encoding into a FAISS index-factory string.
+
+    Every index is wrapped in IDMap2 so images can be added and removed by ID.
+    Corpora too small to train IVF or PQ fall back to an exact flat index, or
+    to int8 scalar quantization in place of PQ codes. ivf_pq always stores
+    PQ codes, whatever the encoding.
+
+    Args:
+        index_type (str): One of INDEX_TYPES
+        dim (int): Embedding dimension
+        n_vectors (int): Number of vectors the index will be trained on
+        encoding (str): One of VECTOR_ENCODINGS
+
+    Returns:
+        str: Index-factory description
+
+    Raises:
+        ValueError: If index_type or encoding is unknown
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    if encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"Unknown vector encoding '{encoding}', expected one of {VECTOR_ENCODINGS}")
+
+    if index_type in ("ivf_flat", "ivf_pq") and n_vectors < MIN_POINTS_PER_CENTROID * 2:
+        logger.warning(f"Only {n_vectors} vectors; too few to train {index_type}, using flat")
+        index_type = "flat"
+    if index_type == "ivf_pq" and n_vectors < PQ_CODEBOOK_SIZE:
+        logger.warning(f"Only {n_vectors} vectors; too few to train PQ codebooks, using ivf_flat")
+        index_type = "ivf_flat"
+
+    if encoding == "pq" and n_vectors < PQ_CODEBOOK_SIZE:
+        logger.warning(f"Only {n_vectors} vectors; too few to train PQ codebooks, using sq8")
+        encoding = "sq8"
+
+    codec = {"fp32": "Flat", "fp16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{_pq_subquantizers(dim)}x8"}[encoding]
+    if index_type == "flat":
+        return f"IDMap2,{codec}"
+    if index_type == "ivf_flat":
+        return f"IDMap2,IVF{_ivf_nlist(n_vectors)},{codec}"
+    if index_type == "ivf_pq":
+        return f"IDMap2,IVF{_ivf_nlist(n_vectors)},PQ{_pq_subquantizers(dim)}x8"
+    if encoding == "fp32":
+        return f"IDMap2,HNSW{HNSW_M}"
+    # HNSW keeps its graph separate from the vector storage, named without the 'x8'
+    return f"IDMap2,HNSW{HNSW_M}_{codec.replace('x8', '')}"
+
+
+def select_training_sample(vectors: np.ndarray, sample_size: int = TRAIN_SAMPLE_SIZE, seed: int = 0) -> np.ndarray:
+    """
+    Draw a uniform random training sample for IVF/PQ quantizers.
+
+    Row indices are sorted before the gather so memory-mapped embeddings are
+    read sequentially.
+
+    Args:
+        vectors (np.ndarray): Candidate vectors, one per row
+        sample_size (int): Maximum number of rows to sample
+        seed (int): Seed for reproducible sampling
+
+    Returns:
+        np.ndarray: Contiguous float32 training matrix
+    """
+    if len(vectors) <= sample_size:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    rows = np.sort(np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype=np.float32)
+
+
+def build_faiss_index(
+        index_type: str,
+        vectors: np.ndarray,
+        ids: np.ndarray,
+        train_sample_size: int = TRAIN_SAMPLE_SIZE,
+        encoding: str = VECTOR_ENCODING
+) -> faiss.Index:
+    """
+    Create, train and populate an ID-mapped inner-product index.
+
+    Args:
+        index_type (str): One of INDEX_TYPES
+        vectors (np.ndarray): L2-normalized float32 vectors
+        ids (np.ndarray): int64 ID per vector
+        train_sample_size (int): Maximum number of vectors used to train IVF/PQ quantizers
+        encoding (str): How vectors are stored, one of VECTOR_ENCODINGS
+
+    Returns:
+        faiss.Index: Populated index with default search parameters applied
+    """
+    description = index_description(index_type, vectors.shape[1], len(vectors), encoding)
+    index = faiss.index_factory(vectors.shape[1], description, faiss.METRIC_INNER_PRODUCT)
+
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        start_time = time.perf_counter()
+        sample = select_training_sample(vectors, train_sample_size)
+        index.train(sample)
+        logger.info(f"Trained {description} on {len(sample)} vectors in {time.perf_counter() - start_time:.1f}s")
+
+    index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+    apply_default_search_parameters(index)
+    logger.info(f"Built {description} index with {index.ntotal} vectors")
+    return index
+
+
+def exact_search(queries: np.ndarray, vectors: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exhaustive inner-product search over a subset of vectors.
+
+    Args:
+        queries (np.ndarray): (nq, d) float32 query matrix
+        vectors (np.ndarray): (n, d) float32 vectors to scan
+        ids (np.ndarray): ID of each row of vectors
+        k (int): Number of results per query
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (scores, ids) of shape (nq, k), -1 IDs marking empty slots
+    """
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    found = np.full((len(queries), k), -1, dtype=np.int64)
+    if len(ids):
+        fetch = min(k, len(ids))
+        subset_scores, rows = faiss.knn(
+            np.ascontiguousarray(queries, dtype=np.float32), np.ascontiguousarray(vectors), fetch,
+            metric=faiss.METRIC_INNER_PRODUCT
+        )
+        scores[:, :fetch] = subset_scores
+        found[:, :fetch] = np.where(rows >= 0, ids[np.maximum(rows, 0)], -1)
+    return scores, found
+
+
+class MemmapFlatIndex:
+    """
+    Exact inner-product search straight over a memory-mapped embedding matrix.
+
+    Reading a flat FAISS index copies every vector into private memory, even
+    with IO_FLAG_MMAP. Searching the memory-mapped embeddings with faiss.knn
+    instead lets every worker process share one copy through the OS page cache.
+    IDs are row numbers; rows of removed images are never returned.
+    """
+
+    is_trained = True
+
+    def __init__(self, vectors: np.ndarray, live: Optional[np.ndarray] = None):
+        """
+        Args:
+            vectors (np.ndarray): (n, d) float32 matrix, typically np.load(..., mmap_mode="r")
+            live (Optional[np.ndarray]): Boolean mask of rows that may be returned; all rows if None
+        """
+        self.vectors = vectors
+        self.d = vectors.shape[1]
+        self.removed = np.flatnonzero(~live) if live is not None else np.empty(0, dtype=np.int64)
+        self.ntotal = len(vectors) - len(self.removed)
+
+    def search(
+            self,
+            queries: np.ndarray,
+            k: int,
+            id_filter: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if id_filter is not None:
+            # Scan only the allowed rows; removed rows are never allowed
+            allowed = np.zeros(len(self.vectors), dtype=bool)
+            allowed[:min(len(id_filter), len(allowed))] = id_filter[:len(allowed)]
+            allowed[self.removed] = False
+            rows = np.flatnonzero(allowed)
+            return exact_search(queries, np.asarray(self.vectors[rows], dtype=np.float32), rows, k)
+
+        fetch = min(k + len(self.removed), len(self.vectors))
+        scores, ids = faiss.knn(
+            np.ascontiguousarray(queries, dtype=np.float32), self.vectors, fetch, metric=faiss.METRIC_INNER_PRODUCT
+        )
+        if len(self.removed):
+            # Over-fetch by the number of removed rows, then drop them row by row
+            kept_scores = np.full((len(ids), k), -np.inf, dtype=np.float32)
+            kept_ids = np.full((len(ids), k), -1, dtype=np.int64)
+            keep = ~np.isin(ids, self.removed)
+            for row in range(len(ids)):
+                row_ids = ids[row][keep[row]][:k]
+                kept_ids[row, :len(row_ids)] = row_ids
+                kept_scores[row, :len(row_ids)] = scores[row][keep[row]][:k]
+            return kept_scores, kept_ids
+        return scores[:, :k], ids[:, :k]
+
+
+def assign_shards(relative_paths: Sequence[str], num_shards: int, shard_by: str = "hash") -> np.ndarray:
+    """
+    Pick the shard of each image from its path, stably across processes and rebuilds.
+
+    Args:
+        relative_paths (Sequence[str]): Image paths relative to the data directory, '/'-separated
+        num_shards (int): Number of shards
+        shard_by (str): 'hash' spreads images evenly by path; 'directory' keeps each
+            top-level directory in one shard, so it can be rebuilt on its own
+
+    Returns:
+        np.ndarray: Shard number per path
+
+    Raises:
+        ValueError: If shard_by is unknown
+    """
+    if shard_by not in SHARD_MODES:
+        raise ValueError(f"Unknown shard mode '{shard_by}', expected one of {SHARD_MODES}")
+    if shard_by == "directory":
+        keys = (path.split("/", 1)[0] if "/" in path else "" for path in relative_paths)
+    else:
+        keys = iter(relative_paths)
+    return np.fromiter(
+        (zlib.crc32(key.encode("utf-8", "surrogateescape")) % num_shards for key in keys),
+        dtype=np.int32,
+        count=len(relative_paths)
+    )
+
+
+def merge_shard_results(
+        results: Sequence[Tuple[np.ndarray, np.ndarray]],
+        k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge per-shard top-k results into a global top-k with a k-way heap merge.
+
+    Args:
+        results (Sequence[Tuple[np.ndarray, np.ndarray]]): (scores, ids) per shard, each row sorted best first
+        k (int): Number of results to keep per query
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (scores, ids) of shape (nq, k), -1 IDs marking empty slots
+    """
+    num_queries = len(results[0][0])
+    scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+    ids = np.full((num_queries, k), -1, dtype=np.int64)
+    for query in range(num_queries):
+        # heapq.merge is ascending, so merge on negated scores
+        streams = [
+            zip((-shard_scores[query]).tolist(), shard_ids[query].tolist()) for shard_scores, shard_ids in results
+        ]
+        hits = (hit for hit in heapq.merge(*streams) if hit[1] >= 0)
+        for rank, (negated, idx) in enumerate(islice(hits, k)):
+            scores[query, rank] = -negated
+            ids[query, rank] = idx
+    return scores, ids
+
+
+class ShardedIndex:
+    """
+    Several ID-mapped indexes searched in parallel as one.
+
+    Each query fans out to every shard on a thread pool (FAISS releases the
+    GIL while searching) and the per-shard top-k lists are heap-merged, so
+    latency tracks the largest shard rather than the whole corpus. Every ID
+    lives in exactly one shard, recorded in `assignment`, so shards can be
+    rebuilt independently.
+    """
+
+    is_trained = True
+
+    def __init__(
+            self,
+            shards: List[faiss.Index],
+            assignment: np.ndarray,
+            index_type: str,
+            encoding: str = VECTOR_ENCODING
+    ):
+        """
+        Args:
+            shards (List[faiss.Index]): ID-mapped index per shard
+            assignment (np.ndarray): Shard number per ID, -1 for IDs never added
+            index_type (str): Index type each shard was built as, used to rebuild shards
+            encoding (str): Vector encoding each shard was built with
+        """
+        self.shards = shards
+        self.assignment = assignment.astype(np.int32)
+        self.index_type = index_type
+        self.encoding = encoding
+        self.d = shards[0].d
+        self._pool = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="index-shard")
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards)
+
+    def search(
+            self,
+            queries: np.ndarray,
+            k: int,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None,
+            id_filter: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Search every shard in parallel and merge their results."""
+        futures = [
+            self._pool.submit(search_index, shard, queries, k, nprobe, ef_search, id_filter)
+            for shard in self.shards if shard.ntotal > 0
+        ]
+        if not futures:
+            empty_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+            return empty_scores, np.full((len(queries), k), -1, dtype=np.int64)
+        return merge_shard_results([future.result() for future in futures], k)
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray, shards: np.ndarray) -> None:
+        """Add vectors to the given shard of each."""
+        if len(ids) and ids.max() >= len(self.assignment):
+            grown = np.full(int(ids.max()) + 1, -1, dtype=np.int32)
+            grown[:len(self.assignment)] = self.assignment
+            self.assignment = grown
+        self.assignment[ids] = shards
+        for shard in np.unique(shards):
+            rows = shards == shard
+            self.shards[shard].add_with_ids(np.ascontiguousarray(vectors[rows]), ids[rows])
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        """
+        Remove IDs from the shards holding them.
+
+        Raises:
+            RuntimeError: If a shard can't delete (HNSW); rebuild the shards in shards_of(ids)
+        """
+        removed = 0
+        owners = self.assignment[ids]
+        for shard in np.unique(owners):
+            removed += self.shards[shard].remove_ids(ids[owners == shard])
+        return removed
+
+    def shards_of(self, ids: np.ndarray) -> np.ndarray:
+        """Distinct shards holding the given IDs."""
+        return np.unique(self.assignment[ids])
+
+    def rebuild_shard(self, shard: int, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """Replace one shard with a fresh index over the given vectors, leaving the others untouched."""
+        rebuilt = build_faiss_index(self.index_type, vectors, ids, encoding=self.encoding)
+        apply_default_search_parameters(rebuilt)
+        self.assignment[ids] = shard
+        self.shards[shard] = rebuilt
+
+
+def remap_ids(index, new_ids: np.ndarray) -> None:
+    """
+    Renumber the IDs of an ID-mapped or sharded index in place, without touching its vectors.
+
+    Args:
+        index: IndexIDMap2 or ShardedIndex
+        new_ids (np.ndarray): New number of each old ID, -1 for IDs no longer in the index
+    """
+    if isinstance(index, ShardedIndex):
+        for shard in index.shards:
+            remap_ids(shard, new_ids)
+        old_ids = np.flatnonzero(new_ids[:len(index.assignment)] >= 0)
+        assignment = np.full(int(new_ids.max()) + 1 if len(old_ids) else 0, -1, dtype=np.int32)
+        assignment[new_ids[old_ids]] = index.assignment[old_ids]
+        index.assignment = assignment
+        return
+    id_map = faiss.vector_to_array(index.id_map)
+    faiss.copy_array_to_vector(np.ascontiguousarray(new_ids[id_map], dtype=np.int64), index.id_map)
+    index.construct_rev_map()
+
+
+def build_sharded_index(
+        index_type: str,
+        vectors: np.ndarray,
+        ids: np.ndarray,
+        shards: np.ndarray,
+        num_shards: int,
+        encoding: str = VECTOR_ENCODING
+) -> ShardedIndex:
+    """
+    Build one index per shard, in parallel.
+
+    Args:
+        index_type (str): One of INDEX_TYPES, used for every shard
+        vectors (np.ndarray): L2-normalized float32 vectors
+        ids (np.ndarray): int64 ID per vector
+        shards (np.ndarray): Shard number per vector, e.g. from assign_shards
+        num_shards (int): Number of shards
+        encoding (str): How vectors are stored, one of VECTOR_ENCODINGS
+
+    Returns:
+        ShardedIndex: Populated shards with default search parameters applied
+    """
+    def build(shard: int) -> faiss.Index:
+        rows = np.flatnonzero(shards == shard)
+        return build_faiss_index(index_type, np.ascontiguousarray(vectors[rows]), ids[rows], encoding=encoding)
+
+    with ThreadPoolExecutor(max_workers=num_shards) as pool:
+        built = list(pool.map(build, range(num_shards)))
+
+    assignment = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int32)
+    assignment[ids] = shards
+    logger.info(f"Built {num_shards} shards with {[shard.ntotal for shard in built]} vectors")
+    return ShardedIndex(built, assignment, index_type, encoding)
+
+
+def apply_default_search_parameters(index: faiss.Index) -> None:
+    """Set the configured nprobe/efSearch on the index so plain index.search uses them."""
+    if isinstance(index, ShardedIndex):
+        for shard in index.shards:
+            apply_default_search_parameters(shard)
+        return
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = NPROBE
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = EF_SEARCH
+
+
+def describe_index(index: faiss.Index) -> str:
+    """Short index type name of a built index, matching INDEX_TYPES."""
+    if isinstance(index, ShardedIndex):
+        return index.index_type
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def index_encoding(index) -> str:
+    """How a built index stores its vectors, matching VECTOR_ENCODINGS."""
+    if isinstance(index, ShardedIndex):
+        return index_encoding(max(index.shards, key=lambda shard: shard.ntotal))
+    if not isinstance(index, faiss.Index):
+        return "fp32"  # MemmapFlatIndex
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "fp32"
+
+
+def rerank_exact(
+        queries: np.ndarray,
+        candidate_ids: np.ndarray,
+        vectors: np.ndarray,
+        k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Re-score approximate candidates by exact inner product and keep the best k.
+
+    Candidate rows are gathered once, in sorted order, so a memory-mapped
+    matrix is read mostly sequentially however the candidates are ranked.
+
+    Args:
+        queries (np.ndarray): (nq, d) float32 query matrix
+        candidate_ids (np.ndarray): (nq, n) row numbers of vectors to re-score, -1 for empty slots
+        vectors (np.ndarray): Full-precision vectors, e.g. the memory-mapped embedding matrix
+        k (int): Number of results to keep per query
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (scores, ids) of shape (nq, k), -1 IDs marking empty slots
+    """
+    flat_ids = candidate_ids.reshape(-1)
+    valid = flat_ids >= 0
+    unique_ids, inverse = np.unique(flat_ids[valid], return_inverse=True)
+    gathered = np.asarray(vectors[unique_ids], dtype=np.float32)
+    query_rows = np.repeat(np.arange(len(candidate_ids)), candidate_ids.shape[1])[valid]
+
+    flat_scores = np.full(flat_ids.shape, -np.inf, dtype=np.float32)
+    flat_scores[valid] = np.einsum("ij,ij->i", queries[query_rows], gathered[inverse])
+    scores = flat_scores.reshape(candidate_ids.shape)
+
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    top_scores = np.take_along_axis(scores, order, axis=1)
+    top_ids = np.where(np.isfinite(top_scores), np.take_along_axis(candidate_ids, order, axis=1), -1)
+    return top_scores, top_ids
+
+
+def find_duplicate_groups(
+        embeddings: np.ndarray,
+        ids: np.ndarray,
+        threshold: float = DEDUP_THRESHOLD,
+        batch_size: int = 4096
+) -> np.ndarray:
+    """
+    Group vectors connected by pairs more similar than threshold.
+
+    Every vector is range-searched against all others in an exact
+    inner-product index, batch by batch, and similar pairs are merged into
+    connected components. Grouping is transitive, so a chain of near
+    duplicates ends up in one group; keep the threshold high.
+
+    Args:
+        embeddings (np.ndarray): Normalized float32 embeddings, one row per ID
+        ids (np.ndarray): IDs (rows of embeddings) to group, e.g. the live ones
+        threshold (float): Cosine similarity above which two images are duplicates
+        batch_size (int): Queries per range search, bounding memory use
+
+    Returns:
+        np.ndarray: Group number per row of embeddings, -1 for rows without duplicates
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    groups = np.full(len(embeddings), -1, dtype=np.int64)
+    if len(ids) < 2:
+        return groups
+
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(np.ascontiguousarray(embeddings[ids], dtype=np.float32))
+    first, second = [], []
+    for start in range(0, len(ids), batch_size):
+        queries = np.ascontiguousarray(embeddings[ids[start:start + batch_size]], dtype=np.float32)
+        lims, _, neighbours = index.range_search(queries, threshold)
+        rows = np.repeat(np.arange(start, start + len(queries)), np.diff(lims).astype(np.int64))
+        pairs = rows < neighbours  # Drop self-matches and the mirrored copy of each pair
+        first.append(rows[pairs])
+        second.append(neighbours[pairs])
+    first, second = np.concatenate(first), np.concatenate(second)
+    if len(first) == 0:
+        return groups
+
+    # Connected components by label propagation: every row takes the smallest
+    # label among its neighbours until no label changes
+    labels = np.arange(len(ids))
+    while True:
+        smallest = np.minimum(labels[first], labels[second])
+        updated = labels.copy()
+        np.minimum.at(updated, first, smallest)
+        np.minimum.at(updated, second, smallest)
+        updated = updated[updated]  # Follow labels to their own labels, halving chains
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+
+    grouped = np.zeros(len(ids), dtype=bool)
+    grouped[first] = grouped[second] = True
+    _, numbers = np.unique(labels[grouped], return_inverse=True)
+    groups[ids[grouped]] = numbers
+    return groups
+
+
+def collapse_duplicates(
+        scores: np.ndarray,
+        ids: np.ndarray,
+        groups: np.ndarray,
+        k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keep only the best-scoring hit of each duplicate group per query.
+
+    Args:
+        scores (np.ndarray): (nq, n) scores, best first
+        ids (np.ndarray): (nq, n) IDs, -1 marking empty slots
+        groups (np.ndarray): Group number per ID, -1 for IDs without duplicates; IDs past its end have none
+        k (int): Results to keep per query
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (scores, ids) of shape (nq, k), -1 IDs marking empty slots
+    """
+    collapsed_scores = np.full((len(ids), k), -np.inf, dtype=np.float32)
+    collapsed_ids = np.full((len(ids), k), -1, dtype=np.int64)
+    for row, (row_scores, row_ids) in enumerate(zip(scores, ids)):
+        valid = row_ids >= 0
+        row_scores, row_ids = row_scores[valid], row_ids[valid]
+        group = np.full(len(row_ids), -1, dtype=np.int64)
+        known = row_ids < len(groups)
+        group[known] = groups[row_ids[known]]
+        # Images without duplicates get a key of their own, distinct from every group number
+        keys = np.where(group >= 0, group, -2 - row_ids)
+        _, first = np.unique(keys, return_index=True)
+        keep = np.sort(first)[:k]
+        collapsed_scores[row, :len(keep)] = row_scores[keep]
+        collapsed_ids[row, :len(keep)] = row_ids[keep]
+    return collapsed_scores, collapsed_ids
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """
+    Estimate the resident size of an index from its codes, IDs and graph links.
+
+    Cheap enough to call on every metrics scrape, unlike serializing the index.
+    """
+    if isinstance(index, ShardedIndex):
+        return sum(index_memory_bytes(shard) for shard in index.shards) + index.assignment.nbytes
+    total = 0
+    inner = index
+    if hasattr(index, "id_map"):
+        total += index.ntotal * 8
+        inner = faiss.downcast_index(index.index)
+
+    if isinstance(inner, faiss.IndexHNSW):
+        storage = faiss.downcast_index(inner.storage)
+        total += storage.code_size * storage.ntotal
+        total += inner.hnsw.neighbors.size() * 4 + inner.hnsw.offsets.size() * 8
+    elif isinstance(inner, faiss.IndexIVF):
+        total += (inner.code_size + 8) * inner.ntotal
+        total += inner.quantizer.ntotal * inner.d * 4
+        if isinstance(inner, faiss.IndexIVFPQ):
+            total += inner.pq.centroids.size() * 4
+    elif hasattr(inner, "code_size"):
+        total += inner.code_size * inner.ntotal
+    return total
+
+
+def search_index(
+        index: faiss.Index,
+        queries: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        id_filter: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search an ID-mapped index with per-call runtime parameters.
+
+    IndexIDMap2 in FAISS 1.7 rejects search parameters, so the wrapped index is
+    searched directly and its row labels are translated through the ID map.
+    Parameters are passed per call rather than set on the shared index, which
+    keeps concurrent requests with different knobs independent.
+
+    A filter is applied inside the search: the ID mask is translated through
+    the ID map into a bitmap over the wrapped index's rows and passed as an
+    IDSelectorBitmap, so filtered searches return full result lists instead
+    of post-filtering a short one. IndexPQ ignores selectors, so there the
+    decoded codes of the allowed rows are scanned instead.
+
+    Args:
+        index (faiss.Index): ID-mapped index
+        queries (np.ndarray): float32 query matrix
+        k (int): Number of neighbours per query
+        nprobe (Optional[int]): IVF lists to probe, defaults to the index setting
+        ef_search (Optional[int]): HNSW candidate list size, defaults to the index setting
+        id_filter (Optional[np.ndarray]): Boolean mask indexed by ID; only IDs set in it are returned
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (scores, ids), -1 IDs marking empty slots
+    """
+    if isinstance(index, ShardedIndex):
+        return index.search(queries, k, nprobe=nprobe, ef_search=ef_search, id_filter=id_filter)
+    if isinstance(index, MemmapFlatIndex):
+        return index.search(queries, k, id_filter)
+    if not hasattr(index, "id_map"):
+        return index.search(queries, k)
+
+    inner = faiss.downcast_index(index.index)
+    id_map = faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+    selector = bitmap = None
+    if id_filter is not None:
+        allowed = np.zeros(len(id_map), dtype=bool)
+        known = id_map < len(id_filter)
+        allowed[known] = id_filter[id_map[known]]
+        if isinstance(inner, faiss.IndexPQ):
+            rows = np.flatnonzero(allowed)
+            codes = faiss.vector_to_array(inner.codes).reshape(-1, inner.code_size)[rows]
+            vectors = inner.sa_decode(codes) if len(rows) else np.empty((0, inner.d), dtype=np.float32)
+            return exact_search(queries, vectors, id_map[rows], k)
+        # The bitmap must outlive the search; the selector only points into it
+        bitmap = np.packbits(allowed, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+
+    params = None
+    if isinstance(inner, faiss.IndexIVF) and (nprobe is not None or selector is not None):
+        params = faiss.SearchParametersIVF(nprobe=nprobe if nprobe is not None else inner.nprobe)
+    elif isinstance(inner, faiss.IndexHNSW) and (ef_search is not None or selector is not None):
+        params = faiss.SearchParametersHNSW(efSearch=ef_search if ef_search is not None else inner.hnsw.efSearch)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+
+    if params is None:
+        return index.search(queries, k)
+    if selector is not None:
+        params.sel = selector
+
+    scores, labels = inner.search(queries, k, params=params)
+    ids = np.where(labels >= 0, id_map[np.maximum(labels, 0)], -1)
+    return scores, ids
+
+
+def recall_at_k(
+        index: faiss.Index,
+        vectors: np.ndarray,
+        ids: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        rerank_factor: int = 0
+) -> Dict[str, float]:
+    """
+    Measure recall@k and latency of an index against exhaustive search.
+
+    Args:
+        index (faiss.Index): Index under test
+        vectors (np.ndarray): The indexed vectors, used for the exact baseline
+        ids (np.ndarray): ID of each row of vectors, in ascending order
+        queries (np.ndarray): float32 query matrix
+        k (int): Number of neighbours compared per query
+        nprobe (Optional[int]): IVF lists to probe
+        ef_search (Optional[int]): HNSW candidate list size
+        rerank_factor (int): If positive, re-score rerank_factor * k candidates exactly against vectors
+
+    Returns:
+        Dict[str, float]: recall@k and mean per-query latency (ms) of the index and of the flat baseline
+    """
+    k = min(k, len(vectors))
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    start_time = time.perf_counter()
+    _, exact_rows = faiss.knn(queries, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+    flat_ms = (time.perf_counter() - start_time) * 1000 / len(queries)
+
+    start_time = time.perf_counter()
+    fetch = min(k * rerank_factor, index.ntotal) if rerank_factor > 0 else k
+    _, approx_ids = search_index(index, queries, fetch, nprobe=nprobe, ef_search=ef_search)
+    if rerank_factor > 0:
+        rows = np.where(approx_ids >= 0, np.searchsorted(ids, approx_ids), -1)
+        _, rows = rerank_exact(queries, rows, vectors, k)
+        approx_ids = np.where(rows >= 0, ids[np.maximum(rows, 0)], -1)
+    index_ms = (time.perf_counter() - start_time) * 1000 / len(queries)
+
+    exact_ids = ids[exact_rows]
+    hits = sum(len(np.intersect1d(exact, approx)) for exact, approx in zip(exact_ids, approx_ids))
+
+    return {
+        "index_type": describe_index(index),
+        "vector_encoding": index_encoding(index),
+        "rerank_factor": rerank_factor,
+        "k": k,
+        "num_queries": len(queries),
+        "nprobe": nprobe if nprobe is not None else NPROBE,
+        "ef_search": ef_search if ef_search is not None else EF_SEARCH,
+        "recall_at_k": hits / (k * len(queries)),
+        "index_latency_ms": index_ms,
+        "flat_latency_ms": flat_ms,
+    }
@@ -0,0 +1,378 @@
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+import logging
+
+import faiss
+import numpy as np
+
+from .index_factory import MemmapFlatIndex, ShardedIndex
+from ..data.attribute_store import AttributeStore
+from ..data.path_store import PathStore
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the on-disk layout changes so stale artifacts are rebuilt
+INDEX_FORMAT_VERSION = 4
+
+INDEX_FILE = "index.faiss"
+EMBEDDINGS_FILE = "embeddings.npy"
+PATHS_FILE = "paths.npz"
+ATTRIBUTES_FILE = "attributes.npz"
+SHARD_ASSIGNMENT_FILE = "shards.npy"
+MANIFEST_FILE = "manifest.json"
+# Written by the dedup job, not by saves; groups are keyed by path, so they survive rebuilds
+DUPLICATES_FILE = "duplicates.npz"
+
+Fingerprint = Tuple[float, int]
+
+
+@dataclass
+class IndexArtifact:
+    """In-memory view of a persisted index."""
+    index: faiss.Index
+    embeddings: np.ndarray
+    paths: PathStore
+    attributes: AttributeStore
+    manifest: dict
+
+
+def file_fingerprint(path: str) -> Fingerprint:
+    """Return the (mtime, size) fingerprint of a file."""
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+def shard_file(shard: int) -> str:
+    """File name of one shard of a sharded index."""
+    return f"index.shard{shard}.faiss"
+
+
+def _replace_atomically(tmp_path: Path, final_path: Path) -> None:
+    """Flush a temporary file to disk and move it over its final name."""
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, final_path)
+
+
+def write_embeddings(
+        path: Path,
+        embeddings: np.ndarray,
+        rows: Optional[np.ndarray] = None,
+        chunk_rows: int = 65536
+) -> None:
+    """
+    Write embedding rows to a .npy file in chunks, so a mapped matrix is never read into memory whole.
+
+    Args:
+        path (Path): File to write
+        embeddings (np.ndarray): (n, d) embedding matrix, in memory or mapped
+        rows (Optional[np.ndarray]): Rows to write, in order; None writes every row
+        chunk_rows (int): Rows copied per chunk
+    """
+    count = len(embeddings) if rows is None else len(rows)
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(count, embeddings.shape[1]))
+    for start in range(0, count, chunk_rows):
+        stop = min(start + chunk_rows, count)
+        out[start:stop] = embeddings[start:stop] if rows is None else embeddings[rows[start:stop]]
+    out.flush()
+    del out
+
+
+def append_embeddings(embeddings: np.memmap, rows: np.ndarray) -> np.memmap:
+    """
+    Append rows to the .npy file behind a mapped embedding matrix and map the grown file.
+
+    New rows are written right after the mapped ones and the header's row
+    count is updated in place; numpy pads .npy headers so the first axis can
+    grow without moving the data. Readers that mapped the file earlier keep
+    seeing their rows unchanged, and rows past the manifest's row count are
+    ignored on load, so a crash before the next save loses nothing.
+
+    Args:
+        embeddings (np.memmap): Matrix mapped read-only from a .npy file
+        rows (np.ndarray): (m, d) float32 rows to append
+
+    Returns:
+        np.memmap: Read-only map of the grown matrix
+    """
+    path = embeddings.filename
+    shape = (len(embeddings) + len(rows), embeddings.shape[1])
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0):
+            raise ValueError(f"Cannot append to .npy format {version} in {path}")
+        np.lib.format.read_array_header_1_0(f)
+        data_start = f.tell()
+        f.seek(0)
+        np.lib.format.write_array_header_1_0(
+            f, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False, "shape": shape}
+        )
+        if f.tell() != data_start:
+            raise ValueError(f"Header of {path} has no room to grow")
+        f.seek(data_start + embeddings.nbytes)
+        f.write(np.ascontiguousarray(rows, dtype=np.float32).tobytes())
+        f.truncate()
+    return np.load(path, mmap_mode="r")
+
+
+def save_index_artifact(
+        directory: Path,
+        index: faiss.Index,
+        embeddings: np.ndarray,
+        paths: PathStore,
+        attributes: AttributeStore,
+        model_name: str,
+        data_dir: Path,
+        index_type: str,
+        vector_encoding: str = "fp32",
+        shard_by: str = "hash",
+        embedding_rows: Optional[np.ndarray] = None
+) -> None:
+    """
+    Persist the index, its embedding matrix, the path store with its fingerprints and the image metadata to disk.
+
+    Every file is written under a temporary name first; the manifest is moved
+    into place last, so a crash mid-write leaves an artifact that fails
+    validation on load instead of a silently inconsistent one.
+
+    Args:
+        directory (Path): Directory to write the artifact to
+        index (faiss.Index): ID-mapped index to persist
+        embeddings (np.ndarray): Normalized float32 embeddings, one row per index ID
+        paths (PathStore): Image path and (mtime, size) per index ID
+        attributes (AttributeStore): Image metadata per index ID, for filtered search
+        model_name (str): Name of the model that produced the embeddings
+        data_dir (Path): Image directory the corpus was built from
+        index_type (str): Configured index type the index was built as
+        vector_encoding (str): Configured encoding the index stores vectors in
+        shard_by (str): How images of a ShardedIndex were assigned to shards
+        embedding_rows (Optional[np.ndarray]): Rows of embeddings to save, in ID order; None saves every row
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # (temporary, final) name of every index file; a sharded index writes one per shard
+    index_files = []
+    if isinstance(index, ShardedIndex):
+        for shard, shard_index in enumerate(index.shards):
+            index_files.append((directory / f"{shard_file(shard)}.tmp", directory / shard_file(shard)))
+            faiss.write_index(shard_index, str(index_files[-1][0]))
+        index_files.append((directory / f"{SHARD_ASSIGNMENT_FILE}.tmp", directory / SHARD_ASSIGNMENT_FILE))
+        with open(index_files[-1][0], "wb") as f:
+            np.save(f, index.assignment)
+    else:
+        index_files.append((directory / f"{INDEX_FILE}.tmp", directory / INDEX_FILE))
+        faiss.write_index(index, str(index_files[-1][0]))
+
+    tmp_embeddings = directory / f"{EMBEDDINGS_FILE}.tmp"
+    write_embeddings(tmp_embeddings, embeddings, embedding_rows)
+
+    tmp_paths = directory / f"{PATHS_FILE}.tmp"
+    with open(tmp_paths, "wb") as f:
+        paths.save(f)
+
+    tmp_attributes = directory / f"{ATTRIBUTES_FILE}.tmp"
+    with open(tmp_attributes, "wb") as f:
+        attributes.save(f)
+
+    manifest = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "model_name": model_name,
+        "data_dir": str(data_dir),
+        "index_type": index_type,
+        "vector_encoding": vector_encoding,
+        "shards": len(index.shards) if isinstance(index, ShardedIndex) else 1,
+        "shard_by": shard_by,
+        "dimension": int(embeddings.shape[1]),
+        "count": int(index.ntotal),
+        "rows": len(paths),
+    }
+    tmp_manifest = directory / f"{MANIFEST_FILE}.tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    for tmp_path, final_path in index_files:
+        _replace_atomically(tmp_path, final_path)
+    _replace_atomically(tmp_embeddings, directory / EMBEDDINGS_FILE)
+    _replace_atomically(tmp_paths, directory / PATHS_FILE)
+    _replace_atomically(tmp_attributes, directory / ATTRIBUTES_FILE)
+    _replace_atomically(tmp_manifest, directory / MANIFEST_FILE)
+
+    logger.info(f"Saved index with {index.ntotal} images to {directory}")
+
+
+def artifact_stamp(directory: Path) -> Optional[int]:
+    """Modification time (ns) of the artifact's manifest, which is replaced last on every save."""
+    try:
+        return os.stat(Path(directory) / MANIFEST_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def save_duplicate_groups(directory: Path, paths: PathStore, groups: np.ndarray, threshold: float) -> None:
+    """
+    Write near-duplicate groups next to an index artifact.
+
+    Args:
+        directory (Path): Directory holding the artifact
+        paths (PathStore): Path store the group numbers are indexed by
+        groups (np.ndarray): Group number per ID, -1 for images without duplicates
+        threshold (float): Cosine similarity the groups were found with
+    """
+    members = np.flatnonzero(groups >= 0)
+    tmp_path = Path(directory) / f"{DUPLICATES_FILE}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            paths=np.array([paths.relative(idx) for idx in members.tolist()], dtype=str),
+            groups=groups[members],
+            threshold=np.float32(threshold)
+        )
+    _replace_atomically(tmp_path, Path(directory) / DUPLICATES_FILE)
+    logger.info(f"Saved {len(np.unique(groups[members]))} duplicate groups to {directory}")
+
+
+def duplicates_stamp(directory: Path) -> Optional[int]:
+    """Modification time (ns) of the duplicate groups file, None if the dedup job has not run."""
+    try:
+        return os.stat(Path(directory) / DUPLICATES_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_duplicate_groups(directory: Path, paths: PathStore) -> Optional[np.ndarray]:
+    """
+    Read near-duplicate groups and map them onto the IDs of a path store.
+
+    Images that are no longer indexed are skipped; images indexed since the
+    dedup job ran have no group.
+
+    Args:
+        directory (Path): Directory holding the artifact
+        paths (PathStore): Path store to map the grouped images onto
+
+    Returns:
+        Optional[np.ndarray]: Group number per ID, -1 for images without duplicates, or None if there is no file
+    """
+    path = Path(directory) / DUPLICATES_FILE
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as arrays:
+            relative_paths = arrays["paths"].tolist()
+            member_groups = arrays["groups"].astype(np.int64)
+    except Exception as e:
+        logger.warning(f"Failed to load duplicate groups from {directory}: {str(e)}")
+        return None
+
+    ids = paths.find_many([paths.data_dir / relative for relative in relative_paths])
+    groups = np.full(len(paths), -1, dtype=np.int64)
+    found = ids >= 0
+    groups[ids[found]] = member_groups[found]
+    return groups
+
+
+def load_index_artifact(
+        directory: Path,
+        model_name: str,
+        data_dir: Path,
+        index_type: str,
+        read_only: bool = False,
+        vector_encoding: str = "fp32",
+        num_shards: int = 1,
+        shard_by: str = "hash"
+) -> Optional[IndexArtifact]:
+    """
+    Load a persisted index if it exists and is compatible with the current configuration.
+
+    The embedding matrix is memory-mapped rather than read, so loading cost
+    is dominated by the index itself. In read-only mode the index is mapped
+    too (IO_FLAG_MMAP), and an uncompressed flat index is replaced by exact
+    search over the mapped embeddings, so processes serving the same artifact
+    share its pages. faiss 1.7.4 only maps IVF inverted lists, though: HNSW
+    graphs and flat codes read from a FAISS file are copied into each
+    process.
+
+    Args:
+        directory (Path): Directory the artifact was written to
+        model_name (str): Model the caller will embed queries with
+        data_dir (Path): Image directory the caller serves
+        index_type (str): Index type the caller is configured for
+        read_only (bool): Map the artifact for serving only; the index cannot be modified
+        vector_encoding (str): Vector encoding the caller is configured for
+        num_shards (int): Number of index shards the caller is configured for
+        shard_by (str): Shard assignment the caller is configured for
+
+    Returns:
+        Optional[IndexArtifact]: The loaded artifact, or None if it is missing or incompatible
+    """
+    directory = Path(directory)
+    manifest_path = directory / MANIFEST_FILE
+    if not manifest_path.exists():
+        logger.info(f"No index artifact found in {directory}")
+        return None
+
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+            logger.info(f"Index artifact format {manifest.get('format_version')} is outdated")
+            return None
+        if manifest.get("model_name") != model_name:
+            logger.info(f"Index artifact was built with {manifest.get('model_name')}, not {model_name}")
+            return None
+        if Path(manifest.get("data_dir", "")) != Path(data_dir):
+            logger.info(f"Index artifact was built from {manifest.get('data_dir')}, not {data_dir}")
+            return None
+        if manifest.get("index_type", "flat") != index_type:
+            logger.info(f"Index artifact is a {manifest.get('index_type', 'flat')} index, not {index_type}")
+            return None
+        if manifest.get("vector_encoding", "fp32") != vector_encoding:
+            logger.info(
+                f"Index artifact stores {manifest.get('vector_encoding', 'fp32')} vectors, not {vector_encoding}"
+            )
+            return None
+        if manifest.get("shards", 1) != num_shards or (num_shards > 1 and manifest.get("shard_by") != shard_by):
+            logger.info(
+                f"Index artifact has {manifest.get('shards', 1)} shards by {manifest.get('shard_by')}, "
+                f"not {num_shards} by {shard_by}"
+            )
+            return None
+
+        # Rows appended by a sync that never reached its save are ignored
+        embeddings = np.load(directory / EMBEDDINGS_FILE, mmap_mode="r")[:manifest["rows"]]
+        paths = PathStore.load(directory / PATHS_FILE, data_dir)
+        attributes = AttributeStore.load(directory / ATTRIBUTES_FILE)
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if read_only else 0
+        if num_shards > 1:
+            index = ShardedIndex(
+                [faiss.read_index(str(directory / shard_file(shard)), io_flags) for shard in range(num_shards)],
+                np.load(directory / SHARD_ASSIGNMENT_FILE),
+                index_type,
+                vector_encoding
+            )
+        elif read_only and index_type == "flat" and vector_encoding == "fp32":
+            index = MemmapFlatIndex(embeddings, paths.live)
+        else:
+            index = faiss.read_index(str(directory / INDEX_FILE), io_flags)
+
+        if index.ntotal != manifest["count"] or index.ntotal != paths.live_count \
+                or len(paths) != manifest["rows"] or len(attributes) != len(paths) \
+                or embeddings.shape != (len(paths), manifest["dimension"]):
+            logger.warning(f"Index artifact in {directory} is inconsistent; ignoring it")
+            return None
+        if read_only and not index_type.startswith("ivf") and not isinstance(index, MemmapFlatIndex):
+            logger.info(
+                f"faiss cannot map {index_type} indexes; this process holds its own copy of the index "
+                f"(the embeddings are still shared)"
+            )
+
+        return IndexArtifact(index, embeddings, paths, attributes, manifest)
+
+    except Exception as e:
+        logger.warning(f"Failed to load index artifact from {directory}: {str(e)}")
+        return None
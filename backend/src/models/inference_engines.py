@@ -0,0 +1,276 @@
+import copy
+import logging
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import torch
+
+from ..config import IMAGE_SIZE, ONNX_DIR
+
+logger = logging.getLogger(__name__)
+
+# Engines that can run the CLIP text and vision towers
+INFERENCE_ENGINES = ("eager", "int8", "torchscript", "compile", "onnx")
+
+# CLIP's context length; shape-specialized engines pad every query to it
+CLIP_MAX_TOKENS = 77
+
+
+class _TextTower(torch.nn.Module):
+    """Text tower of a CLIP model as a standalone module, for tracing, compiling and export."""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class _VisionTower(torch.nn.Module):
+    """Vision tower of a CLIP model as a standalone module, for tracing, compiling and export."""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+def _example_inputs(text_length: int, image_size: int):
+    input_ids = torch.zeros((1, text_length), dtype=torch.long)
+    attention_mask = torch.ones((1, text_length), dtype=torch.long)
+    pixel_values = torch.zeros((1, 3, image_size, image_size), dtype=torch.float32)
+    return input_ids, attention_mask, pixel_values
+
+
+class TorchEngine:
+    """
+    Runs both towers of a PyTorch CLIP model in eager mode, the fp32 reference.
+
+    Engines share one interface: encode_text and encode_image take the
+    processor's tensors and return unnormalized features.
+    """
+
+    name = "eager"
+    # Token length every text batch is padded to, for engines specialized to
+    # fixed shapes; None pads to the longest text of each batch
+    text_length: Optional[int] = None
+
+    def __init__(self, model: torch.nn.Module):
+        self.model = model
+
+    def encode_text(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    def encode_image(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class DynamicInt8Engine(TorchEngine):
+    """
+    Linear layers quantized to int8 weights, with activations quantized on the fly.
+
+    CLIP's towers spend most of their time in Linear layers, which run on
+    int8 kernels while the rest of the model stays fp32. CPU only; the fp32
+    model is copied, not modified.
+    """
+
+    name = "int8"
+
+    def __init__(self, model: torch.nn.Module):
+        quantized = torch.ao.quantization.quantize_dynamic(
+            copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(quantized)
+
+
+class TorchScriptEngine(TorchEngine):
+    """Both towers traced and frozen with TorchScript, so they run without Python overhead."""
+
+    name = "torchscript"
+    text_length = CLIP_MAX_TOKENS
+
+    def __init__(self, model: torch.nn.Module, image_size: int = IMAGE_SIZE):
+        super().__init__(model)
+        input_ids, attention_mask, pixel_values = _example_inputs(self.text_length, image_size)
+        with torch.no_grad():
+            self._text = self._trace(_TextTower(model), (input_ids, attention_mask))
+            self._vision = self._trace(_VisionTower(model), (pixel_values,))
+
+    @staticmethod
+    def _trace(tower: torch.nn.Module, example_inputs):
+        traced = torch.jit.trace(tower.eval(), example_inputs, check_trace=False)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+    def encode_text(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self._text(input_ids, attention_mask)
+
+    def encode_image(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self._vision(pixel_values)
+
+
+class CompiledEngine(TorchEngine):
+    """
+    Both towers compiled with torch.compile.
+
+    Compilation happens lazily on the first call of each input shape; texts
+    are padded to a fixed length and the batch dimension is dynamic, so
+    traffic settles on a handful of graphs.
+    """
+
+    name = "compile"
+    text_length = CLIP_MAX_TOKENS
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__(model)
+        self._text = torch.compile(_TextTower(model).eval(), dynamic=True)
+        self._vision = torch.compile(_VisionTower(model).eval(), dynamic=True)
+
+    def encode_text(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self._text(input_ids, attention_mask)
+
+    def encode_image(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self._vision(pixel_values)
+
+
+class OnnxEngine(TorchEngine):
+    """
+    Both towers exported to ONNX and run with ONNX Runtime on CPU.
+
+    Exports are cached under export_dir per model name, so only the first
+    start pays for the export.
+    """
+
+    name = "onnx"
+    text_length = CLIP_MAX_TOKENS
+
+    def __init__(
+            self,
+            model: torch.nn.Module,
+            model_name: str,
+            export_dir: Path = ONNX_DIR,
+            image_size: int = IMAGE_SIZE
+    ):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("INFERENCE_ENGINE=onnx requires the 'onnxruntime' package") from e
+
+        super().__init__(model)
+        directory = Path(export_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        directory.mkdir(parents=True, exist_ok=True)
+        input_ids, attention_mask, pixel_values = _example_inputs(self.text_length, image_size)
+
+        text_path = directory / "text.onnx"
+        if not text_path.exists():
+            self._export(
+                _TextTower(model), (input_ids, attention_mask), text_path,
+                ["input_ids", "attention_mask"], {"input_ids": {0: "batch"}, "attention_mask": {0: "batch"}}
+            )
+        vision_path = directory / "vision.onnx"
+        if not vision_path.exists():
+            self._export(_VisionTower(model), (pixel_values,), vision_path, ["pixel_values"], {"pixel_values": {0: "batch"}})
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+        self._text = onnxruntime.InferenceSession(str(text_path), options, providers=providers)
+        self._vision = onnxruntime.InferenceSession(str(vision_path), options, providers=providers)
+
+    @staticmethod
+    def _export(tower: torch.nn.Module, example_inputs, path: Path, input_names, dynamic_axes) -> None:
+        logger.info(f"Exporting {path.stem} tower to {path}")
+        # Export to a temporary name so an interrupted export is never loaded
+        tmp_path = path.with_suffix(".onnx.tmp")
+        with torch.no_grad():
+            torch.onnx.export(
+                tower.eval(), example_inputs, str(tmp_path),
+                input_names=input_names,
+                output_names=["features"],
+                dynamic_axes={**dynamic_axes, "features": {0: "batch"}},
+                opset_version=17,
+                dynamo=False
+            )
+        tmp_path.replace(path)
+
+    def encode_text(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        outputs = self._text.run(None, {
+            "input_ids": input_ids.cpu().numpy().astype(np.int64),
+            "attention_mask": attention_mask.cpu().numpy().astype(np.int64)
+        })
+        return torch.from_numpy(outputs[0])
+
+    def encode_image(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        outputs = self._vision.run(None, {"pixel_values": pixel_values.cpu().numpy().astype(np.float32)})
+        return torch.from_numpy(outputs[0])
+
+
+def create_inference_engine(name: str, model: torch.nn.Module, model_name: str, device: str) -> TorchEngine:
+    """
+    Create the inference engine selected by configuration.
+
+    Args:
+        name (str): 'eager', 'int8', 'torchscript', 'compile' or 'onnx'
+        model (torch.nn.Module): fp32 CLIP model, already on device
+        model_name (str): Model name, keying cached exports
+        device (str): Device the model runs on
+
+    Returns:
+        TorchEngine: Engine running both towers
+
+    Raises:
+        ValueError: If the engine is unknown or cannot run on device
+        ImportError: If the engine's optional dependency is missing
+    """
+    if name not in INFERENCE_ENGINES:
+        raise ValueError(f"Unknown inference engine '{name}', expected one of {', '.join(INFERENCE_ENGINES)}")
+    if name in ("int8", "onnx") and not device.startswith("cpu"):
+        raise ValueError(f"Inference engine '{name}' runs on CPU only, not {device}")
+
+    if name == "eager":
+        return TorchEngine(model)
+    if name == "int8":
+        return DynamicInt8Engine(model)
+    if name == "torchscript":
+        return TorchScriptEngine(model)
+    if name == "compile":
+        return CompiledEngine(model)
+    return OnnxEngine(model, model_name)
+
+
+def _min_cosine(reference: torch.Tensor, candidate: torch.Tensor) -> float:
+    reference = torch.nn.functional.normalize(reference.float(), dim=-1)
+    candidate = torch.nn.functional.normalize(candidate.float(), dim=-1)
+    return float((reference * candidate).sum(dim=-1).min())
+
+
+def engine_agreement(
+        reference: TorchEngine,
+        engine: TorchEngine,
+        text_inputs: Dict[str, torch.Tensor],
+        pixel_values: torch.Tensor
+) -> Dict[str, float]:
+    """
+    Compare an engine's embeddings against the fp32 reference engine.
+
+    Args:
+        reference (TorchEngine): Engine producing the reference embeddings
+        engine (TorchEngine): Engine under test
+        text_inputs (Dict[str, torch.Tensor]): Tokenized probe texts (input_ids, attention_mask)
+        pixel_values (torch.Tensor): Preprocessed probe images, (N, 3, H, W)
+
+    Returns:
+        Dict[str, float]: Lowest cosine similarity to the reference over the probes, per tower
+    """
+    with torch.no_grad():
+        input_ids, attention_mask = text_inputs["input_ids"], text_inputs["attention_mask"]
+        return {
+            "text": _min_cosine(
+                reference.encode_text(input_ids, attention_mask), engine.encode_text(input_ids, attention_mask)
+            ),
+            "image": _min_cosine(reference.encode_image(pixel_values), engine.encode_image(pixel_values))
+        }
@@ -2,48 +2,220 @@ import torch
 from transformers import CLIPProcessor, CLIPModel
 import faiss
 import numpy as np
-from typing import List, Tuple
-from ..data.data_loader import ImageDataset
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from ..data.data_loader import ImageDataset, create_data_loader, discover_images, read_image_attributes
+from ..data.attribute_store import AttributeStore, SearchFilter
+from ..data.path_store import PathStore
+from .index_store import (
+    save_index_artifact, load_index_artifact, file_fingerprint, artifact_stamp, EMBEDDINGS_FILE,
+    load_duplicate_groups, duplicates_stamp, append_embeddings
+)
+from .index_factory import (
+    build_faiss_index, apply_default_search_parameters, search_index, recall_at_k, index_memory_bytes,
+    index_encoding, rerank_exact, exact_search, assign_shards, build_sharded_index, ShardedIndex,
+    collapse_duplicates, remap_ids
+)
+from .embedding_cache import EmbeddingCache, create_query_cache, normalize_query
+from .inference_engines import TorchEngine, create_inference_engine, engine_agreement
+from ..utils.metrics import timed
+from ..config import (
+    BATCH_SIZE, NUM_WORKERS, PIN_MEMORY, INDEX_TYPE, VECTOR_ENCODING, RERANK_FACTOR, INDEX_SHARDS, SHARD_BY,
+    INFERENCE_ENGINE, ENGINE_MIN_COSINE, IMAGE_SIZE, FILTER_SCAN_ROWS, COLLAPSE_FETCH_FACTOR
+)
 import logging
-from functools import lru_cache
+import threading
+import time
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+# Texts embedded to check an inference engine against the fp32 model
+ENGINE_PROBE_TEXTS = [
+    "a photo of a dog",
+    "a red car parked on a city street at night",
+    "two people hiking up a snowy mountain",
+    "a bowl of fresh fruit on a wooden table",
+    "an aerial view of a beach"
+]
+
+
+def compose_query(vectors: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Combine normalized query vectors into one normalized query by their weighted sum.
+
+    Args:
+        vectors (np.ndarray): L2-normalized vectors, (n, d)
+        weights (np.ndarray): Weight per vector; negative weights steer away from a vector
+
+    Returns:
+        np.ndarray: L2-normalized float32 query, (1, d)
+
+    Raises:
+        ValueError: If the weighted vectors cancel out
+    """
+    combined = (np.asarray(weights, dtype=np.float32).reshape(-1, 1) * vectors).sum(axis=0, keepdims=True)
+    norm = float(np.linalg.norm(combined))
+    if norm < 1e-6:
+        raise ValueError("Query components cancel each other out")
+    return np.ascontiguousarray(combined / norm, dtype=np.float32)
+
 
 class MultiModalRetrieval:
     """Class for multi-modal image retrieval using CLIP and FAISS."""
 
-    def __init__(self, model_name: str, device: str):
+    def __init__(
+            self,
+            model_name: str,
+            device: str,
+            index_type: str = INDEX_TYPE,
+            query_cache: Optional[EmbeddingCache] = None,
+            inference_engine: str = INFERENCE_ENGINE,
+            vector_encoding: str = VECTOR_ENCODING,
+            num_shards: int = INDEX_SHARDS
+    ):
         """
         Initialize the retrieval model.
         
         Args:
             model_name (str): Name of the CLIP model to use
             device (str): Device to run the model on ('cuda' or 'cpu')
+            index_type (str): FAISS index type ('flat', 'ivf_flat', 'ivf_pq' or 'hnsw')
+            query_cache (Optional[EmbeddingCache]): Query-embedding cache, created from configuration if None
+            inference_engine (str): Engine running the towers ('eager', 'int8', 'torchscript', 'compile'
+                or 'onnx'); falls back to 'eager' if it fails or disagrees with the fp32 model
+            vector_encoding (str): How the index stores vectors ('fp32', 'fp16', 'sq8' or 'pq')
+            num_shards (int): Number of index shards searched in parallel; 1 keeps a single index
             
         Raises:
             RuntimeError: If model loading fails
         """
         try:
+            self.model_name = model_name
             self.device = device
+            self.index_type = index_type
+            self.vector_encoding = vector_encoding
+            # Candidates per result re-scored against the fp32 embeddings when vectors are compressed
+            self.rerank_factor = RERANK_FACTOR
+            self.num_shards = max(1, num_shards)
+            # 'hash' or 'directory'; how images are spread over shards
+            self.shard_by = SHARD_BY
             logger.info(f"Loading CLIP model {model_name} on {device}")
             self.model = CLIPModel.from_pretrained(model_name).to(device)
             self.processor = CLIPProcessor.from_pretrained(model_name)
             self.model.eval()  # Set model to evaluation mode
+            self.engine = self._select_engine(inference_engine)
+            if query_cache is None:
+                # Engines embed slightly differently, so each gets its own cached query vectors
+                namespace = model_name if self.engine.name == "eager" else f"{model_name}/{self.engine.name}"
+                query_cache = create_query_cache(namespace)
+            self.query_cache = query_cache
             self.index = None
-            self.image_paths = []
+            # Path and fingerprint per embedding row (= index ID)
+            self.paths: Optional[PathStore] = None
+            # Width, height, format and directory per embedding row, for filtered search
+            self.attributes: Optional[AttributeStore] = None
+            # Near-duplicate group per embedding row (-1 for none), written by the dedup job
+            self.duplicate_groups: Optional[np.ndarray] = None
+            self.embeddings = None
             self.dataset = None
+            self.data_dir = None
+            # Incremented whenever the searchable corpus changes, so result caches can invalidate
+            self.index_version = 0
+            # Guards the index, embeddings and paths; held only while they change or are probed
+            self._index_lock = threading.RLock()
+            # Serializes incremental syncs so concurrent callers don't embed the same files twice
+            self._sync_lock = threading.Lock()
+            # Files that failed to embed, skipped by later syncs until their fingerprint changes
+            self._rejected = {}
+            # (images embedded, images to embed) of the latest embedding pass, for readiness reporting
+            self.embed_progress = (0, 0)
+            # Set when serving a mapped artifact another process maintains
+            self.read_only = False
+            self._artifact_stamp = None
+            self._duplicates_stamp = None
         except Exception as e:
             logger.error(f"Failed to initialize model: {str(e)}")
             raise RuntimeError(f"Failed to initialize model: {str(e)}")
 
-    def build_index(self, dataset: ImageDataset) -> None:
+    def _select_engine(self, name: str) -> TorchEngine:
+        """Create the requested inference engine, keeping fp32 eager mode unless it is accurate enough."""
+        reference = TorchEngine(self.model)
+        if name == "eager":
+            return reference
+        try:
+            engine = create_inference_engine(name, self.model, self.model_name, self.device)
+            start = time.perf_counter()
+            agreement = self.check_engine_accuracy(engine)
+            logger.info(
+                f"Inference engine '{name}' ready in {time.perf_counter() - start:.1f}s, "
+                f"min cosine to fp32: text {agreement['text']:.4f}, image {agreement['image']:.4f}"
+            )
+        except Exception as e:
+            logger.warning(f"Inference engine '{name}' unavailable, using eager: {str(e)}")
+            return reference
+
+        if min(agreement.values()) < ENGINE_MIN_COSINE:
+            logger.warning(
+                f"Inference engine '{name}' disagrees with fp32 (below {ENGINE_MIN_COSINE}), using eager"
+            )
+            return reference
+        return engine
+
+    def _tokenize(self, texts: List[str], text_length: Optional[int] = None) -> Dict[str, torch.Tensor]:
+        """Tokenize texts, padded per batch or to the fixed length a shape-specialized engine expects."""
+        if text_length is None:
+            return self.processor(text=texts, return_tensors="pt", padding=True)
+        return self.processor(
+            text=texts, return_tensors="pt", padding="max_length", max_length=text_length, truncation=True
+        )
+
+    def check_engine_accuracy(
+            self,
+            engine: Optional[TorchEngine] = None,
+            texts: Optional[List[str]] = None,
+            pixel_values: Optional[torch.Tensor] = None
+    ) -> Dict[str, float]:
+        """
+        Compare an inference engine's embeddings against the fp32 eager model.
+
+        Args:
+            engine (Optional[TorchEngine]): Engine to check, the active one if None
+            texts (Optional[List[str]]): Probe texts, a fixed set of captions if None
+            pixel_values (Optional[torch.Tensor]): Preprocessed probe images, seeded noise if None
+
+        Returns:
+            Dict[str, float]: Lowest cosine similarity to fp32 over the probes, for 'text' and 'image'
+        """
+        engine = engine if engine is not None else self.engine
+        texts = texts if texts is not None else ENGINE_PROBE_TEXTS
+        if pixel_values is None:
+            generator = torch.Generator().manual_seed(0)
+            pixel_values = torch.randn(2, 3, IMAGE_SIZE, IMAGE_SIZE, generator=generator)
+
+        text_inputs = self._tokenize(texts, engine.text_length)
+        return engine_agreement(
+            TorchEngine(self.model),
+            engine,
+            {key: value.to(self.device) for key, value in text_inputs.items()},
+            pixel_values.to(self.device)
+        )
+
+    def build_index(
+            self,
+            dataset: ImageDataset,
+            batch_size: int = BATCH_SIZE,
+            num_workers: int = NUM_WORKERS,
+            index_dir: Optional[Path] = None
+    ) -> None:
         """
         Build the FAISS index from the dataset.
 
         Args:
             dataset (ImageDataset): Dataset containing the images
+            batch_size (int): Number of images embedded per forward pass
+            num_workers (int): Number of image decode worker processes
+            index_dir (Optional[Path]): If given, persist the built index to this directory
 
         Raises:
             ValueError: If dataset is empty
@@ -54,66 +226,648 @@ class MultiModalRetrieval:
                 raise ValueError("Dataset is empty")
 
             self.dataset = dataset
-            self.image_paths = []
-            features_list = []
+            self.data_dir = dataset.data_dir
 
             logger.info(f"Building index for {len(dataset)} images")
-            total_images = len(dataset)
-
-            for idx in range(total_images):
-                try:
-                    image, path = dataset[idx]
-                    with torch.no_grad():
-                        # Move image to device
-                        image = image.unsqueeze(0).to(self.device)
-                        
-                        # Get image features directly since image is already preprocessed
-                        image_features = self.model.get_image_features(pixel_values=image)
-                        features_list.append(image_features.cpu().numpy()[0])
-                        self.image_paths.append(path)
-
-                        if (idx + 1) % 100 == 0:
-                            logger.info(f"Processed {idx + 1}/{total_images} images")
-                except Exception as e:
-                    logger.warning(f"Failed to process image at index {idx}: {str(e)}")
-                    continue
+            with timed("build_index", "embed"):
+                features_array, image_paths = self._embed_dataset(dataset, batch_size, num_workers)
 
-            if not features_list:
+            if len(image_paths) == 0:
                 raise RuntimeError("No valid images were processed")
 
-            # Convert features to numpy array
-            features_array = np.array(features_list)
-
             # Normalize features
-            faiss.normalize_L2(features_array)
+            with timed("build_index", "normalize"):
+                faiss.normalize_L2(features_array)
 
-            # Build FAISS index
-            self.index = faiss.IndexFlatIP(features_array.shape[1])
-            self.index.add(features_array)
+            paths = PathStore.from_paths(
+                self.data_dir, image_paths, [file_fingerprint(path) for path in image_paths]
+            )
+            with timed("build_index", "attributes"):
+                attributes = AttributeStore()
+                attributes.append(
+                    [paths.relative(idx) for idx in range(len(paths))], read_image_attributes(image_paths)
+                )
 
-            logger.info(f"Index built successfully with {len(features_list)} images")
+            # Build FAISS index; IDs are row numbers of the embedding matrix so
+            # images can later be removed or re-embedded individually
+            with timed("build_index", "index_build"):
+                index = self._create_index(features_array, np.arange(len(image_paths), dtype=np.int64), paths)
+
+            with self._index_lock:
+                self.index = index
+                self.paths = paths
+                self.attributes = attributes
+                self.duplicate_groups = None  # Group numbers are indexed by the IDs this build replaced
+                self.embeddings = features_array
+                self._rejected = {}
+                self.read_only = False
+                self.index_version += 1
+
+            logger.info(f"Index built successfully with {len(image_paths)} images")
+
+            if index_dir is not None:
+                with timed("build_index", "save"):
+                    self.save_index(index_dir)
+                self.load_duplicates(index_dir)
 
         except Exception as e:
             logger.error(f"Failed to build index: {str(e)}")
             raise RuntimeError(f"Failed to build index: {str(e)}")
 
-    @lru_cache(maxsize=1000)
-    def _process_query(self, query_text: str) -> np.ndarray:
-        """Process and cache text query features."""
+    def _shards_of(self, ids: np.ndarray, paths: PathStore) -> np.ndarray:
+        """Shard each image ID belongs to, from its path."""
+        return assign_shards([paths.relative(idx) for idx in ids.tolist()], self.num_shards, self.shard_by)
+
+    def _create_index(self, vectors: np.ndarray, ids: np.ndarray, paths: PathStore):
+        """Build the configured index over the given vectors, sharded if num_shards > 1."""
+        if self.num_shards > 1:
+            return build_sharded_index(
+                self.index_type, vectors, ids, self._shards_of(ids, paths), self.num_shards, self.vector_encoding
+            )
+        return build_faiss_index(self.index_type, vectors, ids, encoding=self.vector_encoding)
+
+    def rebuild_shard(self, shard: int, index_dir: Optional[Path] = None) -> None:
+        """
+        Rebuild one shard of a sharded index from the stored embeddings, leaving the others serving.
+
+        Args:
+            shard (int): Shard number
+            index_dir (Optional[Path]): If given, persist the updated index here
+
+        Raises:
+            ValueError: If the index is not sharded, is read-only or shard is out of range
+        """
+        if not isinstance(self.index, ShardedIndex):
+            raise ValueError("Index is not sharded")
+        if self.read_only:
+            raise ValueError("Index is read-only; it is updated by the index builder process")
+        if not 0 <= shard < len(self.index.shards):
+            raise ValueError(f"Shard must be between 0 and {len(self.index.shards) - 1}")
+
+        with self._sync_lock:
+            with self._index_lock:
+                live_ids = self.paths.live_ids()
+                ids = live_ids[self.index.assignment[live_ids] == shard]
+                vectors = np.ascontiguousarray(self.embeddings[ids])
+            # Built outside the index lock, so the other shards keep serving meanwhile
+            rebuilt = build_faiss_index(self.index_type, vectors, ids, encoding=self.vector_encoding)
+            apply_default_search_parameters(rebuilt)
+            with self._index_lock:
+                self.index.shards[shard] = rebuilt
+                self.index_version += 1
+            logger.info(f"Rebuilt shard {shard} with {len(ids)} vectors")
+            if index_dir is not None:
+                self.save_index(index_dir)
+
+    def save_index(self, index_dir: Path) -> None:
+        """
+        Persist the index, embeddings and corpus fingerprint to disk.
+
+        Once saved, the fp32 embeddings are served from the memory-mapped file
+        instead of private memory; only the index stays resident. Rows of
+        removed or re-embedded images are dropped first and the remaining IDs
+        renumbered, so the artifact tracks the live corpus instead of growing
+        with every change.
+
+        Args:
+            index_dir (Path): Directory to write the index artifact to
+
+        Raises:
+            ValueError: If index not built or read-only
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index first.")
+        if self.read_only:
+            raise ValueError("Index is read-only; it is saved by the index builder process")
+
+        with self._index_lock:
+            kept = self._compact() if self.paths.live_count < len(self.paths) else None
+            try:
+                save_index_artifact(
+                    index_dir,
+                    self.index,
+                    self.embeddings,
+                    self.paths,
+                    self.attributes,
+                    self.model_name,
+                    self.data_dir,
+                    self.index_type,
+                    self.vector_encoding,
+                    self.shard_by,
+                    embedding_rows=kept
+                )
+            except Exception:
+                if kept is not None:
+                    # Keep the embeddings aligned with the renumbered IDs
+                    self.embeddings = np.ascontiguousarray(self.embeddings[kept])
+                raise
+            self.embeddings = np.load(Path(index_dir) / EMBEDDINGS_FILE, mmap_mode="r")
+
+    def _compact(self) -> np.ndarray:
+        """
+        Drop removed rows from the path store, attributes and duplicate groups and renumber the index to match.
+
+        The embedding matrix is left as is; call with the index lock held and
+        keep only the returned rows of it.
+
+        Returns:
+            np.ndarray: Previous ID of each kept row
+        """
+        previous_rows = len(self.paths)
+        kept = self.paths.compact()
+        new_ids = np.full(previous_rows, -1, dtype=np.int64)
+        new_ids[kept] = np.arange(len(kept))
+        remap_ids(self.index, new_ids)
+        self.attributes.compact(kept)
+        if self.duplicate_groups is not None:
+            groups = np.full(previous_rows, -1, dtype=np.int64)
+            groups[:len(self.duplicate_groups)] = self.duplicate_groups[:previous_rows]
+            self.duplicate_groups = groups[kept]
+        self.index_version += 1
+        logger.info(f"Compacted {previous_rows - len(kept)} removed rows out of the embedding matrix")
+        return kept
+
+    def load_index(self, index_dir: Path, data_dir: Path, read_only: bool = False) -> bool:
+        """
+        Load a previously persisted index instead of rebuilding it.
+
+        Args:
+            index_dir (Path): Directory the index artifact was written to
+            data_dir (Path): Image directory the index must have been built from
+            read_only (bool): Memory-map the artifact for serving; another process keeps it up to date
+
+        Returns:
+            bool: True if a compatible index was loaded, False if it must be rebuilt
+        """
+        start_time = time.perf_counter()
+        stamp = artifact_stamp(index_dir)
+        artifact = load_index_artifact(
+            index_dir, self.model_name, Path(data_dir), self.index_type, read_only, self.vector_encoding,
+            self.num_shards, self.shard_by
+        )
+        if artifact is None:
+            return False
+        apply_default_search_parameters(artifact.index)
+        groups_stamp = duplicates_stamp(index_dir)
+        groups = load_duplicate_groups(index_dir, artifact.paths)
+
+        with self._index_lock:
+            self.index = artifact.index
+            self.embeddings = artifact.embeddings
+            self.paths = artifact.paths
+            self.attributes = artifact.attributes
+            self.data_dir = Path(data_dir)
+            self._rejected = {}
+            self.read_only = read_only
+            self._artifact_stamp = stamp
+            self.duplicate_groups = groups
+            self._duplicates_stamp = groups_stamp
+            self.index_version += 1
+
+        logger.info(
+            f"Loaded {'read-only ' if read_only else ''}index with {self.num_images} images from {index_dir} "
+            f"in {time.perf_counter() - start_time:.2f}s"
+        )
+        return True
+
+    def reload_if_changed(self, index_dir: Path) -> bool:
+        """
+        Reload a read-only index when the builder has written a newer artifact.
+
+        Returns:
+            bool: True if a newer artifact was loaded
+        """
+        stamp = artifact_stamp(index_dir)
+        if stamp is None or stamp == self._artifact_stamp:
+            if duplicates_stamp(index_dir) != self._duplicates_stamp:
+                self.load_duplicates(index_dir)
+            return False
+        return self.load_index(index_dir, self.data_dir, read_only=True)
+
+    def load_duplicates(self, index_dir: Path) -> bool:
+        """
+        Load the near-duplicate groups the dedup job wrote next to the index artifact.
+
+        Args:
+            index_dir (Path): Directory holding the artifact
+
+        Returns:
+            bool: True if groups were loaded, False if the dedup job has not run
+        """
+        stamp = duplicates_stamp(index_dir)
+        with self._index_lock:
+            groups = load_duplicate_groups(index_dir, self.paths) if self.paths is not None else None
+            self.duplicate_groups = groups
+            self._duplicates_stamp = stamp
+            self.index_version += 1
+        if groups is not None:
+            logger.info(f"Loaded {int(np.count_nonzero(groups >= 0))} near-duplicate images from {index_dir}")
+        return groups is not None
+
+    @property
+    def image_paths(self) -> List[Optional[str]]:
+        """Path per index ID, None for removed images; materialized from the path store on each access."""
+        return self.paths.paths() if self.paths is not None else []
+
+    @property
+    def num_images(self) -> int:
+        """Number of images currently searchable."""
+        return self.index.ntotal if self.index is not None else 0
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Estimated bytes held by the index and by the stored embedding matrix, if not memory-mapped."""
+        with self._index_lock:
+            if self.index is None:
+                return {"index": 0, "embeddings": 0, "paths": 0, "attributes": 0}
+            in_memory = self.embeddings is not None and not isinstance(self.embeddings, np.memmap)
+            return {
+                "index": index_memory_bytes(self.index),
+                "embeddings": int(self.embeddings.nbytes) if in_memory else 0,
+                "paths": self.paths.nbytes if self.paths is not None else 0,
+                "attributes": self.attributes.nbytes if self.attributes is not None else 0
+            }
+
+    def _rerank_factor(self) -> int:
+        """Re-ranking factor in effect: only indexes storing compressed vectors are re-ranked."""
+        if self.rerank_factor <= 0 or index_encoding(self.index) == "fp32":
+            return 0
+        return self.rerank_factor
+
+    def sync_index(
+            self,
+            index_dir: Optional[Path] = None,
+            batch_size: int = BATCH_SIZE,
+            num_workers: int = NUM_WORKERS
+    ) -> Dict[str, int]:
+        """
+        Bring the index in line with the image directory without rebuilding it.
+
+        The directory is diffed against the stored (mtime, size) fingerprints:
+        only new or modified files are embedded, and vectors of deleted or
+        modified files are removed from the index.
+
+        Args:
+            index_dir (Optional[Path]): If given and anything changed, persist the updated index here
+            batch_size (int): Number of images embedded per forward pass
+            num_workers (int): Number of image decode worker processes
+
+        Returns:
+            Dict[str, int]: Counts of added, modified, deleted and failed images, and the new index size
+
+        Raises:
+            ValueError: If index not built
+            RuntimeError: If the update fails
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index first.")
+        if self.read_only:
+            raise ValueError("Index is read-only; it is updated by the index builder process")
+
+        with self._sync_lock:
+            try:
+                start_time = time.perf_counter()
+                current = {}
+                for path in discover_images(self.data_dir):
+                    try:
+                        current[str(path)] = file_fingerprint(path)
+                    except OSError:
+                        continue  # Deleted between listing and stat
+
+                with self._index_lock:
+                    current_ids = self.paths.find_many(list(current))
+                    known_ids = current_ids[current_ids >= 0]
+                    stored = [self.paths.fingerprint(idx) if idx >= 0 else None for idx in current_ids.tolist()]
+                    deleted_ids = np.setdiff1d(self.paths.live_ids(), known_ids)
+
+                added = [path for path, idx in zip(current, current_ids)
+                         if idx < 0 and self._rejected.get(path) != current[path]]
+                modified_ids = [(path, idx) for path, idx, fingerprint in zip(current, current_ids, stored)
+                                if idx >= 0 and fingerprint != current[path]]
+                modified = [path for path, _ in modified_ids]
+
+                changed = added + modified
+                features_array, embedded_paths = self._embed_paths(changed, batch_size, num_workers)
+                embedded = set(embedded_paths)
+                failed = [path for path in changed if path not in embedded]
+                embedded_attributes = read_image_attributes(embedded_paths)
+
+                with self._index_lock:
+                    stale_ids = np.concatenate([
+                        np.array([idx for _, idx in modified_ids], dtype=np.int64), deleted_ids
+                    ]).astype(np.int64)
+                    if len(stale_ids):
+                        self.paths.remove(stale_ids)
+                        self._remove_ids(stale_ids)
+
+                    if embedded_paths:
+                        new_ids = self.paths.append(embedded_paths, [current[path] for path in embedded_paths])
+                        self.attributes.append([self.paths.relative(idx) for idx in new_ids], embedded_attributes)
+                        if isinstance(self.index, ShardedIndex):
+                            self.index.add_with_ids(features_array, new_ids, self._shards_of(new_ids, self.paths))
+                        else:
+                            self.index.add_with_ids(features_array, new_ids)
+                        if isinstance(self.embeddings, np.memmap):
+                            # Grow the mapped artifact file instead of reading the whole matrix into memory
+                            self.embeddings = append_embeddings(self.embeddings, features_array)
+                        else:
+                            self.embeddings = np.concatenate([self.embeddings, features_array])
+                        for path in embedded_paths:
+                            self._rejected.pop(path, None)
+
+                    for path in failed:
+                        self._rejected[path] = current[path]
+
+                    if len(stale_ids) or embedded_paths:
+                        self.index_version += 1
+
+                diff = {
+                    "added": len([path for path in added if path in embedded]),
+                    "modified": len([path for path in modified if path in embedded]),
+                    "deleted": len(deleted_ids),
+                    "failed": len(failed),
+                    "total": self.num_images
+                }
+                if changed or len(deleted_ids):
+                    logger.info(f"Synced index in {time.perf_counter() - start_time:.2f}s: {diff}")
+                    if index_dir is not None:
+                        self.save_index(index_dir)
+                return diff
+
+            except Exception as e:
+                logger.error(f"Failed to sync index: {str(e)}")
+                raise RuntimeError(f"Failed to sync index: {str(e)}")
+
+    def _remove_ids(self, ids: np.ndarray) -> None:
+        """Remove vectors from the index, rebuilding it from stored embeddings if it can't delete."""
+        try:
+            self.index.remove_ids(ids)
+        except RuntimeError:
+            # HNSW graphs don't support deletion; re-index the remaining vectors without re-embedding
+            live_ids = self.paths.live_ids()
+            if isinstance(self.index, ShardedIndex):
+                # Only the shards that held removed images need rebuilding
+                for shard in self.index.shards_of(ids).tolist():
+                    shard_ids = live_ids[self.index.assignment[live_ids] == shard]
+                    logger.info(f"Shard {shard} does not support removal; rebuilding from {len(shard_ids)} embeddings")
+                    self.index.rebuild_shard(shard, np.ascontiguousarray(self.embeddings[shard_ids]), shard_ids)
+                return
+            logger.info(f"Index does not support removal; rebuilding from {len(live_ids)} stored embeddings")
+            self.index = self._create_index(np.ascontiguousarray(self.embeddings[live_ids]), live_ids, self.paths)
+
+    def evaluate_recall(
+            self,
+            k: int = 10,
+            num_queries: int = 100,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None
+    ) -> Dict[str, float]:
+        """
+        Report recall@k and latency of the index against an exact flat search.
+
+        Stored image embeddings are sampled as queries, so the report needs no
+        query log and no text encoding.
+
+        Args:
+            k (int): Number of neighbours compared per query
+            num_queries (int): Number of sampled query vectors
+            nprobe (Optional[int]): IVF lists to probe
+            ef_search (Optional[int]): HNSW candidate list size
+
+        Returns:
+            Dict[str, float]: Recall@k and mean per-query latency of the index and the flat baseline
+
+        Raises:
+            ValueError: If index not built
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index first.")
+
+        with self._index_lock:
+            live_ids = self.paths.live_ids()
+            vectors = np.ascontiguousarray(self.embeddings[live_ids])
+            rows = np.random.default_rng(0).choice(len(live_ids), min(num_queries, len(live_ids)), replace=False)
+            return recall_at_k(
+                self.index, vectors, live_ids, vectors[rows], k,
+                nprobe=nprobe, ef_search=ef_search, rerank_factor=self._rerank_factor()
+            )
+
+    def _embed_paths(
+            self,
+            image_paths: List[str],
+            batch_size: int,
+            num_workers: int
+    ) -> Tuple[np.ndarray, List[str]]:
+        """Embed and normalize specific images, returning only those that could be read."""
+        if not image_paths:
+            return np.empty((0, 0), dtype=np.float32), []
+        try:
+            dataset = ImageDataset(str(self.data_dir), image_paths=image_paths)
+        except ValueError:
+            return np.empty((0, 0), dtype=np.float32), []
+
+        features_array, embedded_paths = self._embed_dataset(dataset, batch_size, min(num_workers, len(dataset)))
+        if embedded_paths:
+            faiss.normalize_L2(features_array)
+        return features_array, embedded_paths
+
+    def _embed_dataset(
+            self,
+            dataset: ImageDataset,
+            batch_size: int,
+            num_workers: int
+    ) -> Tuple[np.ndarray, List[str]]:
+        """
+        Embed every image of the dataset in batches, skipping images that fail to load.
+
+        Returns:
+            Tuple[np.ndarray, List[str]]: (float32 feature matrix, image paths aligned with its rows)
+        """
+        loader = create_data_loader(
+            dataset,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            pin_memory=PIN_MEMORY and self.device.startswith("cuda")
+        )
+
+        features_list = []
+        image_paths = []
+        total_images = len(dataset)
+        self.embed_progress = (0, total_images)
+        start_time = time.perf_counter()
+
         with torch.no_grad():
-            inputs = self.processor(text=query_text, return_tensors="pt", padding=True)
-            text_features = self.model.get_text_features(**{k: v.to(self.device) for k, v in inputs.items()})
-            text_features = text_features.cpu().numpy()
-            faiss.normalize_L2(text_features)
+            batches = iter(loader)
+            batch_idx = -1
+            while True:
+                # Time spent waiting on decode workers, separate from the forward pass
+                with timed("embed", "load"):
+                    batch = next(batches, StopIteration)
+                if batch is StopIteration:
+                    break
+                batch_idx += 1
+                if batch is None:
+                    continue
+                images, paths = batch
+
+                with timed("embed", "forward"):
+                    images = images.to(self.device, non_blocking=True)
+                    # Images are already preprocessed, so feed pixel values directly
+                    image_features = self.engine.encode_image(images)
+                    features_list.append(image_features.cpu().numpy().astype(np.float32))
+                image_paths.extend(paths)
+                self.embed_progress = (len(image_paths), total_images)
+
+                if (batch_idx + 1) % 10 == 0:
+                    elapsed = time.perf_counter() - start_time
+                    logger.info(
+                        f"Processed {len(image_paths)}/{total_images} images "
+                        f"({len(image_paths) / elapsed:.1f} images/sec)"
+                    )
+
+        dataset.record_loaded(image_paths)
+
+        elapsed = time.perf_counter() - start_time
+        skipped = total_images - len(image_paths)
+        logger.info(
+            f"Embedded {len(image_paths)} images in {elapsed:.1f}s "
+            f"({len(image_paths) / max(elapsed, 1e-9):.1f} images/sec, "
+            f"batch_size={batch_size}, num_workers={num_workers}, skipped={skipped})"
+        )
+
+        if not features_list:
+            return np.empty((0, 0), dtype=np.float32), image_paths
+        return np.ascontiguousarray(np.concatenate(features_list)), image_paths
+
+    def _encode_texts(self, query_texts: List[str]) -> np.ndarray:
+        """Tokenize and embed several texts in one forward pass, returning normalized features."""
+        with torch.no_grad():
+            with timed("search", "tokenize"):
+                inputs = self._tokenize(query_texts, self.engine.text_length)
+            with timed("search", "encode"):
+                text_features = self.engine.encode_text(
+                    inputs["input_ids"].to(self.device), inputs["attention_mask"].to(self.device)
+                )
+                text_features = np.ascontiguousarray(text_features.cpu().numpy(), dtype=np.float32)
+                faiss.normalize_L2(text_features)
             return text_features
 
-    def search(self, query_text: str, k: int = 5) -> List[Tuple[str, float]]:
+    def _process_query(self, query_texts: List[str]) -> np.ndarray:
+        """
+        Return normalized text features for each query, in order.
+
+        Queries are normalized before lookup, so 'Dog' and 'dog ' share one
+        cache entry; all cache misses are encoded together in one forward pass.
+        """
+        normalized = [normalize_query(text) for text in query_texts]
+        with timed("search", "cache_lookup"):
+            cached = self.query_cache.get_many(normalized)
+
+        misses = [text for text in dict.fromkeys(normalized) if text not in cached]
+        if misses:
+            features = self._encode_texts(misses)
+            for text, vector in zip(misses, features):
+                self.query_cache.put(text, vector)
+                cached[text] = vector.reshape(1, -1)
+
+        return np.ascontiguousarray(np.concatenate([cached[text] for text in normalized]), dtype=np.float32)
+
+    def _id_filter(self, search_filter: SearchFilter) -> np.ndarray:
+        """Mask over embedding rows of live images matching a filter; call with the index lock held."""
+        return self.attributes.select(search_filter, self.paths.mtimes) & self.paths.live
+
+    def _search_vectors(
+            self,
+            query_features: np.ndarray,
+            k: int,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None,
+            size: Optional[int] = None,
+            search_filter: Optional[SearchFilter] = None,
+            collapse: bool = False
+    ) -> List[List[Tuple[str, float]]]:
+        """Run one FAISS search for a matrix of query vectors and convert hits to (url, score) lists."""
+        with self._index_lock:
+            k = min(k, self.index.ntotal)  # Ensure k is not larger than dataset
+            if k <= 0:
+                # FAISS rejects k=0, and an empty index has nothing to return
+                return [[] for _ in query_features]
+            groups = self.duplicate_groups if collapse else None
+            results = k
+            if groups is not None:
+                # Fetch extra candidates to refill the slots collapsed duplicates free
+                k = min(k * COLLAPSE_FETCH_FACTOR, self.index.ntotal)
+            scores = indices = None
+            id_filter = None
+            if search_filter is not None:
+                with timed("search", "filter"):
+                    id_filter = self._id_filter(search_filter)
+                allowed = np.flatnonzero(id_filter)
+                if len(allowed) <= FILTER_SCAN_ROWS:
+                    # Selective filter: scanning the matches exactly is cheaper than probing
+                    # the index, and never misses matches the graph or lists would skip
+                    with timed("search", "filter_scan"):
+                        vectors = np.asarray(self.embeddings[allowed], dtype=np.float32)
+                        scores, indices = exact_search(query_features, vectors, allowed, k)
+                else:
+                    k = min(k, len(allowed))
+
+            if scores is None:
+                rerank_factor = self._rerank_factor()
+                fetch = min(k * rerank_factor, self.index.ntotal) if rerank_factor else k
+
+                # Search the index, only visiting allowed IDs when filtered
+                with timed("search", "faiss"):
+                    scores, indices = search_index(
+                        self.index, query_features, fetch, nprobe=nprobe, ef_search=ef_search, id_filter=id_filter
+                    )
+                if rerank_factor:
+                    # Compressed scores only shortlist; rank by exact fp32 similarity
+                    with timed("search", "rerank"):
+                        scores, indices = rerank_exact(query_features, indices, self.embeddings, k)
+
+            if groups is not None:
+                # Hits are ranked best first, so each group keeps its best-scoring member
+                with timed("search", "collapse"):
+                    scores, indices = collapse_duplicates(scores, indices, groups, results)
+            return self._build_results(scores, indices, size)
+
+    def _build_results(
+            self,
+            scores: np.ndarray,
+            indices: np.ndarray,
+            size: Optional[int]
+    ) -> List[List[Tuple[str, float]]]:
+        """Gather URLs of live hits and normalize scores from [-1, 1] to [0, 1]; call with the index lock held."""
+        all_results = []
+        with timed("search", "url_build"):
+            for row_scores, row_indices in zip(scores, indices):
+                keep = (row_indices >= 0) & (row_indices < len(self.paths))
+                keep[keep] = self.paths.live[row_indices[keep]]
+                urls = self.paths.urls(row_indices[keep], size)
+                all_results.append(list(zip(urls, ((row_scores[keep] + 1) / 2).tolist())))
+        return all_results
+
+    def search(
+            self,
+            query_text: str,
+            k: int = 5,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None,
+            size: Optional[int] = None,
+            search_filter: Optional[SearchFilter] = None,
+            collapse_duplicates: bool = False
+    ) -> List[Tuple[str, float]]:
         """
         Search for images matching the query text.
         
         Args:
             query_text (str): Text query to search for
             k (int): Number of results to return
+            nprobe (Optional[int]): IVF lists to probe, overriding the configured default
+            ef_search (Optional[int]): HNSW candidate list size, overriding the configured default
+            size (Optional[int]): Thumbnail size the result URLs link to; None links originals
+            search_filter (Optional[SearchFilter]): Only return images matching these conditions
+            collapse_duplicates (bool): Return only the best match of each group of near-duplicates
             
         Returns:
             List[Tuple[str, float]]: List of (image_path, similarity_score) pairs
@@ -132,25 +886,277 @@ class MultiModalRetrieval:
             if k <= 0:
                 raise ValueError("k must be positive")
 
-            k = min(k, len(self.image_paths))  # Ensure k is not larger than dataset
-
             # Get text features (cached)
-            text_features = self._process_query(query_text)
-
-            # Search the index
-            scores, indices = self.index.search(text_features, k)
+            text_features = self._process_query([query_text])
 
-            # Convert paths to URLs and normalize scores to [0, 1]
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < len(self.image_paths):
-                    image_path = self.image_paths[idx]
-                    url = self.dataset.get_image_url(image_path)
-                    normalized_score = (score + 1) / 2  # Convert from [-1, 1] to [0, 1]
-                    results.append((url, float(normalized_score)))
-
-            return results
+            return self._search_vectors(
+                text_features, k, nprobe=nprobe, ef_search=ef_search, size=size, search_filter=search_filter,
+                collapse=collapse_duplicates
+            )[0]
 
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")
             raise RuntimeError(f"Search failed: {str(e)}")
+
+    def search_texts(
+            self,
+            query_texts: List[str],
+            k: int = 5,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None,
+            size: Optional[int] = None,
+            search_filter: Optional[SearchFilter] = None,
+            collapse_duplicates: bool = False
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Search for several text queries with one batched forward pass and one FAISS search.
+
+        Args:
+            query_texts (List[str]): Non-empty text queries
+            k (int): Number of results to return per query
+            nprobe (Optional[int]): IVF lists to probe, overriding the configured default
+            ef_search (Optional[int]): HNSW candidate list size, overriding the configured default
+            size (Optional[int]): Thumbnail size the result URLs link to; None links originals
+            search_filter (Optional[SearchFilter]): Only return images matching these conditions, for every query
+            collapse_duplicates (bool): Return only the best match of each group of near-duplicates
+
+        Returns:
+            List[List[Tuple[str, float]]]: (image_url, similarity_score) pairs per query, in input order
+
+        Raises:
+            RuntimeError: If search fails
+        """
+        try:
+            if not self.index:
+                raise ValueError("Index not built. Call build_index first.")
+
+            if any(not text.strip() for text in query_texts):
+                raise ValueError("Query text cannot be empty")
+
+            if k <= 0:
+                raise ValueError("k must be positive")
+
+            # Encode each distinct uncached text once
+            query_features = self._process_query(query_texts)
+
+            return self._search_vectors(
+                query_features, k, nprobe=nprobe, ef_search=ef_search, size=size, search_filter=search_filter,
+                collapse=collapse_duplicates
+            )
+
+        except Exception as e:
+            logger.error(f"Batched search failed: {str(e)}")
+            raise RuntimeError(f"Batched search failed: {str(e)}")
+
+    def search_batch(
+            self,
+            queries: List[str],
+            k: int = 5,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None,
+            max_query_length: int = 500
+    ) -> List[Tuple[Optional[List[Tuple[str, float]]], Optional[str]]]:
+        """
+        Search for many text queries at once, reporting failures per query.
+
+        Valid queries are tokenized and encoded in a single forward pass and
+        answered by one matrix-shaped FAISS search; invalid queries get an error
+        instead of failing the whole batch.
+
+        Args:
+            queries (List[str]): Text queries
+            k (int): Number of results to return per query
+            nprobe (Optional[int]): IVF lists to probe, overriding the configured default
+            ef_search (Optional[int]): HNSW candidate list size, overriding the configured default
+            max_query_length (int): Longest accepted query, in characters
+
+        Returns:
+            List[Tuple[Optional[List[Tuple[str, float]]], Optional[str]]]: (results, error) per query,
+                in input order; exactly one of the two is None
+
+        Raises:
+            ValueError: If index not built or k is invalid
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index first.")
+        if k <= 0:
+            raise ValueError("k must be positive")
+
+        outcomes = [(None, None)] * len(queries)
+        valid_rows = []
+        for row, query_text in enumerate(queries):
+            if not query_text.strip():
+                outcomes[row] = (None, "Query text cannot be empty")
+            elif len(query_text) > max_query_length:
+                outcomes[row] = (None, f"Query text longer than {max_query_length} characters")
+            else:
+                valid_rows.append(row)
+
+        if valid_rows:
+            try:
+                results = self.search_texts([queries[row] for row in valid_rows], k, nprobe=nprobe, ef_search=ef_search)
+                for row, result in zip(valid_rows, results):
+                    outcomes[row] = (result, None)
+            except Exception as e:
+                for row in valid_rows:
+                    outcomes[row] = (None, str(e))
+
+        return outcomes
+
+    def search_hybrid(
+            self,
+            texts: Sequence[Tuple[str, float]] = (),
+            image_ids: Sequence[Tuple[str, float]] = (),
+            images: Sequence[Tuple[torch.Tensor, float]] = (),
+            k: int = 5,
+            nprobe: Optional[int] = None,
+            ef_search: Optional[int] = None,
+            size: Optional[int] = None,
+            search_filter: Optional[SearchFilter] = None,
+            collapse_duplicates: bool = False
+    ) -> List[Tuple[str, float]]:
+        """
+        Search for a weighted combination of texts and images with a single FAISS probe.
+
+        Each component is embedded (texts through the query cache, indexed
+        images from their stored embeddings, uploads with the vision tower),
+        scaled by its weight, and the normalized sum is searched once. A
+        negative weight steers results away from a component, so
+        [("beach", 1.0), ("people", -0.5)] finds beaches without people.
+        Indexed query images are left out of the results.
+
+        Args:
+            texts (Sequence[Tuple[str, float]]): (query text, weight) pairs
+            image_ids (Sequence[Tuple[str, float]]): (path relative to the data directory, weight) pairs
+            images (Sequence[Tuple[torch.Tensor, float]]): (preprocessed (3, H, W) image, weight) pairs
+            k (int): Number of results to return
+            nprobe (Optional[int]): IVF lists to probe, overriding the configured default
+            ef_search (Optional[int]): HNSW candidate list size, overriding the configured default
+            size (Optional[int]): Thumbnail size the result URLs link to; None links originals
+            search_filter (Optional[SearchFilter]): Only return images matching these conditions
+            collapse_duplicates (bool): Return only the best match of each group of near-duplicates
+
+        Returns:
+            List[Tuple[str, float]]: List of (image_url, similarity_score) pairs
+
+        Raises:
+            ValueError: If index not built, no component has a positive weight, or parameters are invalid
+            KeyError: If an image_id is not indexed
+            RuntimeError: If search fails
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index first.")
+        if k <= 0:
+            raise ValueError("k must be positive")
+        weights = [weight for components in (texts, image_ids, images) for _, weight in components]
+        if not any(weight > 0 for weight in weights):
+            raise ValueError("Query needs at least one component with a positive weight")
+        if any(not text.strip() for text, _ in texts):
+            raise ValueError("Query text cannot be empty")
+
+        vectors = []
+        excluded = set()
+        if image_ids:
+            with self._index_lock:
+                rows = []
+                for image_id, _ in image_ids:
+                    row = self.paths.find(str(Path(self.data_dir) / Path(image_id)))
+                    if row is None:
+                        raise KeyError(f"Image not indexed: {image_id}")
+                    rows.append(row)
+                image_id_features = np.array(self.embeddings[rows], dtype=np.float32)
+                excluded = set(self.paths.urls(rows, size))
+
+        try:
+            # Stack in the order weights were listed: texts, indexed images, uploads
+            if texts:
+                vectors.append(self._process_query([text for text, _ in texts]))
+            if image_ids:
+                vectors.append(image_id_features)
+            if images:
+                vectors.append(self._embed_pixels(torch.stack([pixel_values for pixel_values, _ in images])))
+            query_features = compose_query(np.concatenate(vectors), np.array(weights, dtype=np.float32))
+
+            results = self._search_vectors(
+                query_features, k + len(excluded), nprobe=nprobe, ef_search=ef_search, size=size,
+                search_filter=search_filter, collapse=collapse_duplicates
+            )[0]
+            return [(url, score) for url, score in results if url not in excluded][:k]
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Hybrid search failed: {str(e)}")
+            raise RuntimeError(f"Hybrid search failed: {str(e)}")
+
+    def _embed_pixels(self, pixel_values: torch.Tensor) -> np.ndarray:
+        """Embed preprocessed images with the vision tower, returning normalized features."""
+        with torch.no_grad():
+            image_features = self.engine.encode_image(pixel_values.to(self.device))
+            image_features = np.ascontiguousarray(image_features.cpu().numpy(), dtype=np.float32)
+            faiss.normalize_L2(image_features)
+            return image_features
+
+    def search_by_image(self, pixel_values: torch.Tensor, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Search for images similar to an uploaded image.
+
+        Args:
+            pixel_values (torch.Tensor): Image preprocessed like the indexed images, (3, H, W)
+            k (int): Number of results to return
+
+        Returns:
+            List[Tuple[str, float]]: List of (image_url, similarity_score) pairs
+
+        Raises:
+            ValueError: If index not built or invalid parameters
+            RuntimeError: If search fails
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index first.")
+        if k <= 0:
+            raise ValueError("k must be positive")
+
+        try:
+            image_features = self._embed_pixels(pixel_values.unsqueeze(0))
+            return self._search_vectors(image_features, k)[0]
+        except Exception as e:
+            logger.error(f"Image search failed: {str(e)}")
+            raise RuntimeError(f"Image search failed: {str(e)}")
+
+    def search_by_image_id(self, image_id: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Search for images similar to an already indexed image, reusing its stored embedding.
+
+        The query image itself is left out of the results.
+
+        Args:
+            image_id (str): Path of the image relative to the data directory, as in its result URL
+            k (int): Number of results to return
+
+        Returns:
+            List[Tuple[str, float]]: List of (image_url, similarity_score) pairs
+
+        Raises:
+            ValueError: If index not built or invalid parameters
+            KeyError: If the image is not indexed
+            RuntimeError: If search fails
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index first.")
+        if k <= 0:
+            raise ValueError("k must be positive")
+
+        image_path = str(Path(self.data_dir) / Path(image_id))
+        with self._index_lock:
+            row = self.paths.find(image_path)
+            if row is None:
+                raise KeyError(f"Image not indexed: {image_id}")
+            image_features = np.array(self.embeddings[row:row + 1], dtype=np.float32)
+            query_url = self.paths.urls([row])[0]
+
+        try:
+            results = self._search_vectors(image_features, k + 1)[0]
+            return [(url, score) for url, score in results if url != query_url][:k]
+        except Exception as e:
+            logger.error(f"Image search failed: {str(e)}")
+            raise RuntimeError(f"Image search failed: {str(e)}")
@@ -0,0 +1,178 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Dict, List, Sequence, Tuple
+
+from ..config import METRICS_ENABLED
+
+# Seconds; spans a cached query (sub-millisecond) up to a full index build
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    """Base of the metric types: a named family of labelled series in Prometheus text format."""
+
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _format_labels(self, labels: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        with self._lock:
+            samples = self._samples()
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"] + samples
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: LabelValues = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: LabelValues = ()) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(labels)} {value}" for labels, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Point-in-time value, typically refreshed just before each scrape."""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, labels: LabelValues = ()) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(labels)} {value}" for labels, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed cumulative buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, labels: LabelValues = ()) -> None:
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][bucket] += 1
+            series[1][0] += value
+
+    def count(self, labels: LabelValues = ()) -> int:
+        with self._lock:
+            series = self._values.get(labels)
+            return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_label = f'le="{le}"'
+                samples.append(f"{self.name}_bucket{self._format_labels(labels, bucket_label)} {cumulative}")
+            samples.append(f"{self.name}_sum{self._format_labels(labels)} {total[0]}")
+            samples.append(f"{self.name}_count{self._format_labels(labels)} {cumulative}")
+        return samples
+
+
+REGISTRY: List[_Metric] = []
+
+STAGE_SECONDS = Histogram(
+    "retrieval_stage_seconds",
+    "Time spent in each stage of search and index building.",
+    ("operation", "stage")
+)
+RATE_LIMITED_REQUESTS = Counter("http_rate_limited_requests_total", "Requests rejected by the rate limiter.")
+INDEX_VECTORS = Gauge("index_vectors", "Number of vectors in the search index.")
+INDEX_MEMORY_BYTES = Gauge("index_memory_bytes", "Estimated memory held by the index and embeddings.", ("component",))
+INDEX_VERSION = Gauge("index_version", "Version counter bumped on every index change.")
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Fraction of cache lookups served from the cache.", ("cache",))
+CACHE_BYTES = Gauge("cache_bytes", "Bytes held by the in-process cache.", ("cache",))
+QUERY_QUEUE_DEPTH = Gauge("query_queue_depth", "Text queries waiting to be batched.")
+
+
+class _StageTimer:
+    """Context manager recording its duration in STAGE_SECONDS."""
+
+    __slots__ = ("labels", "start")
+
+    def __init__(self, labels: LabelValues):
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+_DISABLED_TIMER = nullcontext()
+enabled = METRICS_ENABLED
+
+
+def timed(operation: str, stage: str):
+    """
+    Time a block as one stage of an operation, e.g. timed("search", "faiss").
+
+    Returns a shared no-op context manager when metrics are disabled.
+    """
+    if not enabled:
+        return _DISABLED_TIMER
+    return _StageTimer((operation, stage))
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
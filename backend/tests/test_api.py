@@ -1,3 +1,7 @@
+import asyncio
+import base64
+import io
+import threading
 import pytest
 from fastapi.testclient import TestClient
 from fastapi import FastAPI
@@ -15,7 +19,13 @@ project_root = str(Path(__file__).parent.parent.parent)
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from backend.src.api.main import app, SearchQuery, RateLimiter, ConnectionManager
+import backend.src.api.main as main
+from backend.src.api.main import app, SearchQuery, RateLimiter, ConnectionManager, batched_text_search
+from backend.src.api.scheduler import QueryScheduler
+from backend.src.api.response_cache import ResponseCache
+from backend.src.api.rate_limit import MemoryBucketStore
+from backend.src.data.attribute_store import SearchFilter
+from backend.src.data.thumbnails import ThumbnailStore
 from backend.src.config import DATA_DIR, API_HOST, API_PORT
 
 # Test client with correct base URL
@@ -55,8 +65,8 @@ async def setup_test_environment(monkeypatch):
     mock_dataset.__len__.return_value = 5
 
     # Patch the dependencies
-    with patch("backend.src.api.main.MultiModalRetrieval", return_value=mock_model), \
-         patch("backend.src.api.main.ImageDataset", return_value=mock_dataset):
+    with patch("backend.src.api.main.create_retrieval_model", return_value=mock_model), \
+         patch("backend.src.api.main.create_dataset", return_value=mock_dataset):
 
         # Clear any existing app state
         if hasattr(app.state, "retrieval_model"):
@@ -97,7 +107,8 @@ class TestRateLimiter:
     def test_rate_limiter_init(self):
         limiter = RateLimiter(requests_per_minute=60)
         assert limiter.requests_per_minute == 60
-        assert limiter.requests == []
+        assert limiter.capacity == 60
+        assert len(limiter.store) == 0
 
     def test_rate_limiter_allowed(self):
         limiter = RateLimiter(requests_per_minute=2)
@@ -105,6 +116,35 @@ class TestRateLimiter:
         assert limiter.is_allowed() is True
         assert limiter.is_allowed() is False
 
+    def test_clients_have_separate_buckets(self):
+        limiter = RateLimiter(requests_per_minute=1)
+        assert limiter.is_allowed("10.0.0.1") is True
+        assert limiter.is_allowed("10.0.0.1") is False
+        assert limiter.is_allowed("10.0.0.2") is True
+
+    def test_buckets_refill_and_idle_clients_are_evicted(self):
+        now = [0.0]
+        store = MemoryBucketStore(max_clients=2, clock=lambda: now[0])
+        limiter = RateLimiter(requests_per_minute=60, burst=1, store=store)
+        assert limiter.is_allowed("a") is True
+        assert limiter.is_allowed("a") is False
+        now[0] = 1.0
+        assert limiter.is_allowed("a") is True
+
+        limiter.is_allowed("b")
+        limiter.is_allowed("c")
+        assert len(store) == 2  # Bounded: the least recently seen client was dropped
+        now[0] = 10.0
+        limiter.is_allowed("d")
+        assert len(store) == 1  # Buckets idle long enough to be full carry no state
+
+    def test_exempt_paths_are_not_counted(self):
+        limiter = RateLimiter(requests_per_minute=1, exempt_paths=["/health", "/images"])
+        assert all(limiter.is_allowed("a", "/images/cat.jpg") for _ in range(5))
+        assert limiter.is_allowed("a", "/health") is True
+        assert limiter.is_allowed("a", "/search") is True
+        assert limiter.is_allowed("a", "/healthz") is False
+
 class TestSearchQuery:
     """Unit tests for the SearchQuery model."""
 
@@ -141,6 +181,131 @@ class TestConnectionManager:
         await manager.disconnect("test_client")
         assert "test_client" not in manager.active_connections
 
+class TestQueryScheduler:
+    """Unit tests for the micro-batching query scheduler."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_are_batched(self):
+        batches = []
+
+        def search_fn(texts, k, nprobe, ef_search, size, search_filter, collapse_duplicates):
+            batches.append((list(texts), k))
+            return [[(f"{text}_{i}.jpg", 0.5) for i in range(k)] for text in texts]
+
+        scheduler = QueryScheduler(search_fn, max_batch_size=8, max_wait_ms=50, max_workers=1)
+        results = await asyncio.gather(*[
+            scheduler.submit(f"query {i}", k=i + 1) for i in range(5)
+        ])
+        await scheduler.shutdown()
+
+        assert len(batches) == 1
+        assert batches[0] == ([f"query {i}" for i in range(5)], 5)
+        assert [len(result) for result in results] == [1, 2, 3, 4, 5]
+        assert results[2][0][0] == "query 2_0.jpg"
+
+    @pytest.mark.asyncio
+    async def test_queries_with_different_knobs_are_not_mixed(self):
+        batches = []
+
+        def search_fn(texts, k, nprobe, ef_search, size, search_filter, collapse_duplicates):
+            batches.append((nprobe, k, sorted(texts)))
+            return [[] for _ in texts]
+
+        scheduler = QueryScheduler(search_fn, max_batch_size=8, max_wait_ms=50, max_workers=2)
+        await asyncio.gather(
+            scheduler.submit("a", 5, nprobe=4),
+            scheduler.submit("b", 5, nprobe=8),
+            scheduler.submit("c", 5, nprobe=4),
+            scheduler.submit("d", 512, nprobe=4),
+            scheduler.submit("e", 300, nprobe=4),
+            scheduler.submit("f", 12, nprobe=4)
+        )
+        await scheduler.shutdown()
+
+        assert sorted(batches) == [(4, 12, ["a", "c", "f"]), (4, 512, ["d", "e"]), (8, 5, ["b"])]
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_query_in_the_batch(self):
+        def search_fn(texts, k, nprobe, ef_search, size, search_filter, collapse_duplicates):
+            raise RuntimeError("model failure")
+
+        scheduler = QueryScheduler(search_fn, max_batch_size=4, max_wait_ms=20, max_workers=1)
+        results = await asyncio.gather(
+            scheduler.submit("a", 5), scheduler.submit("b", 5), return_exceptions=True
+        )
+        await scheduler.shutdown()
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+class TestWebSocketSearch:
+    """Integration tests for the /ws search protocol."""
+
+    @staticmethod
+    def fake_search(release=None):
+        def search_texts(texts, k, nprobe=None, ef_search=None, size=None, **options):
+            if release is not None and any("slow" in text for text in texts):
+                release.wait(5)
+            return [[(f"http://localhost:8000/images/{text}_{i}.jpg", 0.9 - i / 100) for i in range(k)] for text in texts]
+        return search_texts
+
+    def test_results_stream_first_page_then_the_rest(self, mock_retrieval_model):
+        mock_retrieval_model.search_texts.side_effect = self.fake_search()
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.query_scheduler", QueryScheduler(batched_text_search)):
+            with client.websocket_connect("/ws") as websocket:
+                websocket.send_json({"type": "search", "id": "q1", "query": "cat", "top_k": 5, "page_size": 2})
+                first = websocket.receive_json()
+                rest = websocket.receive_json()
+
+        assert (first["id"], first["offset"], first["done"]) == ("q1", 0, False)
+        assert [hit["url"][-9:] for hit in first["results"]] == ["cat_0.jpg", "cat_1.jpg"]
+        assert (rest["offset"], rest["done"], len(rest["results"])) == (2, True, 3)
+
+    def test_new_search_cancels_superseded_one(self, mock_retrieval_model):
+        release = threading.Event()
+        mock_retrieval_model.search_texts.side_effect = self.fake_search(release)
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.query_scheduler", QueryScheduler(batched_text_search)):
+            with client.websocket_connect("/ws") as websocket:
+                websocket.send_json({"type": "search", "id": "q1", "query": "slow", "top_k": 2})
+                websocket.send_json({"type": "search", "id": "q2", "query": "fast", "top_k": 2})
+                cancelled = websocket.receive_json()
+                results = websocket.receive_json()
+                release.set()
+                websocket.send_json({"type": "search", "id": "q3", "query": "x", "top_k": 0})
+                invalid = websocket.receive_json()
+
+        assert cancelled == {"type": "cancelled", "id": "q1"}
+        assert (results["type"], results["id"], results["done"]) == ("results", "q2", True)
+        assert (invalid["type"], invalid["id"]) == ("error", "q3")
+
+class TestResponseCache:
+    """Unit tests for the search response cache."""
+
+    def test_hits_are_served_for_the_same_index_version(self):
+        cache = ResponseCache(max_bytes=1024)
+        cache.put(1, ("dog", 5), b"[]")
+        assert cache.get(1, ("dog", 5)) == b"[]"
+        assert cache.get(1, ("dog", 6)) is None
+        assert cache.stats()["hits"] == 1
+
+    def test_newer_index_version_invalidates_entries(self):
+        cache = ResponseCache(max_bytes=1024)
+        cache.put(1, ("dog", 5), b"[]")
+        assert cache.get(2, ("dog", 5)) is None
+
+        # Results computed against the old index are not cached any more
+        cache.put(1, ("dog", 5), b"[]")
+        assert cache.get(2, ("dog", 5)) is None
+
+    def test_byte_budget_evicts_oldest_entries(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.put(1, "a", b"12345")
+        cache.put(1, "b", b"12345")
+        cache.put(1, "c", b"12345")
+        assert cache.get(1, "a") is None
+        assert cache.get(1, "c") == b"12345"
+
 # ============= Integration Tests =============
 class TestAPIEndpoints:
     """Integration tests for API endpoints."""
@@ -185,6 +350,324 @@ class TestAPIEndpoints:
         assert response.status_code == 200
         assert response.headers["content-type"].startswith("image/")
 
+class TestSearchCaching:
+    """Integration tests for cached /search responses."""
+
+    def test_repeated_search_is_served_from_cache(self, mock_retrieval_model):
+        mock_retrieval_model.index_version = 1
+        mock_retrieval_model.search_texts.return_value = [[("http://localhost:8000/images/a.jpg", 0.9)]]
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.response_cache", ResponseCache()):
+            first = client.post("/search", json={"query": "Red car", "top_k": 3})
+            second = client.post("/search", json={"query": "red car ", "top_k": 3})
+
+            mock_retrieval_model.index_version = 2
+            third = client.post("/search", json={"query": "red car", "top_k": 3})
+
+        assert first.status_code == second.status_code == 200
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.json() == [{"url": "http://localhost:8000/images/a.jpg", "score": 0.9}]
+        assert third.headers["x-cache"] == "MISS"
+        assert mock_retrieval_model.search_texts.call_count == 2
+
+    def test_filters_reach_the_model_and_key_the_cache(self, mock_retrieval_model):
+        mock_retrieval_model.index_version = 1
+        mock_retrieval_model.search_texts.return_value = [[("http://localhost:8000/images/a.png", 0.9)]]
+        filters = {"directories": ["holiday"], "formats": ["png"], "min_width": 800, "modified_after": 1700000000}
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.response_cache", ResponseCache()):
+            unfiltered = client.post("/search", json={"query": "red car"})
+            filtered = client.post("/search", json={"query": "red car", "filters": filters})
+            invalid = client.post("/search", json={"query": "red car", "filters": {"min_width": -1}})
+
+        assert unfiltered.headers["x-cache"] == filtered.headers["x-cache"] == "MISS"
+        assert invalid.status_code == 422
+        assert mock_retrieval_model.search_texts.call_args.kwargs["search_filter"] == SearchFilter(
+            directories=("holiday",), formats=("png",), min_width=800, modified_after=1700000000.0
+        )
+
+class TestSearchPagination:
+    """Integration tests for cursor-paged /search results."""
+
+    @staticmethod
+    def fake_search(total):
+        def search_texts(texts, k, nprobe=None, ef_search=None, size=None, **options):
+            hits = [(f"http://localhost:8000/images/{i}.jpg", 1 - i / 100) for i in range(min(k, total))]
+            return [hits for _ in texts]
+        return search_texts
+
+    def test_pages_continue_from_cached_candidates(self, mock_retrieval_model):
+        mock_retrieval_model.index_version = 1
+        mock_retrieval_model.search_texts.side_effect = self.fake_search(30)
+        pages = []
+        cursor = None
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.response_cache", ResponseCache()):
+            while True:
+                response = client.post("/search", json={"query": "red car", "top_k": 5, "cursor": cursor})
+                assert response.status_code == 200
+                pages.append(response.json())
+                cursor = response.headers.get("X-Next-Cursor")
+                if cursor is None:
+                    break
+
+        urls = [result["url"] for page in pages for result in page]
+        assert urls == [f"http://localhost:8000/images/{i}.jpg" for i in range(30)]
+        # First page, then candidate windows of 16 and 32 shared by the later pages
+        assert [call.args[1] for call in mock_retrieval_model.search_texts.call_args_list] == [5, 16, 32]
+
+    def test_cursors_are_bound_to_query_and_index_version(self, mock_retrieval_model):
+        mock_retrieval_model.index_version = 1
+        mock_retrieval_model.search_texts.side_effect = self.fake_search(30)
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.response_cache", ResponseCache()):
+            cursor = client.post("/search", json={"query": "red car", "top_k": 5}).headers["X-Next-Cursor"]
+            other_query = client.post("/search", json={"query": "blue car", "cursor": cursor})
+            garbage = client.post("/search", json={"query": "red car", "cursor": "not-a-cursor"})
+            mock_retrieval_model.index_version = 2
+            expired = client.post("/search", json={"query": "red car", "cursor": cursor})
+
+        assert other_query.status_code == garbage.status_code == 400
+        assert expired.status_code == 410
+
+    def test_last_page_has_no_cursor(self, mock_retrieval_model):
+        mock_retrieval_model.index_version = 1
+        mock_retrieval_model.search_texts.side_effect = self.fake_search(3)
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.response_cache", ResponseCache()):
+            response = client.post("/search", json={"query": "red car", "top_k": 5})
+        assert len(response.json()) == 3
+        assert "X-Next-Cursor" not in response.headers
+
+
+class TestBatchSearchEndpoint:
+    """Integration tests for /search/batch."""
+
+    def test_results_keep_input_order_and_errors(self, mock_retrieval_model):
+        mock_retrieval_model.search_batch.return_value = [
+            ([("http://localhost:8000/images/a.jpg", 0.9)], None),
+            (None, "Query text cannot be empty"),
+        ]
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model):
+            response = client.post("/search/batch", json={"queries": ["red car", ""], "top_k": 1})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert [item["query"] for item in body] == ["red car", ""]
+        assert body[0]["results"][0]["score"] == 0.9
+        assert body[1] == {"query": "", "results": [], "error": "Query text cannot be empty"}
+        mock_retrieval_model.search_batch.assert_called_once_with(["red car", ""], 1, None, None)
+
+    def test_rejects_empty_batches(self, mock_retrieval_model):
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model):
+            response = client.post("/search/batch", json={"queries": []})
+        assert response.status_code == 400
+
+class TestImageSearchEndpoint:
+    """Integration tests for /search/image."""
+
+    def test_search_by_indexed_image(self, mock_retrieval_model):
+        mock_retrieval_model.search_by_image_id.return_value = [("http://localhost:8000/images/b.jpg", 0.7)]
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model):
+            response = client.post("/search/image", data={"image_id": "a.jpg", "top_k": 2})
+        assert response.status_code == 200
+        assert response.json()[0]["url"].endswith("b.jpg")
+        mock_retrieval_model.search_by_image_id.assert_called_once_with("a.jpg", 2)
+
+    def test_requires_exactly_one_image_source(self, mock_retrieval_model):
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model):
+            response = client.post("/search/image", data={"top_k": 2})
+        assert response.status_code == 400
+
+    def test_rejects_oversized_uploads(self, mock_retrieval_model):
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.MAX_UPLOAD_BYTES", 10):
+            response = client.post("/search/image", files={"file": ("a.jpg", b"x" * 100, "image/jpeg")})
+        assert response.status_code == 413
+
+class TestHybridSearchEndpoint:
+    """Integration tests for /search/hybrid."""
+
+    def test_components_are_passed_as_weighted_lists(self, mock_retrieval_model):
+        mock_retrieval_model.index_version = 1
+        mock_retrieval_model.search_hybrid.return_value = [("http://localhost:8000/images/b.jpg", 0.7)]
+        components = [{"text": "at night"}, {"image_id": "a.jpg", "weight": 0.5}, {"text": "people", "weight": -1}]
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.response_cache", ResponseCache()):
+            response = client.post("/search/hybrid", json={"components": components, "top_k": 3})
+            assert client.post("/search/hybrid", json={"components": components, "top_k": 3}).headers["X-Cache"] == "HIT"
+        assert response.status_code == 200
+        assert response.json()[0]["url"].endswith("b.jpg")
+        mock_retrieval_model.search_hybrid.assert_called_once_with(
+            [("at night", 1.0), ("people", -1.0)], [("a.jpg", 0.5)], [], 3, None, None, None, None, False
+        )
+
+    def test_uploads_are_decoded(self, mock_retrieval_model):
+        mock_retrieval_model.search_hybrid.return_value = []
+        image = io.BytesIO()
+        Image.new("RGB", (32, 32)).save(image, format="JPEG")
+        encoded = base64.b64encode(image.getvalue()).decode("ascii")
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model):
+            response = client.post("/search/hybrid", json={"components": [{"image": encoded}]})
+            invalid = client.post("/search/hybrid", json={"components": [{"image": "not base64!"}]})
+        assert response.status_code == 200
+        _, _, images, *_ = mock_retrieval_model.search_hybrid.call_args.args
+        assert images[0][0].shape == (3, 224, 224)
+        assert invalid.status_code == 400
+
+    def test_each_component_needs_exactly_one_source(self, mock_retrieval_model):
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model):
+            both = client.post("/search/hybrid", json={"components": [{"text": "a", "image_id": "a.jpg"}]})
+            neither = client.post("/search/hybrid", json={"components": [{"weight": 1}]})
+            too_many = client.post("/search/hybrid", json={"components": [{"text": "a"}] * 100})
+        assert both.status_code == neither.status_code == too_many.status_code == 400
+
+class TestThumbnailEndpoint:
+    """Integration tests for /thumbnails."""
+
+    def test_serves_cached_rendition_with_validators(self, tmp_path):
+        (tmp_path / "images").mkdir()
+        Image.new("RGB", (600, 400), color="red").save(tmp_path / "images" / "a.jpg")
+        store = ThumbnailStore(tmp_path / "images", cache_dir=tmp_path / "thumbs", image_format="jpeg")
+
+        with patch("backend.src.api.main.thumbnail_store", store):
+            response = client.get("/thumbnails/128/a.jpg")
+            revalidated = client.get("/thumbnails/128/a.jpg", headers={"If-None-Match": response.headers["etag"]})
+            unsupported = client.get("/thumbnails/100/a.jpg")
+            escaped = client.get("/thumbnails/128/..%2Fthumbs%2Fa.jpg")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        assert "max-age=" in response.headers["cache-control"]
+        assert "last-modified" in response.headers
+        with Image.open(io.BytesIO(response.content)) as thumbnail:
+            assert thumbnail.size == (128, 85)
+        assert len(list((tmp_path / "thumbs").rglob("*_128.jpg"))) == 1
+        assert revalidated.status_code == 304
+        assert unsupported.status_code == 404
+        assert escaped.status_code == 404
+
+    def test_concurrent_renders_of_one_rendition_all_succeed(self, tmp_path):
+        (tmp_path / "images").mkdir()
+        Image.new("RGB", (600, 400), color="blue").save(tmp_path / "images" / "a.jpg")
+        store = ThumbnailStore(tmp_path / "images", cache_dir=tmp_path / "thumbs", image_format="jpeg")
+        saved = threading.Barrier(2, timeout=10)
+        original_save = Image.Image.save
+        errors = []
+
+        def save_then_wait(image, fp, *args, **kwargs):
+            # Both renders finish writing before either moves its file into place
+            original_save(image, fp, *args, **kwargs)
+            saved.wait()
+
+        def render():
+            try:
+                store.get("a.jpg", 128)
+            except Exception as e:
+                errors.append(e)
+
+        with patch.object(Image.Image, "save", save_then_wait):
+            threads = [threading.Thread(target=render) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert errors == []
+        assert len(list((tmp_path / "thumbs").rglob("*_128.jpg"))) == 1
+        assert list((tmp_path / "thumbs").rglob("*.tmp")) == []
+
+class TestMetricsEndpoint:
+    """Integration tests for /metrics."""
+
+    def test_exposes_index_cache_and_rate_limit_series(self, mock_retrieval_model):
+        mock_retrieval_model.index_version = 3
+        mock_retrieval_model.num_images = 10
+        mock_retrieval_model.query_cache.stats.return_value = {"hit_ratio": 0.5, "bytes": 2048}
+        mock_retrieval_model.memory_footprint.return_value = {"index": 4096, "embeddings": 1024}
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model):
+            response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert "index_vectors 10.0" in body
+        assert 'index_memory_bytes{component="index"} 4096.0' in body
+        assert 'cache_hit_ratio{cache="query_embedding"} 0.5' in body
+        assert "query_queue_depth 0.0" in body
+        assert "# TYPE http_rate_limited_requests_total counter" in body
+
+class TestAdminEndpoints:
+    """Integration tests for admin endpoints."""
+
+    def test_reindex_returns_diff(self, mock_retrieval_model):
+        mock_retrieval_model.sync_index.return_value = {
+            "added": 1, "modified": 0, "deleted": 2, "failed": 0, "total": 4
+        }
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.ADMIN_TOKEN", "secret"):
+            response = client.post("/admin/reindex", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert response.json()["deleted"] == 2
+
+    def test_reindex_requires_admin_token(self, mock_retrieval_model):
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.ADMIN_TOKEN", "secret"):
+            assert client.post("/admin/reindex").status_code == 403
+            assert client.post("/admin/reindex", headers={"X-Admin-Token": "wrong"}).status_code == 403
+            response = client.post("/admin/reindex", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+
+    def test_admin_endpoints_are_disabled_without_a_token(self, mock_retrieval_model):
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch("backend.src.api.main.ADMIN_TOKEN", None):
+            assert client.post("/admin/reindex", headers={"X-Admin-Token": ""}).status_code == 403
+            assert client.get("/admin/index/recall").status_code == 403
+        mock_retrieval_model.sync_index.assert_not_called()
+        mock_retrieval_model.evaluate_recall.assert_not_called()
+
+class TestStartup:
+    """Integration tests for background startup and readiness."""
+
+    def test_importing_the_app_skips_the_model_stack(self):
+        import subprocess
+        code = "import sys, backend.src.api.main; print(sorted({'torch', 'transformers', 'faiss'} & set(sys.modules)))"
+        output = subprocess.run([sys.executable, "-c", code], cwd=project_root, capture_output=True, text=True)
+        assert output.stdout.strip() == "[]", output.stderr
+
+    def test_ready_reports_progress_until_index_is_searchable(self, mock_retrieval_model):
+        mock_retrieval_model.index = None
+        mock_retrieval_model.embed_progress = (3, 10)
+        with patch("backend.src.api.main.retrieval_model", mock_retrieval_model), \
+             patch.dict(main.startup_state, stage="building_index", error=None):
+            response = client.get("/ready")
+            assert response.status_code == 503
+            assert response.json()["progress"] == {"embedded": 3, "total": 10}
+            assert client.get("/health").status_code == 200
+
+            mock_retrieval_model.index = MagicMock()
+            assert client.get("/ready").status_code == 200
+
+    def test_warm_up_loads_model_and_index_in_background(self, mock_retrieval_model, tmp_path):
+        mock_retrieval_model.load_index.return_value = True
+        with patch("backend.src.api.main.retrieval_model", None), \
+             patch("backend.src.api.main.create_retrieval_model", return_value=mock_retrieval_model), \
+             patch.dict(main.startup_state):
+            asyncio.run(main.warm_up(tmp_path))
+            assert main.retrieval_model is mock_retrieval_model
+            assert main.startup_state["stage"] == "ready"
+        mock_retrieval_model.build_index.assert_not_called()
+
+    def test_failed_warm_up_fails_health(self):
+        with patch("backend.src.api.main.retrieval_model", None), \
+             patch("backend.src.api.main.create_retrieval_model", side_effect=OSError("no weights")), \
+             patch.dict(main.startup_state):
+            asyncio.run(main.warm_up(Path(".")))
+            response = client.get("/health")
+            assert response.status_code == 503
+            assert client.get("/ready").json()["error"] == "no weights"
+
 class TestErrorHandling:
     """Integration tests for error handling."""
 
@@ -226,7 +709,8 @@ class TestMiddleware:
         """Test rate limiting middleware."""
         responses = []
         for _ in range(70):  # More than the rate limit
-            response = client.get("/health")
+            response = client.post("/search", json={})
             responses.append(response.status_code)
 
         assert 429 in responses  # Should see some rate limit responses
+        assert client.get("/health").status_code != 429  # Probes are exempt
@@ -0,0 +1,869 @@
+import time
+import pytest
+from unittest.mock import patch
+import faiss
+import numpy as np
+import torch
+from pathlib import Path
+from PIL import Image
+import sys
+
+# Add the project root to Python path
+project_root = str(Path(__file__).parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from backend.src.models.retrieval_model import MultiModalRetrieval
+from backend.src.models.index_factory import (
+    build_faiss_index, index_description, search_index, recall_at_k, index_memory_bytes, index_encoding,
+    MemmapFlatIndex, ShardedIndex, assign_shards, build_sharded_index, merge_shard_results,
+    find_duplicate_groups, collapse_duplicates
+)
+from backend.src.models.index_store import save_duplicate_groups
+from backend.src.models.inference_engines import DynamicInt8Engine, TorchEngine, engine_agreement
+from backend.src.utils import metrics
+from backend.src.models.embedding_cache import EmbeddingCache, SQLiteEmbeddingStore, normalize_query
+from backend.src.data.path_store import PathStore
+from backend.src.data.attribute_store import AttributeStore, SearchFilter
+from backend.src.data.data_loader import (
+    ImageDataset, ValidationCache, collate_skip_corrupt, decode_image, discover_images
+)
+
+EMBED_DIM = 12
+
+
+# ============= Stubs =============
+class StubCLIPModel(torch.nn.Module):
+    """Tiny CLIP-shaped model producing deterministic embeddings without any download."""
+
+    def __init__(self):
+        super().__init__()
+        generator = torch.Generator().manual_seed(0)
+        self.text_embedding = torch.nn.Parameter(torch.randn(256, EMBED_DIM, generator=generator))
+        self.image_calls = 0
+
+    def get_image_features(self, pixel_values):
+        self.image_calls += 1
+        pooled = torch.nn.functional.adaptive_avg_pool2d(pixel_values, 2).flatten(1)
+        return pooled
+
+    def get_text_features(self, input_ids, attention_mask=None):
+        mask = torch.ones_like(input_ids) if attention_mask is None else attention_mask
+        embedded = self.text_embedding[input_ids] * mask.unsqueeze(-1)
+        return embedded.sum(dim=1) / mask.sum(dim=1, keepdim=True).clamp(min=1)
+
+
+class StubCLIPProcessor:
+    """Byte-level tokenizer standing in for CLIPProcessor."""
+
+    def __call__(self, text=None, return_tensors="pt", padding=True, **kwargs):
+        texts = [text] if isinstance(text, str) else list(text)
+        encoded = [list(t.encode("utf-8"))[:32] or [0] for t in texts]
+        width = max(len(ids) for ids in encoded)
+        input_ids = torch.tensor([ids + [0] * (width - len(ids)) for ids in encoded])
+        return {"input_ids": input_ids, "attention_mask": (input_ids > 0).long()}
+
+
+# ============= Fixtures =============
+@pytest.fixture
+def image_dir(tmp_path):
+    """Create a directory of small random images."""
+    rng = np.random.default_rng(0)
+    for i in range(10):
+        img_array = rng.integers(0, 255, (32, 32, 3), dtype=np.uint8)
+        Image.fromarray(img_array).save(tmp_path / f"image_{i}.jpg")
+    return tmp_path
+
+
+@pytest.fixture
+def retrieval_model():
+    """MultiModalRetrieval backed by the stub CLIP model."""
+    with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=StubCLIPModel()), \
+         patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+        yield MultiModalRetrieval("stub-clip", "cpu")
+
+
+# ============= Unit Tests =============
+class TestBatchedIndexing:
+    """Unit tests for the batched embedding pipeline."""
+
+    def test_collate_skips_corrupt_samples(self):
+        image = torch.zeros(3, 4, 4)
+        images, paths = collate_skip_corrupt([(image, "a.jpg"), None, (image, "b.jpg")])
+        assert images.shape == (2, 3, 4, 4)
+        assert paths == ["a.jpg", "b.jpg"]
+        assert collate_skip_corrupt([None, None]) is None
+
+    def test_build_index_batches_images(self, retrieval_model, image_dir):
+        dataset = ImageDataset(str(image_dir))
+        retrieval_model.build_index(dataset, batch_size=4, num_workers=0)
+
+        assert retrieval_model.index.ntotal == 10
+        assert len(retrieval_model.image_paths) == 10
+        assert retrieval_model.model.image_calls == 3
+
+    def test_build_index_skips_unreadable_images(self, retrieval_model, image_dir):
+        dataset = ImageDataset(str(image_dir))
+        (image_dir / "image_3.jpg").unlink()
+
+        retrieval_model.build_index(dataset, batch_size=4, num_workers=0)
+
+        assert retrieval_model.index.ntotal == 9
+        assert not any(path.endswith("image_3.jpg") for path in retrieval_model.image_paths)
+
+    def test_search_returns_ranked_urls(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+
+        results = retrieval_model.search("a photo", k=3)
+
+        assert len(results) == 3
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True)
+        assert all(url.startswith("http") and "/images/" in url for url, _ in results)
+        thumbnails = retrieval_model.search("a photo", k=3, size=256)
+        assert [url.replace("/thumbnails/256/", "/images/") for url, _ in thumbnails] == [url for url, _ in results]
+
+    def test_search_texts_matches_single_searches(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+
+        batched = retrieval_model.search_texts(["a photo", "a dog", "a photo"], k=3)
+
+        assert len(batched) == 3
+        assert batched[0] == batched[2]
+        for query, results in zip(["a photo", "a dog"], batched):
+            expected = retrieval_model.search(query, k=3)
+            assert [url for url, _ in results] == [url for url, _ in expected]
+            assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+
+
+    def test_search_batch_reports_errors_per_query(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+
+        outcomes = retrieval_model.search_batch(["a dog", "  ", "a photo"], k=2)
+
+        assert [error for _, error in outcomes] == [None, "Query text cannot be empty", None]
+        assert outcomes[1][0] is None
+        assert [url for url, _ in outcomes[2][0]] == [url for url, _ in retrieval_model.search("a photo", k=2)]
+
+
+class TestImageDiscovery:
+    """Unit tests for image discovery and validation."""
+
+    def test_discovery_is_recursive_and_skips_hidden_entries(self, image_dir):
+        (image_dir / "nested").mkdir()
+        Image.new("RGB", (8, 8)).save(image_dir / "nested" / "deep.PNG")
+        (image_dir / ".cache").mkdir()
+        Image.new("RGB", (8, 8)).save(image_dir / ".cache" / "hidden.jpg")
+        (image_dir / "notes.txt").write_text("not an image")
+
+        found = {path.relative_to(image_dir).as_posix() for path in discover_images(image_dir)}
+
+        assert len(found) == 11
+        assert "nested/deep.PNG" in found
+        assert not any(path.startswith(".cache") for path in found)
+        assert len(discover_images(image_dir, recursive=False)) == 10
+
+    def test_eager_validation_drops_invalid_files_and_caches_results(self, image_dir, tmp_path_factory):
+        (image_dir / "broken.jpg").write_bytes(b"not an image")
+        cache_path = tmp_path_factory.mktemp("cache") / "validation.json"
+
+        dataset = ImageDataset(str(image_dir), validation_cache=ValidationCache(cache_path))
+        assert len(dataset) == 10
+
+        with patch("backend.src.data.data_loader.check_image_header") as check:
+            dataset = ImageDataset(str(image_dir), validation_cache=ValidationCache(cache_path))
+        check.assert_not_called()
+        assert len(dataset) == 10
+
+    def test_deferred_validation_learns_failures_while_embedding(self, retrieval_model, image_dir):
+        (image_dir / "broken.jpg").write_bytes(b"not an image")
+        cache = ValidationCache()
+
+        dataset = ImageDataset(str(image_dir), validation="deferred", validation_cache=cache)
+        assert len(dataset) == 11
+        retrieval_model.build_index(dataset, batch_size=4, num_workers=0)
+        assert retrieval_model.index.ntotal == 10
+
+        assert len(ImageDataset(str(image_dir), validation="deferred", validation_cache=cache)) == 10
+
+
+class TestPathStore:
+    """Unit tests for the columnar path store."""
+
+    def test_rows_urls_and_lookups(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("BACKEND_URL", "http://api")
+        store = PathStore(tmp_path)
+        ids = store.append([tmp_path / "a.jpg", str(tmp_path / "sub" / "b.jpg")], [(1.5, 10), (2.5, 20)])
+        store.append([tmp_path / "c.jpg"])
+
+        assert ids.tolist() == [0, 1]
+        assert store.urls(np.array([1, 0])) == ["http://api/images/sub/b.jpg", "http://api/images/a.jpg"]
+        assert store.urls([2], size=128) == ["http://api/thumbnails/128/c.jpg"]
+        assert store.find_many([tmp_path / "c.jpg", tmp_path / "x.jpg", "/elsewhere/a.jpg"]).tolist() == [2, -1, -1]
+        assert store.fingerprint(1) == (2.5, 20) and store.fingerprint(2) is None
+        with pytest.raises(ValueError):
+            store.append(["/elsewhere/d.jpg"])
+
+        store.remove(np.array([0]))
+        assert store.find(tmp_path / "a.jpg") is None
+        assert store.paths() == [None, str(tmp_path / "sub" / "b.jpg"), str(tmp_path / "c.jpg")]
+        assert store.live_ids().tolist() == [1, 2]
+
+        assert store.compact().tolist() == [1, 2]
+        assert store.paths() == [str(tmp_path / "sub" / "b.jpg"), str(tmp_path / "c.jpg")]
+        assert store.find(tmp_path / "c.jpg") == 1 and store.fingerprint(0) == (2.5, 20)
+
+    def test_save_load_round_trip_is_compact(self, tmp_path):
+        paths = [tmp_path / f"folder_{i % 100}" / f"image_{i:06d}.jpg" for i in range(10000)]
+        store = PathStore.from_paths(tmp_path, paths, [(float(i), i) for i in range(10000)])
+        store.remove(np.array([5]))
+
+        store.save(tmp_path / "paths.npz")
+        loaded = PathStore.load(tmp_path / "paths.npz", tmp_path)
+
+        assert loaded.paths() == store.paths()
+        assert loaded.fingerprint(9999) == (9999.0, 9999)
+        assert loaded.find(paths[1234]) == 1234
+        assert loaded.nbytes / len(paths) < 100  # path bytes, columns and lookup hashes
+
+
+class TestAttributeStore:
+    """Unit tests for the columnar image metadata behind filtered search."""
+
+    def test_select_combines_conditions(self, tmp_path):
+        store = AttributeStore()
+        store.append(
+            ["a.jpg", "holiday/b.png", "holiday/2023/c.jpg", "holidays/d.jpg"],
+            [(640, 480, "JPEG"), (1920, 1080, "PNG"), (1024, 768, "JPEG"), (0, 0, "")]
+        )
+        mtimes = np.array([100.0, 200.0, np.nan, 400.0])
+
+        def matches(**conditions):
+            return np.flatnonzero(store.select(SearchFilter(**conditions), mtimes)).tolist()
+
+        assert matches() == [0, 1, 2, 3]
+        assert matches(directories=("holiday",)) == [1, 2]
+        assert matches(directories=("/",)) == [0, 1, 2, 3]
+        assert matches(formats=("jpg",)) == [0, 2]
+        assert matches(min_width=1000, max_height=800) == [2]
+        assert matches(modified_after=150.0) == [1, 3]  # unknown mtimes never match date filters
+        assert matches(directories=("holiday",), formats=("png",), modified_before=250.0) == [1]
+
+        store.save(tmp_path / "attributes.npz")
+        loaded = AttributeStore.load(tmp_path / "attributes.npz")
+        loaded.append(["holiday/e.png"], [(10, 10, "PNG")])
+        assert loaded.formats == store.formats
+        assert np.flatnonzero(loaded.select(SearchFilter(directories=("holiday",)), np.zeros(5))).tolist() == [1, 2, 4]
+
+
+class TestMetrics:
+    """Unit tests for stage timing and index footprint metrics."""
+
+    def test_search_stages_are_timed_only_when_enabled(self, retrieval_model, image_dir, monkeypatch):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        faiss_searches = metrics.STAGE_SECONDS.count(("search", "faiss"))
+        encodes = metrics.STAGE_SECONDS.count(("search", "encode"))
+
+        retrieval_model.search("a metrics probe", k=2)
+        assert metrics.STAGE_SECONDS.count(("search", "faiss")) == faiss_searches + 1
+        assert metrics.STAGE_SECONDS.count(("search", "encode")) == encodes + 1
+        assert metrics.STAGE_SECONDS.count(("build_index", "index_build")) >= 1
+
+        monkeypatch.setattr(metrics, "enabled", False)
+        retrieval_model.search("a metrics probe", k=2)
+        assert metrics.STAGE_SECONDS.count(("search", "faiss")) == faiss_searches + 1
+        assert 'retrieval_stage_seconds_bucket{operation="search",stage="faiss",le="+Inf"}' in metrics.render_metrics()
+
+    def test_index_memory_estimate_tracks_serialized_size(self):
+        vectors = np.random.default_rng(0).standard_normal((1000, 16)).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        for index_type in ("flat", "hnsw"):
+            index = build_faiss_index(index_type, vectors, np.arange(1000, dtype=np.int64))
+            serialized = len(faiss.serialize_index(index))
+            assert 0.8 * serialized <= index_memory_bytes(index) <= 1.2 * serialized
+
+
+class TestIndexPersistence:
+    """Unit tests for saving and loading the index artifact."""
+
+    def test_load_restores_saved_index(self, retrieval_model, image_dir, tmp_path_factory):
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+        expected = retrieval_model.search("a photo", k=3)
+
+        with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=retrieval_model.model), \
+             patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+            restored = MultiModalRetrieval("stub-clip", "cpu")
+
+        assert restored.load_index(index_dir, image_dir) is True
+        assert restored.image_paths == retrieval_model.image_paths
+        assert isinstance(restored.embeddings, np.memmap)
+        assert restored.search("a photo", k=3) == expected
+
+    def test_load_rejects_incompatible_artifacts(self, retrieval_model, image_dir, tmp_path_factory):
+        index_dir = tmp_path_factory.mktemp("index")
+        assert retrieval_model.load_index(index_dir, image_dir) is False
+
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+        retrieval_model.model_name = "another-clip"
+
+        assert retrieval_model.load_index(index_dir, image_dir) is False
+        assert retrieval_model.load_index(index_dir, image_dir / "elsewhere") is False
+
+    def test_compressed_index_reranks_from_mapped_embeddings(self, retrieval_model, image_dir, tmp_path_factory):
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        expected = retrieval_model.search("a photo", k=5)
+        with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=StubCLIPModel()), \
+             patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+            compact = MultiModalRetrieval("stub-clip", "cpu", vector_encoding="sq8")
+        compact.rerank_factor = 2
+
+        compact.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+
+        assert isinstance(compact.embeddings, np.memmap)
+        assert compact.memory_footprint()["embeddings"] == 0
+        results = compact.search("a photo", k=5)
+        assert [url for url, _ in results] == [url for url, _ in expected]
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-6)
+        assert not retrieval_model.load_index(index_dir, image_dir)  # stored as sq8, configured for fp32
+
+    def test_sharded_index_round_trips_and_rebuilds_shards(self, retrieval_model, image_dir, tmp_path_factory):
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        expected = retrieval_model.search("a photo", k=5)
+        with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=StubCLIPModel()), \
+             patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+            sharded = MultiModalRetrieval("stub-clip", "cpu", num_shards=3)
+
+        sharded.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+
+        assert isinstance(sharded.index, ShardedIndex)
+        results = sharded.search("a photo", k=5)
+        assert [url for url, _ in results] == [url for url, _ in expected]
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-6)
+        assert not retrieval_model.load_index(index_dir, image_dir)  # stored as 3 shards, configured for 1
+
+        sharded.rebuild_shard(1, index_dir)
+        assert sharded.search("a photo", k=5) == results
+        with pytest.raises(ValueError):
+            sharded.rebuild_shard(3)
+
+        assert sharded.load_index(index_dir, image_dir, read_only=True) is True
+        assert isinstance(sharded.index, ShardedIndex)
+        assert [url for url, _ in sharded.search("a photo", k=5)] == [url for url, _ in expected]
+
+    def test_worker_maps_artifact_and_follows_builder(self, retrieval_model, image_dir, tmp_path_factory):
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+        expected = retrieval_model.search("a photo", k=3)
+
+        with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=retrieval_model.model), \
+             patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+            worker = MultiModalRetrieval("stub-clip", "cpu")
+
+        assert worker.load_index(index_dir, image_dir, read_only=True) is True
+        assert isinstance(worker.index, MemmapFlatIndex)
+        assert [url for url, _ in worker.search("a photo", k=3)] == [url for url, _ in expected]
+        assert [score for _, score in worker.search("a photo", k=3)] == pytest.approx([score for _, score in expected])
+        with pytest.raises(ValueError):
+            worker.sync_index()
+        assert worker.reload_if_changed(index_dir) is False
+
+        removed_url = expected[0][0]
+        (image_dir / removed_url.rsplit("/", 1)[1]).unlink()
+        time.sleep(0.01)  # Let the manifest mtime advance on coarse-grained filesystems
+        retrieval_model.sync_index(index_dir)
+
+        assert worker.reload_if_changed(index_dir) is True
+        assert worker.num_images == 9
+        assert removed_url not in [url for url, _ in worker.search("a photo", k=9)]
+
+
+class TestIncrementalSync:
+    """Unit tests for incremental index maintenance."""
+
+    def test_sync_without_changes_embeds_nothing(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        calls = retrieval_model.model.image_calls
+
+        diff = retrieval_model.sync_index(num_workers=0)
+
+        assert diff == {"added": 0, "modified": 0, "deleted": 0, "failed": 0, "total": 10}
+        assert retrieval_model.model.image_calls == calls
+
+    def test_sync_applies_added_modified_and_deleted_images(self, retrieval_model, image_dir, tmp_path_factory):
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+
+        Image.new("RGB", (32, 32), color=(255, 0, 0)).save(image_dir / "new.jpg")
+        Image.new("RGB", (48, 48), color=(0, 255, 0)).save(image_dir / "image_1.jpg")
+        (image_dir / "image_2.jpg").unlink()
+        (image_dir / "broken.jpg").write_bytes(b"not an image")
+
+        diff = retrieval_model.sync_index(index_dir=index_dir, num_workers=0)
+
+        assert diff == {"added": 1, "modified": 1, "deleted": 1, "failed": 1, "total": 10}
+        live_paths = {path for path in retrieval_model.image_paths if path is not None}
+        assert str(image_dir / "new.jpg") in live_paths
+        assert str(image_dir / "image_2.jpg") not in live_paths
+        assert all(not url.endswith("image_2.jpg") for url, _ in retrieval_model.search("a photo", k=10))
+
+        # Files that failed once are not retried until they change
+        assert retrieval_model.sync_index(num_workers=0)["failed"] == 0
+
+        # The persisted artifact reflects the update
+        assert retrieval_model.load_index(index_dir, image_dir) is True
+        assert retrieval_model.num_images == 10
+
+    @pytest.mark.parametrize("num_shards", [1, 2])
+    def test_deleting_every_image_leaves_searches_empty(self, retrieval_model, image_dir, tmp_path_factory, num_shards):
+        retrieval_model.num_shards = num_shards
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+        for path in image_dir.glob("*.jpg"):
+            path.unlink()
+
+        diff = retrieval_model.sync_index(index_dir=index_dir, num_workers=0)
+
+        assert diff["deleted"] == 10 and diff["total"] == 0
+        assert retrieval_model.search("red car", k=2) == []
+        assert retrieval_model.search_texts(["red car", "dog"], k=2) == [[], []]
+        assert retrieval_model.search("red car", k=2, collapse_duplicates=True) == []
+        assert retrieval_model.search_hybrid(texts=[("red car", 1.0)], k=2) == []
+
+    @pytest.mark.parametrize("num_shards", [1, 2])
+    def test_repeated_modifications_keep_the_artifact_bounded(
+            self, retrieval_model, image_dir, tmp_path_factory, num_shards
+    ):
+        retrieval_model.num_shards = num_shards
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+
+        for i in range(5):
+            Image.new("RGB", (32 + i, 32), color=(50 * i, 0, 255)).save(image_dir / "image_1.jpg")
+            assert retrieval_model.sync_index(index_dir=index_dir, num_workers=0)["modified"] == 1
+
+            # Removed rows are compacted away on save, and the matrix stays mapped
+            assert np.load(index_dir / "embeddings.npy", mmap_mode="r").shape[0] == 10
+            assert len(retrieval_model.paths) == 10
+            assert isinstance(retrieval_model.embeddings, np.memmap)
+            row = retrieval_model.paths.find(image_dir / "image_1.jpg")
+            query = np.array(retrieval_model.embeddings[row:row + 1])
+            assert retrieval_model._search_vectors(query, 1)[0][0][0].endswith("/image_1.jpg")
+
+        # A sync that grows the mapped file but never saves leaves the artifact loadable
+        Image.new("RGB", (32, 32), color=(0, 0, 0)).save(image_dir / "extra.jpg")
+        retrieval_model.sync_index(num_workers=0)
+        assert np.load(index_dir / "embeddings.npy", mmap_mode="r").shape[0] == 11
+        assert retrieval_model.load_index(index_dir, image_dir) is True
+        assert retrieval_model.num_images == 10
+
+
+class TestIndexFactory:
+    """Unit tests for the configurable FAISS index types."""
+
+    @pytest.fixture
+    def vectors(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((2000, 32)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def test_small_corpora_fall_back_to_flat(self):
+        assert index_description("ivf_flat", 32, 50) == "IDMap2,Flat"
+        assert index_description("ivf_pq", 32, 100).startswith("IDMap2,IVF")
+        with pytest.raises(ValueError):
+            index_description("lsh", 32, 1000)
+
+    @pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "ivf_pq", "hnsw"])
+    def test_index_types_return_ids(self, vectors, index_type, monkeypatch):
+        # Keep PQ training cheap
+        monkeypatch.setattr("backend.src.models.index_factory.PQ_M", 2)
+        vectors = vectors[:400]
+        ids = np.arange(len(vectors), dtype=np.int64) + 1000
+        index = build_faiss_index(index_type, vectors, ids)
+
+        _, found = search_index(index, vectors[:5], 3, nprobe=8, ef_search=32)
+
+        assert found.shape == (5, 3)
+        assert np.all(found >= 1000)
+
+    def test_exhaustive_knobs_match_flat_recall(self, vectors):
+        ids = np.arange(len(vectors), dtype=np.int64)
+        index = build_faiss_index("ivf_flat", vectors, ids)
+        nlist = index_description("ivf_flat", 32, len(vectors)).split(",")[1][3:]
+
+        report = recall_at_k(index, vectors, ids, vectors[:20], 10, nprobe=int(nlist))
+
+        assert report["index_type"] == "ivf_flat"
+        assert report["recall_at_k"] == pytest.approx(1.0)
+
+    def test_compressed_encodings_shrink_storage_and_rerank_recovers_recall(self, vectors, monkeypatch):
+        monkeypatch.setattr("backend.src.models.index_factory.PQ_M", 4)
+        ids = np.arange(len(vectors), dtype=np.int64)
+        sizes = {}
+        for encoding in ("fp32", "fp16", "sq8", "pq"):
+            index = build_faiss_index("flat", vectors, ids, encoding=encoding)
+            assert index_encoding(index) == encoding
+            sizes[encoding] = index_memory_bytes(index)
+
+            plain = recall_at_k(index, vectors, ids, vectors[:50], 10)["recall_at_k"]
+            reranked = recall_at_k(index, vectors, ids, vectors[:50], 10, rerank_factor=10)["recall_at_k"]
+            assert reranked >= plain
+            if encoding != "pq":
+                assert reranked == pytest.approx(1.0)
+
+        assert sizes["fp32"] > sizes["fp16"] > sizes["sq8"] > sizes["pq"]
+        assert index_description("flat", 32, 100, "pq") == "IDMap2,SQ8"  # too few vectors for codebooks
+        assert index_description("hnsw", 32, 1000, "pq") == "IDMap2,HNSW32_PQ4"
+
+    @pytest.mark.parametrize("index_type,encoding", [
+        ("flat", "fp32"), ("flat", "sq8"), ("flat", "pq"), ("ivf_flat", "fp32"), ("hnsw", "fp32")
+    ])
+    def test_id_filter_restricts_results(self, vectors, index_type, encoding, monkeypatch):
+        monkeypatch.setattr("backend.src.models.index_factory.PQ_M", 4)
+        ids = np.arange(len(vectors), dtype=np.int64)
+        index = build_faiss_index(index_type, vectors, ids, encoding=encoding)
+        allowed = np.zeros(len(vectors), dtype=bool)
+        allowed[::50] = True
+
+        _, found = search_index(index, vectors[:5], 10, nprobe=64, id_filter=allowed)
+
+        # Every allowed ID is reachable, so filtered searches return full result lists
+        assert np.all(found >= 0)
+        assert np.all(allowed[found])
+        if encoding == "fp32":
+            assert found[0, 0] == 0
+
+    def test_sharded_search_applies_id_filter(self, vectors):
+        ids = np.arange(len(vectors), dtype=np.int64)
+        sharded = build_sharded_index("flat", vectors, ids, assign_shards([f"{i}.jpg" for i in ids], 3), 3)
+        allowed = ids % 7 == 0
+
+        _, found = search_index(sharded, vectors[:5], 10, id_filter=allowed)
+
+        assert np.all(allowed[found])
+        assert found[0, 0] == 0
+
+    def test_sharded_search_matches_single_index(self, vectors):
+        ids = np.arange(len(vectors), dtype=np.int64)
+        shards = assign_shards([f"dir{i % 7}/image_{i}.jpg" for i in ids], 4)
+        sharded = build_sharded_index("flat", vectors, ids, shards, 4)
+        single = build_faiss_index("flat", vectors, ids)
+
+        scores, found = search_index(sharded, vectors[:20], 10)
+        expected_scores, expected = search_index(single, vectors[:20], 10)
+
+        assert sharded.ntotal == len(vectors)
+        assert np.array_equal(found, expected)
+        assert np.allclose(scores, expected_scores, atol=1e-6)
+        assert set(np.unique(shards).tolist()) == {0, 1, 2, 3}
+
+    def test_duplicate_groups_are_connected_components(self, vectors):
+        rng = np.random.default_rng(1)
+        near = vectors[[0, 0, 1]] + 0.01 * rng.standard_normal((3, 32)).astype(np.float32)
+        near /= np.linalg.norm(near, axis=1, keepdims=True)
+        corpus = np.concatenate([vectors[:100], near])  # rows 100 and 101 copy row 0, row 102 copies row 1
+
+        groups = find_duplicate_groups(corpus, np.arange(103), threshold=0.95, batch_size=16)
+        without_copy = find_duplicate_groups(corpus, np.arange(102), threshold=0.95)
+
+        assert groups[0] == groups[100] == groups[101] != groups[1] == groups[102]
+        assert np.count_nonzero(groups >= 0) == 5 and set(groups[groups >= 0].tolist()) == {0, 1}
+        assert without_copy[102] == without_copy[1] == -1 and np.count_nonzero(without_copy >= 0) == 3
+
+        scores = np.array([[0.9, 0.8, 0.7, 0.6, 0.5]], dtype=np.float32)
+        ids = np.array([[100, 0, 7, 102, -1]])
+        collapsed_scores, collapsed = collapse_duplicates(scores, ids, groups[:101], 3)
+        assert collapsed.tolist() == [[100, 7, 102]]  # 101 and 102 lie past the groups: no duplicates known
+        assert collapsed_scores[0].tolist() == pytest.approx([0.9, 0.7, 0.6])
+        assert collapse_duplicates(scores, ids, groups, 5)[1].tolist() == [[100, 7, 102, -1, -1]]
+
+    def test_shard_assignment_and_merge(self):
+        paths = ["a/1.jpg", "a/2.jpg", "b/1.jpg", "top.jpg"]
+        assert np.array_equal(assign_shards(paths, 3), assign_shards(paths, 3))
+        by_directory = assign_shards(paths, 3, "directory")
+        assert by_directory[0] == by_directory[1]
+        with pytest.raises(ValueError):
+            assign_shards(paths, 3, "random")
+
+        merged_scores, merged_ids = merge_shard_results([
+            (np.array([[0.9, 0.5, -np.inf]], dtype=np.float32), np.array([[1, 2, -1]])),
+            (np.array([[0.8, 0.7, 0.1]], dtype=np.float32), np.array([[3, 4, 5]]))
+        ], 4)
+        assert merged_ids.tolist() == [[1, 3, 4, 2]]
+        assert merged_scores[0].tolist() == pytest.approx([0.9, 0.8, 0.7, 0.5])
+
+    def test_hnsw_sync_rebuilds_only_affected_shards(self, image_dir):
+        with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=StubCLIPModel()), \
+             patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+            model = MultiModalRetrieval("stub-clip", "cpu", index_type="hnsw", num_shards=3)
+        model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        removed = model.paths.find(image_dir / "image_0.jpg")
+        owner = int(model.index.assignment[removed])
+        untouched = [shard for shard in range(3) if shard != owner]
+        before = [model.index.shards[shard] for shard in untouched]
+        (image_dir / "image_0.jpg").unlink()
+
+        assert model.sync_index(num_workers=0)["deleted"] == 1
+        assert model.num_images == 9
+        assert [model.index.shards[shard] for shard in untouched] == before
+        assert all(not url.endswith("image_0.jpg") for url, _ in model.search("a photo", k=9))
+
+    def test_hnsw_sync_rebuilds_instead_of_removing(self, image_dir):
+        with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=StubCLIPModel()), \
+             patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+            model = MultiModalRetrieval("stub-clip", "cpu", index_type="hnsw")
+        model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        (image_dir / "image_0.jpg").unlink()
+
+        assert model.sync_index(num_workers=0)["deleted"] == 1
+        assert model.num_images == 9
+
+
+class TestFilteredSearch:
+    """Integration tests for metadata-filtered search."""
+
+    @pytest.fixture
+    def mixed_dir(self, image_dir):
+        rng = np.random.default_rng(1)
+        (image_dir / "screens").mkdir()
+        for i in range(4):
+            img_array = rng.integers(0, 255, (48, 64, 3), dtype=np.uint8)
+            Image.fromarray(img_array).save(image_dir / "screens" / f"screen_{i}.png")
+        return image_dir
+
+    @pytest.mark.parametrize("scan_rows", [0, 1000])
+    def test_only_matching_images_are_returned(self, retrieval_model, mixed_dir, scan_rows, monkeypatch):
+        monkeypatch.setattr("backend.src.models.retrieval_model.FILTER_SCAN_ROWS", scan_rows)
+        retrieval_model.build_index(ImageDataset(str(mixed_dir)), batch_size=4, num_workers=0)
+
+        pngs = retrieval_model.search("a photo", k=10, search_filter=SearchFilter(formats=("png",)))
+        wide = retrieval_model.search("a photo", k=10, search_filter=SearchFilter(min_width=60))
+        jpegs = retrieval_model.search_texts(
+            ["a photo", "a screenshot"], k=3, search_filter=SearchFilter(directories=("",), formats=("jpeg",))
+        )
+        none = retrieval_model.search("a photo", k=10, search_filter=SearchFilter(directories=("missing",)))
+
+        assert len(pngs) == 4 and all("/images/screens/" in url for url, _ in pngs)
+        assert [url for url, _ in wide] == [url for url, _ in pngs]
+        assert all(len(results) == 3 and all(url.endswith(".jpg") for url, _ in results) for results in jpegs)
+        assert none == []
+        assert retrieval_model.memory_footprint()["attributes"] > 0
+
+    def test_attributes_follow_sync_and_persistence(self, retrieval_model, mixed_dir, tmp_path_factory):
+        retrieval_model.build_index(ImageDataset(str(mixed_dir)), batch_size=4, num_workers=0)
+        Image.new("RGB", (300, 200)).save(mixed_dir / "screens" / "large.png")
+        (mixed_dir / "screens" / "screen_0.png").unlink()
+        retrieval_model.sync_index(num_workers=0)
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.save_index(index_dir)
+        retrieval_model.load_index(index_dir, mixed_dir)
+
+        pngs = retrieval_model.search("a photo", k=10, search_filter=SearchFilter(formats=("png",)))
+        large = retrieval_model.search("a photo", k=10, search_filter=SearchFilter(min_width=200))
+
+        assert len(pngs) == 4 and not any(url.endswith("screen_0.png") for url, _ in pngs)
+        assert [url.rsplit("/", 1)[1] for url, _ in large] == ["large.png"]
+
+
+class TestDuplicateCollapsing:
+    """Integration tests for near-duplicate groups at search time."""
+
+    def test_collapsed_search_keeps_best_member_of_each_group(self, retrieval_model, image_dir, tmp_path_factory):
+        for i in range(3):
+            Image.open(image_dir / "image_0.jpg").save(image_dir / f"copy_{i}.png")
+        index_dir = tmp_path_factory.mktemp("index")
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+        query = np.array(retrieval_model.embeddings[retrieval_model.paths.find(image_dir / "copy_1.png")])
+
+        groups = find_duplicate_groups(retrieval_model.embeddings, retrieval_model.paths.live_ids(), 0.99)
+        save_duplicate_groups(index_dir, retrieval_model.paths, groups, 0.99)
+        assert not retrieval_model.load_index(tmp_path_factory.mktemp("empty"), image_dir)
+        assert retrieval_model.load_index(index_dir, image_dir)
+
+        def top_names(collapse):
+            results = retrieval_model._search_vectors(query.reshape(1, -1), 5, collapse=collapse)[0]
+            return [url.rsplit("/", 1)[1] for url, _ in results]
+
+        assert {"image_0.jpg", "copy_0.png", "copy_1.png", "copy_2.png"} == set(top_names(False)[:4])
+        collapsed = top_names(True)
+        assert len(collapsed) == 5
+        assert len({"image_0.jpg", "copy_0.png", "copy_1.png", "copy_2.png"} & set(collapsed)) == 1
+        assert len(retrieval_model.search("a photo", k=13, collapse_duplicates=True)) == 10
+
+        # Groups are stored by path, so they survive a rebuild that renumbers IDs
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0, index_dir=index_dir)
+        assert np.count_nonzero(retrieval_model.duplicate_groups >= 0) == 4
+
+
+class TestEmbeddingCache:
+    """Unit tests for the query-embedding cache."""
+
+    def test_normalization_merges_trivial_variants(self):
+        assert normalize_query("  Dog\t ") == normalize_query("dog") == "dog"
+        assert normalize_query("Red   CAR") == "red car"
+
+    def test_byte_budget_evicts_least_recently_used(self):
+        vector = np.ones(64, dtype=np.float32)
+        cache = EmbeddingCache("test", max_bytes=2 * (vector.nbytes + 200))
+        cache.put("a", vector)
+        cache.put("b", vector)
+        cache.get("a")
+        cache.put("c", vector)
+
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.stats()["evictions"] == 1
+
+    def test_entries_expire(self, monkeypatch):
+        cache = EmbeddingCache("test", ttl=10)
+        cache.put("a", np.ones(4, dtype=np.float32))
+        now = time.monotonic()
+        monkeypatch.setattr("backend.src.models.embedding_cache.time.monotonic", lambda: now + 11)
+
+        assert cache.get("a") is None
+
+    def test_sqlite_store_is_shared_between_caches(self, tmp_path):
+        writer = EmbeddingCache("test", store=SQLiteEmbeddingStore(tmp_path / "cache.sqlite", 1 << 20))
+        reader = EmbeddingCache("test", store=SQLiteEmbeddingStore(tmp_path / "cache.sqlite", 1 << 20))
+        writer.put("Dog", np.arange(4, dtype=np.float32))
+
+        assert np.array_equal(reader.get("dog "), np.arange(4, dtype=np.float32).reshape(1, -1))
+        assert reader.stats()["shared_hits"] == 1
+        assert EmbeddingCache("other-model", store=reader.store).get("dog") is None
+
+    def test_shared_entries_keep_their_expiry_in_the_local_tier(self, tmp_path, monkeypatch):
+        writer = EmbeddingCache("test", ttl=10, store=SQLiteEmbeddingStore(tmp_path / "cache.sqlite", 1 << 20))
+        reader = EmbeddingCache("test", ttl=10, store=SQLiteEmbeddingStore(tmp_path / "cache.sqlite", 1 << 20))
+        writer.put("dog", np.arange(4, dtype=np.float32))
+        wall, now = time.time(), time.monotonic()
+
+        monkeypatch.setattr("backend.src.models.embedding_cache.time.time", lambda: wall + 8)
+        assert reader.get("dog") is not None
+
+        # The copy expires with the writer's entry, not 10 seconds after it was read
+        monkeypatch.setattr("backend.src.models.embedding_cache.time.time", lambda: wall + 11)
+        monkeypatch.setattr("backend.src.models.embedding_cache.time.monotonic", lambda: now + 3)
+        assert reader.get("dog") is None
+        assert reader.stats()["hits"] == 0
+
+    def test_model_encodes_each_normalized_query_once(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        with patch.object(retrieval_model, "_encode_texts", wraps=retrieval_model._encode_texts) as encode:
+            retrieval_model.search("Dog", k=3)
+            retrieval_model.search("dog ", k=3)
+            retrieval_model.search_texts(["DOG", "cat"], k=3)
+
+        assert [call.args[0] for call in encode.call_args_list] == [["dog"], ["cat"]]
+        assert retrieval_model.query_cache.stats()["hits"] == 2
+
+
+class TestImageSearch:
+    """Unit tests for query-by-example search."""
+
+    def test_indexed_image_reuses_stored_embedding(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        calls = retrieval_model.model.image_calls
+
+        results = retrieval_model.search_by_image_id("image_4.jpg", k=3)
+
+        assert retrieval_model.model.image_calls == calls
+        assert len(results) == 3
+        assert all(not url.endswith("/image_4.jpg") for url, _ in results)
+        with pytest.raises(KeyError):
+            retrieval_model.search_by_image_id("../image_4.jpg", k=3)
+
+    def test_uploaded_copy_finds_the_original(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+
+        pixel_values = decode_image((image_dir / "image_7.jpg").read_bytes())
+        results = retrieval_model.search_by_image(pixel_values, k=3)
+
+        assert results[0][0].endswith("/image_7.jpg")
+        assert results[0][1] == pytest.approx(1.0, abs=1e-4)
+
+    def test_hybrid_query_searches_the_weighted_combination(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        plain = retrieval_model.search("a photo", k=5)
+        scaled = retrieval_model.search_hybrid(texts=[("a photo", 2.0)], k=5)
+        assert [url for url, _ in scaled] == [url for url, _ in plain]
+        assert [score for _, score in scaled] == pytest.approx([score for _, score in plain], abs=1e-6)
+
+        text = retrieval_model._process_query(["a photo"])[0]
+        row = retrieval_model.paths.find(image_dir / "image_4.jpg")
+        query = text - 0.5 * retrieval_model.embeddings[row]
+        scores = retrieval_model.embeddings @ (query / np.linalg.norm(query))
+        expected = [idx for idx in np.argsort(-scores) if idx != row][:3]
+
+        results = retrieval_model.search_hybrid(texts=[("a photo", 1.0)], image_ids=[("image_4.jpg", -0.5)], k=3)
+
+        assert [url for url, _ in results] == retrieval_model.paths.urls(expected)
+        assert [score for _, score in results] == pytest.approx(((scores[expected] + 1) / 2).tolist(), abs=1e-5)
+
+    def test_hybrid_query_rejects_degenerate_combinations(self, retrieval_model, image_dir):
+        retrieval_model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        with pytest.raises(ValueError):
+            retrieval_model.search_hybrid(texts=[("people", -1.0)])
+        with pytest.raises(ValueError):
+            retrieval_model.search_hybrid(texts=[("a photo", 1.0), ("a photo", -1.0)])
+        with pytest.raises(KeyError):
+            retrieval_model.search_hybrid(image_ids=[("missing.jpg", 1.0)])
+
+        pixel_values = decode_image((image_dir / "image_7.jpg").read_bytes())
+        results = retrieval_model.search_hybrid(images=[(pixel_values, 1.0)], k=1)
+        assert results[0][0].endswith("/image_7.jpg")
+
+    def test_decode_rejects_non_images(self):
+        with pytest.raises(ValueError):
+            decode_image(b"not an image")
+
+
+class TestInferenceEngines:
+    """Unit tests for the pluggable inference engines."""
+
+    @staticmethod
+    def make_model(engine):
+        with patch("backend.src.models.retrieval_model.CLIPModel.from_pretrained", return_value=StubCLIPModel()), \
+             patch("backend.src.models.retrieval_model.CLIPProcessor.from_pretrained", return_value=StubCLIPProcessor()):
+            return MultiModalRetrieval("stub-clip", "cpu", inference_engine=engine)
+
+    def test_torchscript_engine_matches_eager_search(self, retrieval_model, image_dir):
+        traced = self.make_model("torchscript")
+        assert traced.engine.name == "torchscript"
+
+        for model in (retrieval_model, traced):
+            model.build_index(ImageDataset(str(image_dir)), batch_size=4, num_workers=0)
+        expected = retrieval_model.search("a photo", k=5)
+        results = traced.search("a photo", k=5)
+
+        assert [url for url, _ in results] == [url for url, _ in expected]
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+    def test_int8_engine_stays_close_to_fp32(self):
+        torch.manual_seed(0)
+        model = torch.nn.Module()
+        model.text = torch.nn.Sequential(torch.nn.Embedding(256, 64), torch.nn.Linear(64, 32))
+        model.vision = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(3 * 8 * 8, 32))
+        model.get_text_features = lambda input_ids, attention_mask: model.text(input_ids).mean(dim=1)
+        model.get_image_features = lambda pixel_values: model.vision(pixel_values)
+
+        agreement = engine_agreement(
+            TorchEngine(model),
+            DynamicInt8Engine(model),
+            {"input_ids": torch.randint(0, 256, (4, 10)), "attention_mask": torch.ones(4, 10, dtype=torch.long)},
+            torch.randn(4, 3, 8, 8)
+        )
+
+        assert agreement["text"] > 0.99
+        assert agreement["image"] > 0.99
+        assert isinstance(model.text[1], torch.nn.Linear)  # the fp32 model is left untouched
+
+    def test_unusable_or_inaccurate_engines_fall_back_to_eager(self, monkeypatch):
+        assert self.make_model("tensorrt").engine.name == "eager"
+
+        monkeypatch.setattr("backend.src.models.retrieval_model.ENGINE_MIN_COSINE", 1.01)
+        model = self.make_model("torchscript")
+
+        assert model.engine.name == "eager"
+        assert model.check_engine_accuracy() == {"text": pytest.approx(1.0), "image": pytest.approx(1.0)}
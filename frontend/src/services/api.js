@@ -9,11 +9,12 @@ const api = axios.create({
   },
 });
 
-export const searchImages = async (query, topK = 5) => {
+export const searchImages = async (query, topK = 5, size = 256) => {
   try {
     const response = await api.post('/search', {
       query,
       top_k: topK,
+      size,
     });
     return response.data;
   } catch (error) {
@@ -67,6 +67,22 @@ class WebSocketClient {
         }
     }
 
+    /**
+     * Start a search; earlier searches still in flight are cancelled by the server.
+     * Replies ({type: 'results' | 'cancelled' | 'error', id, ...}) reach the message handlers.
+     * @returns {string} Correlation id of the search
+     */
+    search(query, { topK = 5, pageSize = 5, size = 256 } = {}) {
+        this.requestCounter = (this.requestCounter || 0) + 1;
+        const id = `q${Date.now()}-${this.requestCounter}`;
+        this.send({ type: 'search', id, query, top_k: topK, page_size: pageSize, size });
+        return id;
+    }
+
+    cancel(id) {
+        this.send({ type: 'cancel', id });
+    }
+
     addMessageHandler(handler) {
         this.messageHandlers.add(handler);
     }